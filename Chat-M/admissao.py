@@ -0,0 +1,307 @@
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import time
+
+import metricas
+from armazenamento import arquivo_privado
+
+# -----------------------------------------------------------------------------
+# Controle de admissão: limite por cliente e teto de concorrência no banco
+# -----------------------------------------------------------------------------
+# require_api_key só conferia o header: uma integração com defeito podia
+# inundar /chat e /fornecedores e tomar o SQLite de todos os outros clientes.
+# Agora toda rota protegida passa antes por aqui:
+#
+# - Balde de fichas por cliente: cada requisição gasta uma ficha; o balde
+#   enche TAXA fichas por segundo até RAJADA. Sem ficha, a resposta é 429 na
+#   hora, com Retry-After (segundos até a próxima ficha). O cliente é a
+#   X-API-KEY (API_KEY aceita várias chaves, uma por integração) ou, sem
+#   chave, o IP de origem. Atrás de proxy reverso o IP de origem é o do
+#   proxy: com ADMISSAO_PROXIES=n o IP vem do X-Forwarded-For, n saltos a
+#   partir da direita (só os proxies confiáveis escrevem ali).
+# - Teto de concorrência nas rotas que tocam o banco (ROTAS_BANCO): acima do
+#   teto, a resposta é 503 com Retry-After em vez de entrar na fila.
+#   MAX_CONCORRENCIA é o total da instância, dividido entre os workers
+#   (WEB_CONCURRENCY, que o gunicorn.conf.py preenche).
+#
+# Os baldes ficam num armazém compartilhado entre os workers do gunicorn,
+# como as sessões (sessoes.py): um arquivo SQLite local, atualizado com um
+# único UPSERT atômico por requisição. A espera pelo arquivo travado por
+# outro worker é curta (ESPERA_MS): passado o prazo, a resposta é 503 na
+# hora, como no teto de concorrência. Qualquer outra falha do armazém deixa
+# a requisição passar (o limite nunca derruba o serviço) e conta como
+# resultado "erro".
+#
+# Desligado por padrão: ligue com ADMISSAO=1 depois de conferir as chaves e o
+# ADMISSAO_PROXIES do ambiente; sem isso todos os clientes sem chave atrás do
+# mesmo proxy dividiriam um balde só.
+#
+# Uso por cliente em /metrics: admissao_total{cliente, rota, resultado}, com
+# resultado aceita | limitada | sobrecarga | erro. O rótulo do cliente é um
+# resumo da chave ("k-" + 12 hex do sha256), nunca a chave; clientes sem
+# chave aparecem juntos como "ip", para não explodir a cardinalidade.
+#
+#   ADMISSAO                   "1" liga (padrão: desligada)
+#   ADMISSAO_ARMAZEM           sqlite (padrão) ou memoria (um único worker)
+#   ADMISSAO_DB                arquivo do armazém sqlite (padrão: chatbot_admissao.db
+#                              na pasta privada da instância, ver armazenamento.arquivo_privado)
+#   ADMISSAO_TAXA              fichas por segundo por cliente (padrão: 100)
+#   ADMISSAO_RAJADA            capacidade do balde (padrão: 200)
+#   ADMISSAO_MAX_CONCORRENCIA  requisições em andamento na instância nas
+#                              rotas de banco (padrão: 64)
+#   ADMISSAO_PROXIES           proxies confiáveis na frente da aplicação que
+#                              acrescentam ao X-Forwarded-For (padrão: 0, ignora o header)
+#   ADMISSAO_ESPERA_MS         espera máxima pelo armazém sqlite travado (padrão: 50)
+
+HABILITADA = os.environ.get("ADMISSAO", "0") == "1"
+TAXA = float(os.environ.get("ADMISSAO_TAXA", 100))
+RAJADA = float(os.environ.get("ADMISSAO_RAJADA", 200))
+WORKERS = max(1, int(os.environ.get("WEB_CONCURRENCY") or 1))
+MAX_CONCORRENCIA = max(1, int(os.environ.get("ADMISSAO_MAX_CONCORRENCIA", 64)) // WORKERS)
+PROXIES = int(os.environ.get("ADMISSAO_PROXIES", 0))
+ESPERA_MS = float(os.environ.get("ADMISSAO_ESPERA_MS", 50))
+
+ROTAS_BANCO = frozenset({
+    "/chat", "/fornecedores", "/fornecedores/batch", "/fornecedores/cesta",
+    "/precos", "/precos/mudancas",
+})
+
+LIMITADA = {"error": "too many requests"}
+SOBRECARGA = {"error": "server busy"}
+
+# Retry-After de um 503: a vaga costuma abrir em bem menos de um segundo.
+ESPERA_SOBRECARGA_S = 1
+
+
+def endereco_cliente(endereco, encaminhado=None, proxies=None):
+    """
+    IP do cliente: o n-ésimo endereço do X-Forwarded-For a partir da direita
+    com `proxies` = n confiáveis na frente (padrão: PROXIES); senão o IP da conexão.
+    """
+    proxies = PROXIES if proxies is None else proxies
+    if proxies <= 0 or not encaminhado:
+        return endereco
+    saltos = [parte.strip() for parte in encaminhado.split(",")]
+    if len(saltos) < proxies or not saltos[-proxies]:
+        return endereco  # o header não passou por todos os proxies esperados
+    return saltos[-proxies]
+
+
+def identificar(api_key, endereco):
+    """Chave do balde: resumo da X-API-KEY ou, sem chave, o IP de origem."""
+    if api_key:
+        return "k-" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+    return "ip-" + (endereco or "desconhecido")
+
+
+# --- armazéns dos baldes -------------------------------------------------------------
+# consumir() devolve (aceita, fichas restantes) e só gasta a ficha se aceitar.
+class ArmazemOcupado(Exception):
+    """O armazém ficou travado por outro worker além da espera permitida."""
+
+
+class BaldesMemoria:
+    """Baldes no próprio processo (um único worker)."""
+
+    LIMPEZA_A_CADA = 1000
+    BLOQUEANTE = False  # consumir() não faz I/O
+
+    def __init__(self):
+        self._baldes = {}  # cliente -> [fichas, atualizado_em]
+        self._lock = threading.Lock()
+        self._consumos = 0
+
+    def consumir(self, cliente, taxa, rajada, agora=None):
+        agora = time.time() if agora is None else agora
+        with self._lock:
+            balde = self._baldes.get(cliente)
+            if balde is None:
+                balde = self._baldes[cliente] = [rajada, agora]
+            fichas = min(rajada, balde[0] + max(0.0, agora - balde[1]) * taxa)
+            aceita = fichas >= 1
+            balde[0] = fichas - 1 if aceita else fichas
+            balde[1] = max(balde[1], agora)
+            self._consumos += 1
+            if self._consumos % self.LIMPEZA_A_CADA == 0:
+                self._limpar(agora, rajada / taxa if taxa > 0 else math.inf)
+            return aceita, balde[0]
+
+    def _limpar(self, agora, ocioso_s):
+        # balde parado por mais que o tempo de encher é igual a um balde novo
+        for cliente in [c for c, (_, t) in self._baldes.items() if agora - t > ocioso_s]:
+            del self._baldes[cliente]
+
+    def __len__(self):
+        return len(self._baldes)
+
+
+class BaldesSQLite:
+    """Baldes num arquivo SQLite compartilhado pelos workers."""
+
+    LIMPEZA_A_CADA = 1000
+    BLOQUEANTE = True
+
+    # Todas as expressões do SET leem a linha antiga: 'aceita' e 'fichas'
+    # partem do mesmo saldo recarregado, sem corrida entre workers.
+    SQL_CONSUMIR = """
+    INSERT INTO baldes (cliente, fichas, atualizado_em, aceita)
+    VALUES (:cliente, :rajada - 1, :agora, :rajada >= 1)
+    ON CONFLICT(cliente) DO UPDATE SET
+        fichas = MIN(:rajada, fichas + MAX(0, :agora - atualizado_em) * :taxa)
+                 - (MIN(:rajada, fichas + MAX(0, :agora - atualizado_em) * :taxa) >= 1),
+        aceita = MIN(:rajada, fichas + MAX(0, :agora - atualizado_em) * :taxa) >= 1,
+        atualizado_em = MAX(atualizado_em, :agora)
+    RETURNING aceita, fichas
+    """
+
+    def __init__(self, caminho, espera_ms=ESPERA_MS):
+        self.caminho = caminho
+        self.espera_s = espera_ms / 1000
+        self._local = threading.local()
+        # Uma thread por vez no arquivo: as outras do mesmo worker esperam aqui,
+        # sem disputar a trava do SQLite com quem já a tem e espera o GIL.
+        self._lock = threading.Lock()
+        self._consumos = 0
+        conn = self._conexao()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS baldes ("
+            " cliente TEXT PRIMARY KEY, fichas REAL NOT NULL,"
+            " atualizado_em REAL NOT NULL, aceita INTEGER NOT NULL)"
+        )
+        conn.commit()
+
+    def _conexao(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            # autocommit: o UPSERT é a própria transação
+            conn = sqlite3.connect(self.caminho, timeout=self.espera_s, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def consumir(self, cliente, taxa, rajada, agora=None):
+        agora = time.time() if agora is None else agora
+        conn = self._conexao()
+        if not self._lock.acquire(timeout=self.espera_s):
+            raise ArmazemOcupado(self.caminho)
+        try:
+            (aceita, fichas), = conn.execute(self.SQL_CONSUMIR, {
+                "cliente": cliente, "taxa": taxa, "rajada": rajada, "agora": agora,
+            }).fetchall()  # fetchall termina o comando e faz o commit
+            self._consumos += 1
+            if self._consumos % self.LIMPEZA_A_CADA == 0 and taxa > 0:
+                conn.execute("DELETE FROM baldes WHERE atualizado_em < ?", (agora - rajada / taxa,))
+        except sqlite3.OperationalError as exc:
+            if "locked" in str(exc):  # SQLITE_BUSY/SQLITE_LOCKED além de espera_s
+                raise ArmazemOcupado(self.caminho) from exc
+            raise
+        finally:
+            self._lock.release()
+        return bool(aceita), fichas
+
+    def __len__(self):
+        return self._conexao().execute("SELECT COUNT(*) FROM baldes").fetchone()[0]
+
+
+def criar_baldes_do_ambiente():
+    backend = (os.environ.get("ADMISSAO_ARMAZEM") or "sqlite").strip().lower()
+    if backend == "memoria":
+        return BaldesMemoria()
+    if backend == "sqlite":
+        caminho = os.environ.get("ADMISSAO_DB") or arquivo_privado("chatbot_admissao.db")
+        return BaldesSQLite(caminho)
+    raise ValueError(f"ADMISSAO_ARMAZEM desconhecido: {backend!r}")
+
+
+# --- admissão ------------------------------------------------------------------------
+class Admissao:
+    """Baldes por cliente + vagas das rotas de banco deste worker."""
+
+    def __init__(self, baldes, taxa=TAXA, rajada=RAJADA, max_concorrencia=MAX_CONCORRENCIA):
+        self.baldes = baldes
+        self.taxa = taxa
+        self.rajada = rajada
+        self.max_concorrencia = max_concorrencia
+        self.em_andamento = 0
+        self._lock = threading.Lock()
+
+    def _espera_ficha(self, fichas):
+        if self.taxa <= 0:
+            return 60
+        return max(1, math.ceil((1 - fichas) / self.taxa))
+
+    def _ocupar_vaga(self):
+        with self._lock:
+            if self.em_andamento >= self.max_concorrencia:
+                return False
+            self.em_andamento += 1
+            return True
+
+    def admitir(self, api_key, endereco, rota):
+        """
+        None se a requisição pode seguir; senão (payload, status, retry_after).
+        Nas rotas de ROTAS_BANCO, quem segue ocupa uma vaga: chame
+        liberar(rota) quando a resposta terminar.
+        """
+        cliente = identificar(api_key, endereco)
+        rotulo = cliente if api_key else "ip"
+        try:
+            aceita, fichas = self.baldes.consumir(cliente, self.taxa, self.rajada)
+        except ArmazemOcupado:
+            return self._sobrecarga(rotulo, rota)
+        except sqlite3.Error:
+            aceita, fichas, resultado = True, None, "erro"
+        else:
+            resultado = "aceita"
+        if not aceita:
+            metricas.incrementar("admissao_total", cliente=rotulo, rota=rota, resultado="limitada")
+            espera = self._espera_ficha(fichas)
+            return dict(LIMITADA, retry_after=espera), 429, espera
+        if rota in ROTAS_BANCO and not self._ocupar_vaga():
+            return self._sobrecarga(rotulo, rota)
+        metricas.incrementar("admissao_total", cliente=rotulo, rota=rota, resultado=resultado)
+        return None
+
+    @staticmethod
+    def _sobrecarga(rotulo, rota):
+        metricas.incrementar("admissao_total", cliente=rotulo, rota=rota, resultado="sobrecarga")
+        return dict(SOBRECARGA, retry_after=ESPERA_SOBRECARGA_S), 503, ESPERA_SOBRECARGA_S
+
+    def liberar(self, rota):
+        if rota in ROTAS_BANCO:
+            with self._lock:
+                self.em_andamento -= 1
+
+    def estatisticas(self):
+        return {
+            "em_andamento": self.em_andamento,
+            "max_concorrencia": self.max_concorrencia,
+            "taxa": self.taxa,
+            "rajada": self.rajada,
+        }
+
+
+_admissao = None
+_admissao_lock = threading.Lock()
+
+
+def obter_admissao():
+    """Admissão do processo (None sem ADMISSAO=1)."""
+    global _admissao
+    if _admissao is None and HABILITADA:
+        with _admissao_lock:
+            if _admissao is None:
+                _admissao = Admissao(criar_baldes_do_ambiente())
+    return _admissao
+
+
+def configurar_admissao(admissao):
+    """Substitui a admissão padrão (útil para scripts e benchmarks)."""
+    global _admissao
+    _admissao = admissao
+    return admissao
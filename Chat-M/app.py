@@ -1,15 +1,17 @@
 import os
+import time
 from functools import wraps
 
-from flask import Flask, request, jsonify, render_template, session
+from flask import (Flask, Response, g, request, jsonify, make_response, render_template, session,
+                   stream_with_context)
 
-from bot_logica import (
-    processar_mensagem_chatbot,
-    conectar_db,
-    listar_categorias,
-    listar_materiais_por_categoria,
-    consultar_fornecedores,
-)
+import aquecimento
+import cache_respostas
+import catalogo_mmap
+import metricas
+import servicos
+from servicos import API_KEY, LIMITE_MAXIMO
+from sessoes import novo_id_sessao, obter_armazem
 
 # -----------------------------------------------------------------------------
 # Configuração básica do Flask
@@ -22,21 +24,91 @@ app.secret_key = os.environ.get(
     "dev-only-secret-change-me"  # fallback para ambiente local
 )
 
-# API_KEY opcional (para proteger os endpoints que o Verdi chamará)
-API_KEY = os.environ.get("API_KEY", "").strip()
+# API_KEY e LIMITE_MAXIMO vêm de servicos.py (compartilhados com asgi.py)
+
+# Snapshot binário do catálogo (SNAPSHOT_PATH): aberto e validado aqui, na
+# subida do worker; um arquivo inválido impede o worker de subir.
+catalogo_mmap.ativar_do_ambiente()
+
+# Aquecimento (AQUECIMENTO): páginas da base, catálogo, índices e uma conversa
+# sintética, em segundo plano; /health/ready só libera tráfego depois dele.
+aquecimento.iniciar_do_ambiente()
 
 
 def require_api_key(f):
-    """Decorator simples para exigir X-API-KEY quando API_KEY estiver configurada."""
+    """
+    Exige X-API-KEY quando API_KEY estiver configurada e passa a requisição
+    pelo controle de admissão (admissao.py): 429/503 com Retry-After na hora,
+    sem enfileirar, quando o cliente ou o worker estão no limite.
+    """
     @wraps(f)
     def decorated(*args, **kwargs):
-        if API_KEY:
-            if request.headers.get("X-API-KEY") != API_KEY:
-                return jsonify({"error": "unauthorized"}), 401
-        return f(*args, **kwargs)
+        api_key = request.headers.get("X-API-KEY")
+        if not servicos.api_key_valida(api_key):
+            payload, status = servicos.NAO_AUTORIZADO
+            return jsonify(payload), status
+        rota = request.url_rule.rule
+        recusa = servicos.admitir(api_key, request.remote_addr, rota,
+                                  request.headers.get("X-Forwarded-For"))
+        if recusa is not None:
+            payload, status, espera = recusa
+            return jsonify(payload), status, {"Retry-After": str(espera)}
+        try:
+            resposta = make_response(f(*args, **kwargs))
+        except BaseException:
+            servicos.liberar(rota)
+            raise
+        if resposta.is_streamed:  # a vaga só volta quando o corpo terminar de sair
+            resposta.call_on_close(lambda: servicos.liberar(rota))
+        else:
+            servicos.liberar(rota)
+        return resposta
     return decorated
 
 
+def _responder(resultado):
+    payload, status = resultado
+    return jsonify(payload), status
+
+
+def _responder_com_cache(rota, produzir, versao=None):
+    """Rotas de leitura do catálogo: corpo pré-serializado, ETag e 304."""
+    status, corpo, headers = cache_respostas.responder(
+        rota, request.args, produzir, servicos.serializar_json,
+        publico=not API_KEY,
+        if_none_match=request.headers.get("If-None-Match"),
+        if_modified_since=request.headers.get("If-Modified-Since"),
+        versao=versao,
+    )
+    return Response(corpo, status=status, headers=headers, mimetype="application/json")
+
+
+# -----------------------------------------------------------------------------
+# Métricas por requisição (ver metricas.py)
+# -----------------------------------------------------------------------------
+@app.before_request
+def _iniciar_medicao():
+    g.inicio_requisicao = time.perf_counter()
+    if metricas.perfil_solicitado(request.headers.get("X-Profile")):
+        g.perfil = metricas.AmostradorPerfil().iniciar()
+
+
+@app.after_request
+def _registrar_medicao(response):
+    inicio = g.pop("inicio_requisicao", None)
+    if inicio is not None:
+        # rota pelo padrão registrado (não pelo caminho), para não explodir a cardinalidade
+        rota = request.url_rule.rule if request.url_rule is not None else "desconhecida"
+        metricas.observar("http_requisicoes_segundos", time.perf_counter() - inicio,
+                          rota=rota, metodo=request.method, status=response.status_code)
+    perfil = g.pop("perfil", None)
+    if perfil is not None:
+        perfil.parar()
+        response.headers["X-Profile-Id"] = metricas.guardar_perfil(
+            perfil, f"{request.method} {request.path}")
+    return response
+
+
 # -----------------------------------------------------------------------------
 # Rotas utilitárias / UI (opcional)
 # -----------------------------------------------------------------------------
@@ -47,8 +119,11 @@ def index():
     Se você não tiver templates, pode remover esta rota sem problemas.
     """
     # se o chat finalizou, limpa estado para não "travar" na próxima visita
-    if session.get("chat_state", {}).get("stage") == "fim":
-        session.pop("chat_state", None)
+    sid = session.get("sid")
+    if sid:
+        estado = obter_armazem().carregar(sid)
+        if estado is not None and estado.stage == "fim":
+            obter_armazem().remover(sid)
     # Se não existir template, comente a linha abaixo e retorne algo simples:
     # return "MeliBuy API online"
     return render_template("index.html")
@@ -56,8 +131,43 @@ def index():
 
 @app.route("/health")
 def health():
-    """Healthcheck para liveness/readiness do Fury."""
-    return jsonify({"status": "ok"}), 200
+    """Healthcheck para liveness/readiness do Fury (inclui estado do pool do SQLite)."""
+    return _responder(servicos.health())
+
+
+@app.route("/health/live")
+def health_live():
+    """Liveness: o processo responde (não olha banco nem aquecimento)."""
+    return _responder(servicos.vivo())
+
+
+@app.route("/health/ready")
+def health_ready():
+    """
+    Readiness: 503 enquanto o worker aquece (com o progresso de cada etapa e
+    o tempo gasto) e 200 quando a primeira requisição já sai quente.
+    """
+    return _responder(servicos.pronto())
+
+
+@app.route("/metrics")
+def metrics():
+    """Métricas do processo no formato texto do Prometheus."""
+    return Response(servicos.metricas_prometheus(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/metrics/perfis/<perfil_id>")
+@require_api_key
+def perfil(perfil_id):
+    """
+    Perfil por amostragem de uma requisição feita com o header "X-Profile: 1"
+    (id no header X-Profile-Id da resposta). Formato collapsed: uma pilha por
+    linha seguida do número de amostras.
+    """
+    texto = metricas.obter_perfil(perfil_id)
+    if texto is None:
+        return jsonify({"error": "perfil não encontrado"}), 404
+    return Response(texto, mimetype="text/plain")
 
 
 # -----------------------------------------------------------------------------
@@ -71,13 +181,7 @@ def categorias():
     Resposta:
       { "categorias": ["elétricos", "ferramentas", ...] }
     """
-    conn = conectar_db()
-    cur = conn.cursor()
-    try:
-        cats = listar_categorias(cur)
-        return jsonify({"categorias": cats})
-    finally:
-        conn.close()
+    return _responder_com_cache("categorias", servicos.categorias)
 
 
 @app.route("/materiais", methods=["GET"])
@@ -87,30 +191,36 @@ def materiais():
     Retorna materiais de uma categoria.
     Parâmetros:
       - categoria (querystring)
+      - limite    (querystring, opcional) -> paginação, 1..MATERIAIS_PAGINA_MAX
+      - cursor    (querystring, opcional) -> "proximo"/"anterior" da página anterior
     Resposta:
       { "materiais": ["cabo 2.5mm", "tomada 10A", ...] }
+      paginada: { "materiais": [...], "proximo": "p1f.9c2e...", "anterior": null }
+    Com ?formato=ndjson (ou Accept: application/x-ndjson) a resposta é NDJSON,
+    uma linha { "material": "..." } por insumo. Categorias muito grandes sem
+    paginação são enviadas aos pedaços (mesmo JSON, sem cache).
     """
-    categoria = (request.args.get("categoria") or "").strip()
-    if not categoria:
-        return jsonify({"error": "parametro 'categoria' é obrigatório"}), 400
-
-    conn = conectar_db()
-    cur = conn.cursor()
-    try:
-        mats = listar_materiais_por_categoria(cur, categoria)
-        return jsonify({"materiais": mats})
-    finally:
-        conn.close()
+    modo = servicos.modo_materiais(request.args, request.headers.get("Accept"))
+    if modo is not None:
+        payload, status = servicos.materiais_streaming(request.args, modo)
+        if status != 200:
+            return jsonify(payload), status
+        mimetype = "application/x-ndjson" if modo == "ndjson" else "application/json"
+        return Response(stream_with_context(payload), mimetype=mimetype)
+    return _responder_com_cache("materiais", lambda: servicos.materiais(request.args))
 
 
 @app.route("/fornecedores", methods=["GET"])
 @require_api_key
 def fornecedores():
     """
-    Retorna top 3 fornecedores mais baratos para (material, estado).
+    Retorna top N (padrão 3) fornecedores mais baratos para (material, estado).
     Parâmetros:
       - material (querystring)
       - estado  (querystring)  -> use nomes/UF esperados pela base
+      - n       (querystring, opcional) -> 1..LIMITE_MAXIMO
+      - criterio (querystring, opcional) -> preco | preco_frete | prazo
+      - raio_km  (querystring, opcional) -> inclui estados vizinhos até essa distância
     Resposta:
       {
         "resultados": [
@@ -125,35 +235,127 @@ def fornecedores():
           ...
         ]
       }
+    Com 'criterio' ou 'raio_km' o ranking é o de ranking.py: cada resultado
+    ganha "distancia_km", "prazo_dias" e "pontuacao" (menor é melhor).
+    """
+    return _responder_com_cache("fornecedores", lambda: servicos.fornecedores(request.args),
+                                versao=servicos.versao_fornecedores(request.args))
+
+
+@app.route("/cache/stats", methods=["GET"])
+@require_api_key
+def cache_stats():
+    """Contadores do cache de respostas (hits, misses, bytes, ...)."""
+    return jsonify(cache_respostas.cache.estatisticas())
+
+
+@app.route("/fornecedores/batch", methods=["POST"])
+@require_api_key
+def fornecedores_batch():
+    """
+    Cotação de vários pares (material, estado) numa única chamada.
+    Entrada:
+      {
+        "n": 3,                      -> opcional, top-N padrão do lote
+        "itens": [
+          { "material": "...", "estado": "...", "n": 5, "quantidade": 10 },
+          ...
+        ]
+      }
+    Resposta:
+      {
+        "resultados": [
+          { "material": "...", "estado": "...", "quantidade": 10, "resultados": [ ... ] },
+          ...
+        ],
+        "totais_por_fornecedor": [
+          { "fornecedor": "...", "estado": "...", "codigo_fornecedor": "...",
+            "itens_atendidos": 2, "custo_total": 1234.5 },
+          ...
+        ]
+      }
+    Com ?formato=ndjson (ou Accept: application/x-ndjson) a resposta é NDJSON:
+    uma linha por item e a última com "totais_por_fornecedor".
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "corpo JSON deve ser um objeto"}), 400
+    streaming = servicos.quer_ndjson(request.args.get("formato"), request.headers.get("Accept"))
+    payload, status = servicos.fornecedores_lote(data, streaming=streaming)
+    if streaming and status == 200:
+        linhas = (servicos.serializar_json(linha) for linha in payload)
+        return Response(stream_with_context(linhas), mimetype="application/x-ndjson")
+    return jsonify(payload), status
+
+
+@app.route("/fornecedores/cesta", methods=["POST"])
+@require_api_key
+def fornecedores_cesta():
     """
-    material = (request.args.get("material") or "").strip()
-    estado = (request.args.get("estado") or "").strip()
-
-    if not material or not estado:
-        return jsonify({"error": "parametros 'material' e 'estado' são obrigatórios"}), 400
-
-    conn = conectar_db()
-    cur = conn.cursor()
-    try:
-        rows = consultar_fornecedores(cur, material, estado)
-        resultados = [
-            {
-                "fornecedor": r[0],
-                "estado": r[1],
-                "codigo_fornecedor": r[2],
-                "material": r[3],
-                "codigo_material": r[4],
-                "preco": float(r[5]),
-            }
-            for r in rows
+    Melhores fornecedores para uma cesta de materiais.
+    Entrada:
+      {
+        "estado": "...",             -> onde a cesta será entregue
+        "itens": [ { "material": "...", "quantidade": 10 }, ... ],
+        "k": 3,                      -> opcional, quantos fornecedores
+        "criterio": "preco_frete",   -> opcional, preco | preco_frete | prazo
+        "raio_km": 800               -> opcional, inclui estados vizinhos
+      }
+    Resposta:
+      {
+        "estado": "...", "criterio": "...", "raio_km": 800.0, "itens": 2,
+        "fornecedores": [
+          { "fornecedor": "...", "estado": "...", "codigo_fornecedor": "...",
+            "itens_atendidos": 2, "itens_faltando": [], "custo_total": 1234.5,
+            "pontuacao": 1300.2, "distancia_km": 430.1 },
+          ...
         ]
-        return jsonify({"resultados": resultados})
-    finally:
-        conn.close()
+      }
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "corpo JSON deve ser um objeto"}), 400
+    return _responder(servicos.fornecedores_cesta(data))
+
+
+@app.route("/precos", methods=["POST", "PUT"])
+@require_api_key
+def precos():
+    """
+    Grava preços numa transação (todos os itens ou nenhum).
+    POST cria ou atualiza; PUT só atualiza preços já cadastrados.
+    Entrada: um item ou { "itens": [ ... ] }
+      { "codigo_fornecedor": "...", "estado": "...", "codigo_material": "...", "valor": 12.34 }
+      (ou "remover": true no lugar de "valor")
+    Resposta:
+      { "seq": 42, "inseridos": 0, "atualizados": 1, "removidos": 0, "chaves_afetadas": 1 }
+    "seq" é o número da mudança no feed de /precos/mudancas.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "corpo JSON deve ser um objeto"}), 400
+    return _responder(servicos.gravar_precos(data, somente_existentes=request.method == "PUT"))
+
+
+@app.route("/precos/mudancas", methods=["GET"])
+@require_api_key
+def precos_mudancas():
+    """
+    Feed de mudanças de preço.
+    Parâmetros:
+      - desde  (querystring, opcional) -> último seq já visto
+      - limite (querystring, opcional) -> 1..10000, padrão 1000
+    Resposta:
+      sem 'desde': { "seq": 42 }
+      com 'desde': { "seq": 42, "recarregar": false,
+                     "mudancas": [ { "seq": 41, "material": "...", "estado": "..." }, ... ] }
+    "recarregar": true pede para descartar todo o cache (mudou mais que preços).
+    """
+    return _responder(servicos.mudancas_precos(request.args))
 
 
 # -----------------------------------------------------------------------------
-# Endpoint conversacional (mantém estado na sessão do Flask)
+# Endpoint conversacional (estado no servidor, cookie leva só o id da sessão)
 # -----------------------------------------------------------------------------
 @app.route("/chat", methods=["POST"])
 @require_api_key
@@ -162,47 +364,17 @@ def chat():
     Endpoint conversacional único.
     Entrada: JSON { "message": "texto do usuario" }
     Saída:   { "reply": "...", "fim": true|false }
-    - Mantém um dicionário 'chat_state' na sessão para conduzir o fluxo.
+    - O cookie de sessão guarda apenas 'sid'; o estado do chat fica no
+      armazém do servidor (sessoes.py) como um EstadoChat enxuto.
     - A lógica de estados/etapas está em processar_mensagem_chatbot().
     """
     data = request.get_json(silent=True) or {}
-    mensagem = (data.get("message") or "").strip()
-
-    if not mensagem:
-        return jsonify({"error": "campo 'message' é obrigatório no corpo JSON"}), 400
-
-    # Inicializa estado de chat se não existir
-    if "chat_state" not in session or not isinstance(session.get("chat_state"), dict):
-        session["chat_state"] = {
-            "stage": "aguardando_categoria",
-            "selected_category": None,
-            "selected_material": None,
-            "selected_state": None,
-            "available_materials": [],
-            "available_categories": [],
-            "initial_greeting_sent": False,
-        }
-
-    # Se a conversa anterior marcou 'fim', reinicia estado ao receber nova mensagem
-    if session["chat_state"].get("stage") == "fim":
-        session["chat_state"] = {
-            "stage": "aguardando_categoria",
-            "selected_category": None,
-            "selected_material": None,
-            "selected_state": None,
-            "available_materials": [],
-            "available_categories": [],
-            "initial_greeting_sent": False,
-        }
-
-    # Chama a lógica do bot
-    reply, novo_estado = processar_mensagem_chatbot(mensagem, session["chat_state"])
-
-    # Atualiza estado em sessão
-    session["chat_state"] = novo_estado
-
-    is_fim = (novo_estado.get("stage") == "fim")
-    return jsonify({"reply": reply, "fim": is_fim})
+
+    sid = session.get("sid")
+    if not sid:
+        sid = session["sid"] = novo_id_sessao()
+
+    return _responder(servicos.chat(sid, data))
 
 
 # -----------------------------------------------------------------------------
@@ -0,0 +1,233 @@
+import os
+import threading
+import time
+
+import catalogo_mmap
+import metricas
+from bot_logica import processar_mensagem_chatbot
+from busca import indice_categorias, indice_materiais
+from catalogo import obter_catalogo
+from db_pool import obter_pool
+from estados import obter_resolvedor
+from indice_precos import indice_habilitado, obter_indice
+from respostas import obter_respostas
+from sessoes import EstadoChat, obter_armazem
+
+# -----------------------------------------------------------------------------
+# Aquecimento do worker na subida (readiness)
+# -----------------------------------------------------------------------------
+# Logo depois de subir, as primeiras requisições pagavam custos frios: abrir o
+# SQLite, trazer as páginas do arquivo para o page cache, montar catálogo,
+# índice de preços, tries e índices de busca. Aqui isso tudo roda numa thread
+# assim que app.py é importado, etapa por etapa, terminando com uma conversa
+# sintética completa pelo mesmo caminho do /chat (sessão descartada no fim).
+#
+# /health/live responde desde o início (o processo está de pé);
+# /health/ready só responde 200 quando o aquecimento terminou, então o
+# balanceador só manda tráfego quando a primeira requisição já é tão rápida
+# quanto as seguintes. Cada worker do gunicorn aquece e responde por si.
+#
+#   AQUECIMENTO         "1" em segundo plano (padrão), "sincrono" antes de
+#                       atender, "0" desliga (pronto desde o início)
+#   AQUECIMENTO_MAX_MB  limite de leitura antecipada por arquivo (padrão: 1024)
+
+MODO = (os.environ.get("AQUECIMENTO") or "1").strip().lower()
+MAX_BYTES = int(os.environ.get("AQUECIMENTO_MAX_MB", 1024)) * 1024 * 1024
+
+# Depois de uma falha, /health/ready dispara nova tentativa após este intervalo.
+NOVA_TENTATIVA_S = 5.0
+
+TAMANHO_BLOCO = 1024 * 1024
+
+
+def precarregar_arquivo(caminho, limite=MAX_BYTES):
+    """
+    Lê o arquivo em sequência (blocos de 1 MiB num buffer reaproveitado) para
+    trazê-lo ao page cache do sistema. Retorna os bytes lidos.
+    """
+    try:
+        arquivo = open(caminho, "rb", buffering=0)
+    except FileNotFoundError:
+        return 0
+    with arquivo:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(arquivo.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        buffer = bytearray(TAMANHO_BLOCO)
+        lidos = 0
+        while lidos < limite:
+            n = arquivo.readinto(buffer)
+            if not n:
+                break
+            lidos += n
+        return lidos
+
+
+# --- etapas ------------------------------------------------------------------------
+def _paginas():
+    pool = obter_pool()
+    lidos = sum(precarregar_arquivo(c) for c in (pool.caminho, pool.caminho + "-wal"))
+    fonte = catalogo_mmap.fonte_ativa()
+    if fonte is not None:
+        lidos += precarregar_arquivo(fonte.caminho)
+    return {"mb": round(lidos / (1024 * 1024), 1)}
+
+
+def _banco():
+    conn = obter_pool().obter()
+    try:
+        conn.execute("SELECT 1").fetchone()
+    finally:
+        conn.close()
+
+
+def _catalogo():
+    catalogo = obter_catalogo()
+    return {"categorias": len(catalogo.categorias), "estados": len(catalogo.estados)}
+
+
+def _estados():
+    obter_resolvedor(obter_catalogo())
+
+
+def _busca():
+    catalogo = obter_catalogo()
+    indice_categorias(catalogo)
+    for categoria in catalogo.categorias:
+        indice_materiais(catalogo, categoria)
+
+
+def _respostas():
+    catalogo = obter_catalogo()
+    respostas = obter_respostas(catalogo)
+    for categoria in catalogo.categorias:
+        respostas.categoria_escolhida(categoria)
+
+
+def _indice_precos():
+    if indice_habilitado():
+        return {"precos": len(obter_indice())}
+    return {"desligado": True}
+
+
+def _chat():
+    catalogo = obter_catalogo()
+    estado_uf = catalogo.estados[0] if catalogo.estados else "sp"
+    turnos = ("oi", "1", "1", estado_uf, "não")
+    armazem = obter_armazem()
+    sid = f"aquecimento-{os.getpid()}"
+    estado = EstadoChat()
+    try:
+        for mensagem in turnos:
+            _, novo_estado = processar_mensagem_chatbot(mensagem, estado.para_dict(catalogo))
+            armazem.salvar(sid, EstadoChat.de_dict(novo_estado, catalogo))
+            estado = armazem.carregar(sid) or EstadoChat()
+    finally:
+        armazem.remover(sid)
+    return {"turnos": len(turnos), "etapa_final": estado.stage}
+
+
+ETAPAS = (
+    ("paginas_banco", _paginas),
+    ("conexao_banco", _banco),
+    ("catalogo", _catalogo),
+    ("estados", _estados),
+    ("busca", _busca),
+    ("respostas", _respostas),
+    ("indice_precos", _indice_precos),
+    ("chat", _chat),
+)
+
+
+class Aquecimento:
+    """Uma execução do aquecimento e o progresso de cada etapa."""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.inicio = None
+        self.fim = None
+        self.total_ms = None
+        self.erro = None
+        self.etapas = {nome: {"status": "pendente"} for nome, _ in ETAPAS}
+
+    @property
+    def concluido(self):
+        return self.fim is not None
+
+    @property
+    def pronto(self):
+        return self.concluido and self.erro is None
+
+    def rodar(self):
+        self.inicio = time.time()
+        t0 = time.perf_counter()
+        try:
+            for nome, etapa in ETAPAS:
+                progresso = self.etapas[nome]
+                progresso["status"] = "rodando"
+                inicio = time.perf_counter()
+                try:
+                    detalhes = etapa()
+                except Exception as exc:
+                    progresso["status"] = "erro"
+                    self.erro = f"{nome}: {exc}"
+                    return
+                finally:
+                    segundos = time.perf_counter() - inicio
+                    progresso["ms"] = round(segundos * 1000, 2)
+                    metricas.observar("aquecimento_etapa_segundos", segundos, etapa=nome)
+                progresso["status"] = "ok"
+                if detalhes:
+                    progresso.update(detalhes)
+        finally:
+            self.total_ms = round((time.perf_counter() - t0) * 1000, 2)
+            self.fim = time.time()
+
+    def relatorio(self):
+        dados = {"etapas": {nome: dict(p) for nome, p in self.etapas.items()}}
+        if self.concluido:
+            dados["total_ms"] = self.total_ms
+        if self.erro:
+            dados["erro"] = self.erro
+        return dados
+
+
+_atual = None
+_lock = threading.Lock()
+
+
+def _comecar(em_segundo_plano):
+    global _atual
+    aquecimento = _atual = Aquecimento()
+    if em_segundo_plano:
+        threading.Thread(target=aquecimento.rodar, name="aquecimento", daemon=True).start()
+    else:
+        aquecimento.rodar()
+    return aquecimento
+
+
+def iniciar(em_segundo_plano=True):
+    """Começa um aquecimento neste processo (substitui o anterior)."""
+    with _lock:
+        return _comecar(em_segundo_plano)
+
+
+def iniciar_do_ambiente():
+    if MODO == "0":
+        return None
+    return iniciar(em_segundo_plano=MODO != "sincrono")
+
+
+def atual():
+    """
+    Aquecimento deste processo. Refaz se o processo é outro (fork depois do
+    import) ou se o último falhou há mais de NOVA_TENTATIVA_S.
+    """
+    if MODO == "0":
+        return None
+    with _lock:
+        aquecimento = _atual
+        if aquecimento is None or aquecimento.pid != os.getpid():
+            return _comecar(True)
+        if aquecimento.concluido and aquecimento.erro and time.time() - aquecimento.fim > NOVA_TENTATIVA_S:
+            return _comecar(True)
+        return aquecimento
@@ -0,0 +1,37 @@
+import hashlib
+import os
+import stat
+import tempfile
+
+from db_pool import DB_PADRAO
+
+# -----------------------------------------------------------------------------
+# Pasta privada dos armazéns locais (sessões, admissão)
+# -----------------------------------------------------------------------------
+# Os armazéns sqlite de sessoes.py e admissao.py ficavam com nome fixo direto
+# no tmp do sistema: todas as instâncias da máquina dividiam o mesmo arquivo,
+# e outro usuário podia criá-lo antes (ou um symlink) para ler ou alterar as
+# sessões. O padrão agora é <tmp>/chatbot-<uid>/<resumo do DB_PATH>/, uma
+# pasta só do usuário (0700) e separada por base, então cada instância tem
+# os seus arquivos e os workers dela continuam compartilhando-os.
+
+
+def _pasta_privada(caminho):
+    try:
+        os.mkdir(caminho, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(caminho)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise RuntimeError(f"{caminho} não é uma pasta privada deste usuário; "
+                           "configure o caminho do armazém pela variável de ambiente")
+
+
+def arquivo_privado(nome):
+    """Caminho de `nome` na pasta privada desta instância (criada se preciso)."""
+    base = os.path.abspath(os.environ.get("DB_PATH") or DB_PADRAO)
+    raiz = os.path.join(tempfile.gettempdir(), f"chatbot-{os.getuid()}")
+    pasta = os.path.join(raiz, hashlib.sha256(base.encode("utf-8")).hexdigest()[:12])
+    _pasta_privada(raiz)
+    _pasta_privada(pasta)
+    return os.path.join(pasta, nome)
@@ -0,0 +1,374 @@
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from typing import NamedTuple
+from urllib.parse import parse_qsl
+
+import cache_respostas
+import metricas
+import servicos
+from app import app as flask_app
+from sessoes import novo_id_sessao
+
+# -----------------------------------------------------------------------------
+# Ponto de entrada ASGI (alternativo ao app Flask)
+# -----------------------------------------------------------------------------
+# Serve as mesmas rotas e contratos JSON de app.py, mas sem prender uma thread
+# por requisição: o trabalho que toca o SQLite roda num executor limitado e um
+# semáforo limita quantas requisições estão em processamento ao mesmo tempo.
+# O cookie de sessão é o mesmo do Flask (mesmo nome, mesma assinatura com
+# SECRET_KEY), então as duas entradas podem atender a mesma conversa.
+#
+# Para rodar (qualquer servidor ASGI):
+#   uvicorn asgi:app --port 5000
+#   gunicorn -k uvicorn.workers.UvicornWorker asgi:app
+#
+# A API key e o controle de admissão (admissao.py) são conferidos antes de ler
+# o corpo. Com o armazém sqlite, a admissão roda num executor próprio e
+# pequeno: com as threads de banco todas ocupadas (justamente a sobrecarga),
+# o 429/503 continua saindo na hora em vez de esperar atrás das consultas.
+#
+#   ASGI_DB_WORKERS        threads do executor de banco (padrão: 32)
+#   ASGI_MAX_CONCORRENCIA  requisições em processamento simultâneo (padrão: 1024)
+#   ASGI_ADMISSAO_WORKERS  threads do executor da admissão (padrão: 4)
+
+DB_WORKERS = int(os.environ.get("ASGI_DB_WORKERS", 32))
+MAX_CONCORRENCIA = int(os.environ.get("ASGI_MAX_CONCORRENCIA", 1024))
+ADMISSAO_WORKERS = int(os.environ.get("ASGI_ADMISSAO_WORKERS", 4))
+
+_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db")
+_executor_admissao = ThreadPoolExecutor(max_workers=ADMISSAO_WORKERS, thread_name_prefix="admissao")
+_limitador = None  # asyncio.Semaphore criado dentro do loop do servidor
+
+
+def _json(payload):
+    return servicos.serializar_json(payload).encode("utf-8")
+
+
+class Resposta(NamedTuple):
+    """
+    O que um handler devolve; `tipo` diz o que é o corpo e como enviá-lo:
+      json    payload serializado aqui (dict/list)
+      bytes   corpo já serializado (cache_respostas, /metrics)
+      partes  gerador de str, enviado aos pedaços
+      ndjson  gerador de objetos, um por linha
+    headers: pares (nome, valor) em str.
+    """
+    tipo: str
+    status: int
+    corpo: object
+    headers: tuple = ()
+
+
+def _em_json(resultado, headers=()):
+    """Resposta de uma função de servicos.py, que devolve (payload, status)."""
+    payload, status = resultado
+    return Resposta("json", status, payload, tuple(headers))
+
+
+class Requisicao:
+    __slots__ = ("metodo", "caminho", "args", "headers", "corpo", "cookies")
+
+    def __init__(self, scope, corpo=b""):
+        self.metodo = scope["method"]
+        self.caminho = scope["path"]
+        self.args = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1"),
+                                   keep_blank_values=True))
+        self.headers = {k.decode("latin-1").lower(): v.decode("latin-1")
+                        for k, v in scope.get("headers", [])}
+        self.corpo = corpo
+        self.cookies = SimpleCookie(self.headers.get("cookie", ""))
+
+    def json(self):
+        try:
+            data = json.loads(self.corpo or b"null")
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+
+
+async def _no_executor(fn, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, fn, *args)
+
+
+async def _admitir(api_key, endereco, caminho, encaminhado):
+    if not servicos.admissao_bloqueante():
+        return servicos.admitir(api_key, endereco, caminho, encaminhado)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor_admissao, servicos.admitir,
+                                      api_key, endereco, caminho, encaminhado)
+
+
+# --- sessão (compatível com o cookie do Flask) --------------------------------
+def _serializador():
+    return flask_app.session_interface.get_signing_serializer(flask_app)
+
+
+def _sid_do_cookie(req):
+    morsel = req.cookies.get(flask_app.config["SESSION_COOKIE_NAME"])
+    if morsel is None:
+        return None
+    try:
+        return _serializador().loads(morsel.value).get("sid")
+    except Exception:
+        return None
+
+
+def _cookie_sessao(sid):
+    valor = _serializador().dumps({"sid": sid})
+    return f"{flask_app.config['SESSION_COOKIE_NAME']}={valor}; HttpOnly; Path=/"
+
+
+# --- rotas --------------------------------------------------------------------
+async def _health(req):
+    return _em_json(await _no_executor(servicos.health))
+
+
+async def _health_live(req):
+    return _em_json(servicos.vivo())
+
+
+async def _health_ready(req):
+    return _em_json(await _no_executor(servicos.pronto))
+
+
+def _com_cache(rota, req, produzir, versao=None):
+    status, corpo, headers = cache_respostas.responder(
+        rota, req.args, produzir, servicos.serializar_json,
+        publico=not servicos.API_KEY,
+        if_none_match=req.headers.get("if-none-match"),
+        if_modified_since=req.headers.get("if-modified-since"),
+        versao=versao,
+    )
+    return Resposta("bytes", status, corpo, tuple(headers))
+
+
+async def _categorias(req):
+    return await _no_executor(_com_cache, "categorias", req, servicos.categorias)
+
+
+async def _materiais(req):
+    modo = await _no_executor(servicos.modo_materiais, req.args, req.headers.get("accept"))
+    if modo is None:
+        return await _no_executor(_com_cache, "materiais", req, lambda: servicos.materiais(req.args))
+    payload, status = await _no_executor(servicos.materiais_streaming, req.args, modo)
+    if status != 200:
+        return _em_json((payload, status))
+    tipo = "application/x-ndjson" if modo == "ndjson" else "application/json"
+    return Resposta("partes", 200, payload, (("Content-Type", tipo),))
+
+
+def _fornecedores_com_cache(req):
+    return _com_cache("fornecedores", req, lambda: servicos.fornecedores(req.args),
+                      servicos.versao_fornecedores(req.args))
+
+
+async def _fornecedores(req):
+    return await _no_executor(_fornecedores_com_cache, req)
+
+
+async def _cache_stats(req):
+    return _em_json((cache_respostas.cache.estatisticas(), 200))
+
+
+async def _metrics(req):
+    texto = servicos.metricas_prometheus().encode("utf-8")
+    return Resposta("bytes", 200, texto, (("Content-Type", "text/plain; version=0.0.4"),))
+
+
+CORPO_INVALIDO = ({"error": "corpo JSON deve ser um objeto"}, 400)
+
+
+async def _fornecedores_batch(req):
+    data = req.json()
+    if data is None:
+        return _em_json(CORPO_INVALIDO)
+    streaming = servicos.quer_ndjson(req.args.get("formato"), req.headers.get("accept"))
+    payload, status = await _no_executor(servicos.fornecedores_lote, data, streaming)
+    if streaming and status == 200:
+        return Resposta("ndjson", 200, payload)
+    return _em_json((payload, status))
+
+
+async def _fornecedores_cesta(req):
+    data = req.json()
+    if data is None:
+        return _em_json(CORPO_INVALIDO)
+    return _em_json(await _no_executor(servicos.fornecedores_cesta, data))
+
+
+async def _precos(req):
+    data = req.json()
+    if data is None:
+        return _em_json(CORPO_INVALIDO)
+    return _em_json(await _no_executor(servicos.gravar_precos, data, req.metodo == "PUT"))
+
+
+async def _precos_mudancas(req):
+    return _em_json(await _no_executor(servicos.mudancas_precos, req.args))
+
+
+async def _chat(req):
+    data = req.json() or {}
+    headers = []
+    sid = _sid_do_cookie(req)
+    if not sid:
+        sid = novo_id_sessao()
+        headers.append(("Set-Cookie", _cookie_sessao(sid)))
+    return _em_json(await _no_executor(servicos.chat, sid, data), headers)
+
+
+# (método, caminho) -> (handler, exige_api_key)
+ROTAS = {
+    ("GET", "/health"): (_health, False),
+    ("GET", "/health/live"): (_health_live, False),
+    ("GET", "/health/ready"): (_health_ready, False),
+    ("GET", "/metrics"): (_metrics, False),
+    ("GET", "/categorias"): (_categorias, True),
+    ("GET", "/materiais"): (_materiais, True),
+    ("GET", "/fornecedores"): (_fornecedores, True),
+    ("POST", "/fornecedores/batch"): (_fornecedores_batch, True),
+    ("POST", "/fornecedores/cesta"): (_fornecedores_cesta, True),
+    ("GET", "/cache/stats"): (_cache_stats, True),
+    ("POST", "/precos"): (_precos, True),
+    ("PUT", "/precos"): (_precos, True),
+    ("GET", "/precos/mudancas"): (_precos_mudancas, True),
+    ("POST", "/chat"): (_chat, True),
+}
+
+
+async def _ler_corpo(receive):
+    partes = []
+    while True:
+        mensagem = await receive()
+        partes.append(mensagem.get("body", b""))
+        if not mensagem.get("more_body"):
+            return b"".join(partes)
+
+
+def _headers(headers):
+    return [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+
+
+async def _enviar(send, status, payload, headers=()):
+    corpo = _json(payload)
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"),
+                    (b"content-length", str(len(corpo)).encode())] + _headers(headers),
+    })
+    await send({"type": "http.response.body", "body": corpo})
+
+
+async def _enviar_bytes(send, status, corpo, headers):
+    extras = _headers(headers)
+    if not any(k == b"content-type" for k, _ in extras):
+        extras.insert(0, (b"content-type", b"application/json"))
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-length", str(len(corpo)).encode())] + extras,
+    })
+    await send({"type": "http.response.body", "body": corpo})
+
+
+async def _enviar_partes(send, status, partes, headers):
+    # Corpo gerado aos pedaços (str); sem content-length, o servidor usa chunked.
+    await send({"type": "http.response.start", "status": status, "headers": _headers(headers)})
+    fim = object()
+    while True:
+        parte = await _no_executor(next, partes, fim)
+        if parte is fim:
+            break
+        await send({"type": "http.response.body", "body": parte.encode("utf-8"), "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def _enviar_ndjson(send, status, linhas, headers):
+    # Cada linha é produzida no executor: o gerador consulta o índice de preços.
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/x-ndjson")] + _headers(headers),
+    })
+    fim = object()
+    while True:
+        linha = await _no_executor(next, linhas, fim)
+        if linha is fim:
+            break
+        await send({"type": "http.response.body", "body": _json(linha), "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+ENVIOS = {
+    "json": _enviar,
+    "bytes": _enviar_bytes,
+    "partes": _enviar_partes,
+    "ndjson": _enviar_ndjson,
+}
+
+
+async def _lifespan(receive, send):
+    while True:
+        mensagem = await receive()
+        if mensagem["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif mensagem["type"] == "lifespan.shutdown":
+            _executor.shutdown(wait=False)
+            _executor_admissao.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    rota = ROTAS.get((scope["method"], scope["path"]))
+    if rota is None:
+        metodos = [m for (m, caminho) in ROTAS if caminho == scope["path"]]
+        if metodos:
+            return await _enviar(send, 405, {"error": "method not allowed"})
+        return await _enviar(send, 404, {"error": "not found"})
+
+    handler, exige_api_key = rota
+    req = Requisicao(scope)
+    if exige_api_key:
+        api_key = req.headers.get("x-api-key")
+        if not servicos.api_key_valida(api_key):
+            payload, status = servicos.NAO_AUTORIZADO
+            return await _enviar(send, status, payload)
+        # admissão antes de ler o corpo e antes do semáforo: quem está no
+        # limite recebe 429/503 na hora em vez de esperar na fila
+        cliente = scope.get("client")
+        recusa = await _admitir(api_key, cliente[0] if cliente else None, req.caminho,
+                                req.headers.get("x-forwarded-for"))
+        if recusa is not None:
+            payload, status, espera = recusa
+            return await _enviar(send, status, payload, [("Retry-After", str(espera))])
+        try:
+            req.corpo = await _ler_corpo(receive)
+            return await _atender(send, req, handler)
+        finally:
+            servicos.liberar(req.caminho)
+    req.corpo = await _ler_corpo(receive)
+    return await _atender(send, req, handler)
+
+
+async def _atender(send, req, handler):
+    global _limitador
+    if _limitador is None:
+        _limitador = asyncio.Semaphore(MAX_CONCORRENCIA)
+    inicio = time.perf_counter()
+    async with _limitador:
+        resposta = await handler(req)
+        await ENVIOS[resposta.tipo](send, resposta.status, resposta.corpo, resposta.headers)
+    metricas.observar("http_requisicoes_segundos", time.perf_counter() - inicio,
+                      rota=req.caminho, metodo=req.metodo, status=resposta.status)
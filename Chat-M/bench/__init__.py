@@ -0,0 +1,7 @@
+"""
+Benchmarks do MeliBuy: catálogo sintético, micro-benchmarks e replay de
+conversas pelo client de teste do Flask.
+
+    python -m bench --precos 100000 --saida resultado.json
+    python -m bench --precos 100000 --baseline resultado.json
+"""
@@ -0,0 +1,99 @@
+"""
+Roda o catálogo sintético + micro-benchmarks + replay e grava um JSON.
+
+Exemplos (a partir de Chat-M/):
+  python -m bench --precos 100000 --saida bench_base.json
+  python -m bench --precos 100000 --baseline bench_base.json --tolerancia 0.2
+  python -m bench --db base_chatbot2.db --sem-replay
+
+Com --baseline, o processo termina com código 1 se alguma medida regrediu
+além da tolerância (útil em CI).
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import admissao
+import db_pool
+import sessoes
+
+from bench import catalogo_sintetico, micro, replay
+from bench.medidas import comparar, rss_max_kb
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Benchmarks do MeliBuy.")
+    parser.add_argument("--precos", type=int, default=100_000,
+                        help="linhas de preços do catálogo sintético (10^3 a 10^7)")
+    parser.add_argument("--db", help="usa esta base em vez de gerar uma sintética")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--iteracoes", type=int, default=2000, help="iterações por micro-benchmark")
+    parser.add_argument("--concorrencia", type=int, default=8, help="usuários simultâneos no replay")
+    parser.add_argument("--conversas", type=int, default=50, help="conversas por usuário no replay")
+    parser.add_argument("--armazem", choices=("sqlite", "memoria"), default="sqlite",
+                        help="armazém de sessões usado no replay")
+    parser.add_argument("--sem-micro", action="store_true")
+    parser.add_argument("--sem-replay", action="store_true")
+    parser.add_argument("--saida", help="arquivo JSON de saída (padrão: stdout)")
+    parser.add_argument("--baseline", help="JSON de uma execução anterior para comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.25,
+                        help="piora relativa aceita antes de acusar regressão (padrão: 0.25)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="melibuy-bench-") as pasta:
+        resultado = {"meta": {
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "inicio": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "argumentos": vars(args),
+        }}
+
+        if args.db:
+            caminho = os.path.abspath(args.db)
+        else:
+            caminho = os.path.join(pasta, "catalogo.db")
+            resultado["geracao"] = catalogo_sintetico.gerar(caminho, args.precos, args.semente)
+        db_pool.configurar_pool(caminho=caminho, readonly=True)
+
+        if args.armazem == "memoria":
+            sessoes.configurar_armazem(sessoes.ArmazemMemoria())
+        else:
+            sessoes.configurar_armazem(sessoes.ArmazemSQLite(os.path.join(pasta, "sessoes.db")))
+        # o replay passa pela admissão (o custo entra na medida), mas todos os
+        # usuários virtuais saem do mesmo IP: limites altos para nunca recusar
+        if args.armazem == "memoria":
+            baldes = admissao.BaldesMemoria()
+        else:
+            baldes = admissao.BaldesSQLite(os.path.join(pasta, "admissao.db"))
+        admissao.configurar_admissao(admissao.Admissao(baldes, taxa=1e9, rajada=1e9, max_concorrencia=1 << 30))
+
+        if not args.sem_micro:
+            resultado["micro"] = micro.rodar(args.iteracoes)
+        if not args.sem_replay:
+            resultado["replay"] = replay.rodar(args.concorrencia, args.conversas)
+        resultado["rss_max_kb"] = rss_max_kb()
+
+    codigo = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as arquivo:
+            regressoes = comparar(resultado, json.load(arquivo), args.tolerancia)
+        resultado["regressoes"] = regressoes
+        codigo = 1 if regressoes else 0
+
+    texto = json.dumps(resultado, ensure_ascii=False, indent=2)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as arquivo:
+            arquivo.write(texto + "\n")
+    else:
+        print(texto)
+    for r in resultado.get("regressoes", []):
+        print(f"regressão: {r['medida']} {r['campo']} {r['baseline']} -> {r['atual']}", file=sys.stderr)
+    return codigo
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""
+Gera uma base SQLite sintética com o mesmo schema da base real.
+
+O tamanho é dado pelo número de linhas de preços (10^3 a 10^7); materiais e
+fornecedores acompanham em proporções parecidas com as de uma planilha real.
+A carga usa ingestao.ingerir com geradores, então a memória fica estável
+mesmo nos tamanhos maiores.
+"""
+import math
+import random
+
+import ingestao
+
+ESTADOS = (
+    "São Paulo", "Rio de Janeiro", "Bahia", "Minas Gerais", "Rio Grande do Sul",
+    "Santa Catarina", "Paraná", "Pernambuco", "Ceará", "Distrito Federal",
+)
+CATEGORIAS = (
+    "Cimento", "Areia", "Brita", "Tubo pvc", "Tinta", "Elétricos", "Ferragens",
+    "Madeira", "Revestimento", "Hidráulica", "Telhas", "Ferramentas",
+)
+PALAVRAS = (
+    "premium", "standard", "reforçado", "leve", "industrial", "branco", "cinza",
+    "galvanizado", "flexível", "rígido", "extra", "econômico",
+)
+
+
+def dimensoes(n_precos):
+    """(materiais, fornecedores por estado) para um dado número de preços."""
+    n_materiais = max(5, int(math.sqrt(n_precos) * 2))
+    n_redes = max(8, min(2000, n_precos // max(1, n_materiais * len(ESTADOS)) + 8))
+    return n_materiais, n_redes
+
+
+def _materiais(n, rnd):
+    for i in range(n):
+        categoria = CATEGORIAS[i % len(CATEGORIAS)]
+        yield {
+            "codigo": f"M{i:08d}",
+            "nome": f"{categoria} {rnd.choice(PALAVRAS)} {i}",
+            "categoria": categoria,
+        }
+
+
+def _fornecedores(n_redes):
+    for rede in range(n_redes):
+        for estado in ESTADOS:
+            yield {"codigo": f"F{rede:06d}", "nome": f"Fornecedor {rede}", "estado": estado}
+
+
+def _precos(n_precos, n_materiais, n_redes, rnd):
+    for _ in range(n_precos):
+        yield {
+            "codigo_fornecedor": f"F{rnd.randrange(n_redes):06d}",
+            "estado": rnd.choice(ESTADOS),
+            "codigo_material": f"M{rnd.randrange(n_materiais):08d}",
+            "valor": round(rnd.uniform(5, 500), 2),
+        }
+
+
+def gerar(destino, n_precos, semente=42):
+    """Monta a base em `destino` e devolve o resumo da ingestão."""
+    rnd = random.Random(semente)
+    n_materiais, n_redes = dimensoes(n_precos)
+    resumo = ingestao.ingerir(
+        destino,
+        materiais=_materiais(n_materiais, rnd),
+        fornecedores=_fornecedores(n_redes),
+        precos=_precos(n_precos, n_materiais, n_redes, rnd),
+        vazia=True,
+    )
+    resumo["materiais"] = n_materiais
+    resumo["fornecedores"] = n_redes * len(ESTADOS)
+    return resumo
@@ -0,0 +1,73 @@
+"""Cronômetro, percentis e comparação com um resultado de referência (baseline)."""
+import resource
+import time
+
+
+def medir(fn, iteracoes, aquecimento=10):
+    """Roda fn() `iteracoes` vezes e devolve as durações em segundos."""
+    for _ in range(aquecimento):
+        fn()
+    amostras = []
+    relogio = time.perf_counter
+    for _ in range(iteracoes):
+        inicio = relogio()
+        fn()
+        amostras.append(relogio() - inicio)
+    return amostras
+
+
+def percentil(ordenadas, p):
+    if not ordenadas:
+        return 0.0
+    posicao = min(len(ordenadas) - 1, max(0, round(p / 100 * (len(ordenadas) - 1))))
+    return ordenadas[posicao]
+
+
+def resumir(amostras, segundos_totais=None):
+    """Latências em ms (média, p50/p90/p99, máx.) e vazão em operações/s."""
+    ordenadas = sorted(amostras)
+    total = segundos_totais if segundos_totais is not None else sum(amostras)
+    return {
+        "n": len(ordenadas),
+        "media_ms": round(sum(ordenadas) / len(ordenadas) * 1000, 4) if ordenadas else 0.0,
+        "p50_ms": round(percentil(ordenadas, 50) * 1000, 4),
+        "p90_ms": round(percentil(ordenadas, 90) * 1000, 4),
+        "p99_ms": round(percentil(ordenadas, 99) * 1000, 4),
+        "max_ms": round(ordenadas[-1] * 1000, 4) if ordenadas else 0.0,
+        "ops_s": round(len(ordenadas) / total, 1) if total else 0.0,
+    }
+
+
+def rss_max_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+# --- comparação com baseline ---------------------------------------------------
+def _resumos(resultado):
+    """Achata {"micro": {...}, "replay": {...}} em {"micro/nome": resumo}."""
+    for secao in ("micro", "replay"):
+        for nome, resumo in resultado.get(secao, {}).items():
+            if isinstance(resumo, dict) and "p50_ms" in resumo:
+                yield f"{secao}/{nome}", resumo
+
+
+def comparar(atual, baseline, tolerancia=0.25):
+    """
+    Lista as regressões de `atual` em relação a `baseline`: p50/p99 acima de
+    (1 + tolerancia) vezes o valor de referência ou vazão abaixo de
+    (1 - tolerancia) vezes. Medidas ausentes em um dos lados são ignoradas.
+    """
+    referencia = dict(_resumos(baseline))
+    regressoes = []
+    for nome, resumo in _resumos(atual):
+        base = referencia.get(nome)
+        if base is None:
+            continue
+        for campo in ("p50_ms", "p99_ms"):
+            if base[campo] and resumo[campo] > base[campo] * (1 + tolerancia):
+                regressoes.append({"medida": nome, "campo": campo,
+                                   "baseline": base[campo], "atual": resumo[campo]})
+        if base["ops_s"] and resumo["ops_s"] < base["ops_s"] * (1 - tolerancia):
+            regressoes.append({"medida": nome, "campo": "ops_s",
+                               "baseline": base["ops_s"], "atual": resumo["ops_s"]})
+    return regressoes
@@ -0,0 +1,67 @@
+"""
+Micro-benchmarks das funções de bot_logica.py.
+
+Cada etapa do chat é medida isoladamente: o estado de entrada é montado a
+partir do catálogo carregado e copiado a cada iteração, porque
+processar_mensagem_chatbot altera o dict recebido.
+"""
+import ranking
+from bot_logica import consultar_fornecedores, listar_materiais_por_categoria, processar_mensagem_chatbot
+from catalogo import obter_catalogo
+from indice_precos import obter_indice
+
+from bench.medidas import medir, resumir
+
+
+def _amostra_catalogo(catalogo):
+    """(categoria, material, estado) usados como entrada fixa dos benchmarks."""
+    categoria = catalogo.categorias[0]
+    material = catalogo.materiais(categoria)[0]
+    estados = [e for e in catalogo.estados if e != "minas gerais"] or list(catalogo.estados)
+    return categoria, material, estados[0]
+
+
+def _etapas_chat(categoria, material, estado):
+    """nome -> (mensagem, estado do chat antes do turno)."""
+    base = {
+        "selected_category": None, "selected_material": None,
+        "selected_state": None, "initial_greeting_sent": True,
+    }
+    return {
+        "chat_saudacao": ("oi", dict(base, stage="aguardando_categoria", initial_greeting_sent=False)),
+        "chat_categoria": ("1", dict(base, stage="aguardando_escolha_categoria")),
+        "chat_material": ("1", dict(base, stage="aguardando_escolha_material",
+                                    selected_category=categoria)),
+        "chat_material_por_nome": (material, dict(base, stage="aguardando_escolha_material",
+                                                  selected_category=categoria)),
+        "chat_estado": (estado, dict(base, stage="aguardando_estado", selected_category=categoria,
+                                     selected_material=material)),
+        "chat_nova_consulta": ("sim", dict(base, stage="finalizou_consulta")),
+        "chat_regiao": ("região", dict(base, stage="finalizou_consulta", selected_material=material,
+                                       selected_state=estado)),
+        "chat_reiniciar": ("reiniciar", dict(base, stage="aguardando_estado")),
+    }
+
+
+def rodar(iteracoes=2000):
+    catalogo = obter_catalogo()
+    obter_indice()  # primeira sincronização fora da medida
+    categoria, material, estado = _amostra_catalogo(catalogo)
+    cesta = [(nome, 10) for nome in catalogo.materiais(categoria)[:10]]
+
+    resultados = {
+        "consultar_fornecedores": resumir(medir(
+            lambda: consultar_fornecedores(None, material, estado), iteracoes)),
+        "consultar_fornecedores_todos": resumir(medir(
+            lambda: consultar_fornecedores(None, material, estado, limite=None), iteracoes)),
+        "listar_materiais_por_categoria": resumir(medir(
+            lambda: listar_materiais_por_categoria(None, categoria), iteracoes)),
+        "ranking_vizinhos": resumir(medir(
+            lambda: ranking.melhores(material, estado, 3, ranking.RAIO_MAXIMO_KM, "preco_frete"), iteracoes)),
+        "ranking_cesta": resumir(medir(
+            lambda: ranking.melhores_cesta(cesta, estado, 3, ranking.RAIO_MAXIMO_KM, "preco_frete"), iteracoes)),
+    }
+    for nome, (mensagem, estado_chat) in _etapas_chat(categoria, material, estado).items():
+        resultados[nome] = resumir(medir(
+            lambda: processar_mensagem_chatbot(mensagem, dict(estado_chat)), iteracoes))
+    return resultados
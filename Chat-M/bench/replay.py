@@ -0,0 +1,77 @@
+"""
+Replay de conversas completas pelo client de teste do Flask.
+
+Cada usuário virtual tem seu próprio client (e, portanto, seu cookie de
+sessão) e repete o roteiro `conversas` vezes; `concorrencia` usuários rodam
+em paralelo em threads. Além do /chat, o roteiro passa pelas rotas de
+catálogo que o Verdi Flow chama.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from catalogo import obter_catalogo
+from servicos import API_KEYS
+
+from bench.medidas import resumir
+
+
+def roteiro(catalogo):
+    """Passos (nome, método, caminho, corpo_json) de uma conversa típica."""
+    categoria = catalogo.categorias[0]
+    material = catalogo.materiais(categoria)[0]
+    estado = next((e for e in catalogo.estados if e != "minas gerais"), catalogo.estados[0])
+    return [
+        ("GET /categorias", "GET", "/categorias", None),
+        ("GET /materiais", "GET", f"/materiais?categoria={categoria}", None),
+        ("chat saudacao", "POST", "/chat", {"message": "oi"}),
+        ("chat categoria", "POST", "/chat", {"message": "1"}),
+        ("chat material", "POST", "/chat", {"message": "1"}),
+        ("chat estado", "POST", "/chat", {"message": estado}),
+        ("GET /fornecedores", "GET", f"/fornecedores?material={material}&estado={estado}", None),
+        ("chat encerrar", "POST", "/chat", {"message": "não"}),
+    ]
+
+
+def _usuario(app, passos, conversas, amostras, erros, lock):
+    client = app.test_client()
+    headers = {"X-API-KEY": min(API_KEYS)} if API_KEYS else {}
+    locais = {nome: [] for nome, *_ in passos}
+    falhas = 0
+    relogio = time.perf_counter
+    for _ in range(conversas):
+        for nome, metodo, caminho, corpo in passos:
+            inicio = relogio()
+            resposta = client.open(caminho, method=metodo, json=corpo, headers=headers)
+            resposta.get_data()
+            locais[nome].append(relogio() - inicio)
+            if resposta.status_code != 200:
+                falhas += 1
+    with lock:
+        for nome, duracoes in locais.items():
+            amostras[nome].extend(duracoes)
+        erros[0] += falhas
+
+
+def rodar(concorrencia=8, conversas=50):
+    from app import app  # importado aqui: o pool/armazém já foram configurados
+
+    passos = roteiro(obter_catalogo())
+    amostras = {nome: [] for nome, *_ in passos}
+    erros = [0]
+    lock = threading.Lock()
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        futuros = [executor.submit(_usuario, app, passos, conversas, amostras, erros, lock)
+                   for _ in range(concorrencia)]
+        for futuro in futuros:
+            futuro.result()
+    segundos = time.perf_counter() - inicio
+
+    resultados = {nome: resumir(duracoes, segundos) for nome, duracoes in amostras.items()}
+    todas = [d for duracoes in amostras.values() for d in duracoes]
+    resultados["total"] = resumir(todas, segundos)
+    resultados["total"]["erros"] = erros[0]
+    resultados["total"]["conversas_s"] = round(concorrencia * conversas / segundos, 1)
+    return resultados
@@ -1,300 +1,312 @@
-import sqlite3
-import os
+import re
+import time
+from dataclasses import dataclass
+
+import cache_consultas
+import metricas
+import ranking
+import respostas
+from db_pool import obter_pool
+from busca import indice_categorias, indice_materiais
+from catalogo import obter_catalogo
+from estados import obter_resolvedor
+from indice_precos import LIMITE_PADRAO, indice_habilitado, ler_fornecedores, normalizar_chave, obter_indice
+from respostas import obter_respostas
 
 def conectar_db():
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    db_path = os.path.join(base_dir, "base_chatbot2.db")
-    return sqlite3.connect(db_path)
+    # Conexão vem do pool do processo; conn.close() apenas a devolve ao pool.
+    return obter_pool().obter()
 
-def listar_categorias(cursor):
-    cursor.execute("SELECT DISTINCT categoria FROM materiais")
-    return [linha[0] for linha in cursor.fetchall()]
+# listar_* são servidos pelo snapshot do catálogo (catalogo.py), sem SQL.
+# O parâmetro cursor é mantido por compatibilidade com os chamadores antigos.
+def listar_categorias(cursor=None):
+    with metricas.cronometro("db_consulta_segundos", operacao="listar_categorias"):
+        return list(obter_catalogo().categorias)
 
 def listar_materiais_por_categoria(cursor, categoria):
-    cursor.execute("SELECT nome FROM materiais WHERE LOWER(categoria) = LOWER(?)", (categoria,))
-    return [linha[0] for linha in cursor.fetchall()]
-
-def consultar_fornecedores(cursor, material, estado):
-    query = """
-    SELECT f.nome, f.estado, f.codigo, m.nome, m.codigo, p.valor
-    FROM precos p
-    JOIN fornecedores f ON f.id = p.fornecedor_id
-    JOIN materiais m ON m.id = p.material_id
-    WHERE LOWER(m.nome) = LOWER(?) AND LOWER(f.estado) = LOWER(?)
-    ORDER BY p.valor ASC
-    LIMIT 3
+    with metricas.cronometro("db_consulta_segundos", operacao="listar_materiais"):
+        return list(obter_catalogo().materiais(categoria))
+
+def paginar_materiais_por_categoria(categoria, limite, cursor_pagina=None):
+    """
+    Uma página (keyset por id, ver paginacao.py) dos materiais da categoria:
+    (nomes, proximo, anterior). ValueError se o cursor for inválido.
+    """
+    with metricas.cronometro("db_consulta_segundos", operacao="paginar_materiais"):
+        _, nomes, proximo, anterior = obter_catalogo().pagina_materiais(categoria, limite, cursor_pagina)
+        return list(nomes), proximo, anterior
+
+def consultar_fornecedores(cursor, material, estado, limite=LIMITE_PADRAO):
+    """
+    Top `limite` fornecedores mais baratos para (material, estado); com
+    limite=None devolve todos, em ordem de preço.
+    Servido pelo índice em memória (indice_precos.py); o cursor só é usado
+    quando o índice está desligado (INDICE_PRECOS=0).
+    """
+    if indice_habilitado():
+        with metricas.cronometro("db_consulta_segundos", operacao="fornecedores_indice"):
+            return obter_indice().top(material, estado, limite)
+    with metricas.cronometro("db_consulta_segundos", operacao="fornecedores_sql"):
+        return ler_fornecedores(cursor, material, estado, limite)
+
+# -----------------------------------------------------------------------------
+# Máquina de estados da conversa
+# -----------------------------------------------------------------------------
+# Cada etapa é uma entrada da tabela ETAPAS: a função que trata a mensagem
+# devolve (resultado, resposta) e o resultado escolhe a próxima etapa no
+# dict de transições. Nova etapa = nova função + registrar_etapa(); o laço
+# principal não muda. Os textos e menus vêm de respostas.py (pré-renderizados
+# por versão do catálogo).
+
+@dataclass(frozen=True, slots=True)
+class Etapa:
+    tratar: object      # função(turno) -> (resultado, resposta)
+    transicoes: dict    # resultado -> próxima etapa
+
+
+class Turno:
+    """O que as etapas recebem: mensagem, estado do chat e o catálogo do turno."""
+    __slots__ = ("mensagem", "texto", "estado", "catalogo", "respostas")
+
+    def __init__(self, mensagem, estado, catalogo):
+        self.mensagem = mensagem
+        self.texto = mensagem.lower().strip()
+        self.estado = estado
+        self.catalogo = catalogo  # snapshot único para todo o turno
+        self.respostas = obter_respostas(catalogo)
+
+
+def _limpar_selecao(estado):
+    estado['selected_category'] = None
+    estado['selected_material'] = None
+    estado['selected_state'] = None
+    estado['materiais_cursor'] = None
+    estado['initial_greeting_sent'] = True  # para evitar saudação duplicada
+
+
+def _responder_fornecedores(material, estado):
+    # Consulta e resposta formatada são compartilhadas entre conversas que
+    # pedem a mesma chave ao mesmo tempo (cache_consultas.py). A dica de
+    # 'região' depende dos preços do insumo nos outros estados: a versão é a
+    # do material inteiro.
+    chave = normalizar_chave(material, estado) + (LIMITE_PADRAO,)
+    return cache_consultas.consultas.obter(
+        chave, ranking.versao(material), lambda: _formatar_fornecedores(material, estado))
+
+
+def _formatar_fornecedores(material, estado):
+    resultados = consultar_fornecedores(None, material, estado)
+    if resultados:
+        regiao = ranking.tem_vizinhos(material, estado, ranking.RAIO_CHAT_KM)
+        return "resultados", respostas.resposta_fornecedores(resultados, regiao)
+    return "sem_resultados", respostas.resposta_sem_fornecedores(estado)
+
+
+def _apresentar_categorias(turno):
+    estado = turno.estado
+    if not estado.get('initial_greeting_sent', False):
+        estado['initial_greeting_sent'] = True
+        saudacao = True
+    else:
+        texto = turno.texto
+        saudacao = "olá" in texto or "oi" in texto or "ola" in texto
+
+    if not turno.respostas.tem_categorias:
+        return "sem_categorias", respostas.SEM_CATEGORIAS_TENTE_DEPOIS
+    if saudacao:
+        return "menu", turno.respostas.saudacao_com_menu
+    return "menu", turno.respostas.menu_inicial
+
+
+# Número digitado (com sinal, para "-1" não virar o trecho "1" na busca).
+NUMERO = re.compile(r"-?\d+")
+
+
+def _por_numero_ou_nome(texto, busca):
+    """
+    (nome, candidatos) da escolha do usuário: um número é a posição na lista
+    (fora dela, nada); só texto vai para a busca por trecho/aproximada.
     """
-    cursor.execute(query, (material, estado))
-    return cursor.fetchall()
+    if NUMERO.fullmatch(texto):
+        posicao = int(texto) - 1
+        return (busca.nomes[posicao] if 0 <= posicao < len(busca.nomes) else None), []
+    return busca.escolher(texto)
+
+
+def _escolher_categoria(turno):
+    busca = indice_categorias(turno.catalogo)
+    categoria, candidatas = _por_numero_ou_nome(turno.texto, busca)
+
+    if categoria:
+        turno.estado['selected_category'] = categoria
+        turno.estado['materiais_cursor'] = None
+        tem_materiais, resposta = turno.respostas.categoria_escolhida(categoria)
+        return ("escolhida" if tem_materiais else "sem_materiais"), resposta
+    if candidatas:
+        return "ambigua", respostas.resposta_ambigua(turno.mensagem, candidatas, "da categoria")
+    return "nao_entendi", respostas.NAO_ENTENDI_CATEGORIA
+
+
+PROXIMA_PAGINA = frozenset(("mais", "próximos", "proximos", "próxima", "proxima"))
+PAGINA_ANTERIOR = frozenset(("voltar", "anteriores", "anterior"))
+
 
-# Função Principal para a Lógica do Bot 
+def _navegar_materiais(turno, avancar):
+    categoria = turno.estado.get('selected_category')
+    try:
+        resposta, proximo, anterior = turno.respostas.pagina_materiais(
+            categoria, turno.estado.get('materiais_cursor'))
+    except ValueError:  # cursor de outra categoria: volta à primeira página
+        resposta, proximo, anterior = turno.respostas.pagina_materiais(categoria, None)
+    destino = proximo if avancar else anterior
+    if destino is None:
+        return "pagina", respostas.SEM_MAIS_PAGINAS + resposta
+    turno.estado['materiais_cursor'] = destino
+    return "pagina", turno.respostas.pagina_materiais(categoria, destino)[0]
+
+
+def _escolher_material(turno):
+    if ((turno.texto in PROXIMA_PAGINA or turno.texto in PAGINA_ANTERIOR)
+            and len(turno.catalogo.materiais(turno.estado.get('selected_category'))) > respostas.MATERIAIS_POR_PAGINA):
+        return _navegar_materiais(turno, turno.texto in PROXIMA_PAGINA)
+
+    busca = indice_materiais(turno.catalogo, turno.estado.get('selected_category'))
+    material, candidatos = _por_numero_ou_nome(turno.texto, busca)
+
+    if material:
+        turno.estado['selected_material'] = material
+        return "escolhido", respostas.resposta_material_escolhido(material)
+    if candidatos:
+        return "ambiguo", respostas.resposta_ambigua(turno.mensagem, candidatos, "do insumo")
+    return "nao_entendi", respostas.NAO_ENTENDI_MATERIAL
+
+
+def _escolher_estado(turno):
+    resolvedor = obter_resolvedor(turno.catalogo)
+    estado_encontrado, perguntar_mg = resolvedor.resolver_mg(resolvedor.resolver(turno.texto))
+    if perguntar_mg:
+        return "perguntar_mg", respostas.PERGUNTA_MG
+
+    material = turno.estado.get('selected_material')
+    if material and estado_encontrado:
+        turno.estado['selected_state'] = estado_encontrado
+        return _responder_fornecedores(material, estado_encontrado)
+    return "nao_entendi", respostas.NAO_ENTENDI_ESTADO
+
+
+def _especificar_mg(turno):
+    especificacao = obter_resolvedor(turno.catalogo).subdivisao_mg(turno.texto)
+    if not especificacao:
+        return "nao_entendi", respostas.NAO_ENTENDI_MG
+
+    turno.estado['selected_state'] = especificacao
+    material = turno.estado.get('selected_material')
+    if not material:
+        return "sem_material", respostas.ERRO_REINICIE
+    return _responder_fornecedores(material, especificacao)
+
+
+REGIAO = frozenset(("região", "regiao", "vizinhos"))
+
+
+def _comparar_regiao(turno):
+    # Mesmo insumo e estado da consulta, agora com os estados vizinhos e o
+    # frete estimado pela distância (ranking.py).
+    material = turno.estado.get('selected_material')
+    estado = turno.estado.get('selected_state')
+    if not material or not estado:
+        return "nao_entendi", respostas.NAO_ENTENDI_SIM_NAO
+    classificados = ranking.melhores(material, estado, LIMITE_PADRAO, ranking.RAIO_CHAT_KM, ranking.CRITERIO_CHAT)
+    if classificados:
+        return "regiao", respostas.resposta_regiao(classificados, estado, ranking.RAIO_CHAT_KM)
+    return "regiao", respostas.resposta_sem_regiao(estado, ranking.RAIO_CHAT_KM)
+
+
+def _finalizar_consulta(turno):
+    if turno.texto in REGIAO:
+        return _comparar_regiao(turno)
+    if "sim" in turno.texto:
+        _limpar_selecao(turno.estado)
+        return "nova", turno.respostas.nova_consulta
+    if "não" in turno.texto:
+        turno.estado['last_reply'] = respostas.DESPEDIDA
+        return "encerrar", respostas.DESPEDIDA
+    return "nao_entendi", respostas.NAO_ENTENDI_SIM_NAO
+
+
+ETAPAS = {}
+
+
+def registrar_etapa(nome, tratar, transicoes):
+    """Inclui (ou substitui) uma etapa na máquina de estados."""
+    ETAPAS[nome] = Etapa(tratar, dict(transicoes))
+
+
+registrar_etapa('aguardando_categoria', _apresentar_categorias, {
+    'menu': 'aguardando_escolha_categoria',
+    'sem_categorias': 'aguardando_categoria',
+})
+registrar_etapa('aguardando_escolha_categoria', _escolher_categoria, {
+    'escolhida': 'aguardando_escolha_material',
+    'sem_materiais': 'aguardando_categoria',
+    'ambigua': 'aguardando_escolha_categoria',
+    'nao_entendi': 'aguardando_escolha_categoria',
+})
+registrar_etapa('aguardando_escolha_material', _escolher_material, {
+    'escolhido': 'aguardando_estado',
+    'pagina': 'aguardando_escolha_material',
+    'ambiguo': 'aguardando_escolha_material',
+    'nao_entendi': 'aguardando_escolha_material',
+})
+registrar_etapa('aguardando_estado', _escolher_estado, {
+    'resultados': 'finalizou_consulta',
+    'sem_resultados': 'aguardando_estado',
+    'perguntar_mg': 'aguardando_especificacao_mg',
+    'nao_entendi': 'aguardando_estado',
+})
+registrar_etapa('aguardando_especificacao_mg', _especificar_mg, {
+    'resultados': 'finalizou_consulta',
+    'sem_resultados': 'aguardando_estado',
+    'sem_material': 'aguardando_categoria',
+    'nao_entendi': 'aguardando_especificacao_mg',
+})
+registrar_etapa('finalizou_consulta', _finalizar_consulta, {
+    'regiao': 'finalizou_consulta',
+    'nova': 'aguardando_categoria',
+    'encerrar': 'fim',
+    'nao_entendi': 'finalizou_consulta',
+})
+
+
+def _pediu_reinicio(texto):
+    return "reiniciar" in texto or "começar de novo" in texto
+
+
+# Função Principal para a Lógica do Bot
 def processar_mensagem_chatbot(mensagem_usuario, chat_state):
-    conn = conectar_db()
-    cursor = conn.cursor()
-
-    resposta_bot = ""
-    mensagem_usuario_lower = mensagem_usuario.lower().strip()
-
-    current_stage = chat_state.get('stage', 'aguardando_categoria')
-    selected_category = chat_state.get('selected_category')
-    selected_material = chat_state.get('selected_material')
-    selected_state = chat_state.get('selected_state') 
-    available_materials = chat_state.get('available_materials', [])
-    available_categories = chat_state.get('available_categories', [])
-    
-    mg_subdivisions = ["minas gerais (betim)", "minas gerais (extrema)"]
-    chat_state['mg_subdivisions'] = mg_subdivisions
-
-    # Mapeamento de estados
-    mapeamento_estados = {
-        "sp": "são paulo", "são paulo": "são paulo",
-        "ba": "bahia", "bahia": "bahia",
-        "rj": "rio de janeiro", "rio de janeiro": "rio de janeiro",
-        "mg": "minas gerais", # Genérico para desambiguação
-        "minas gerais": "minas gerais", # Genérico para desambiguação
-        "minas gerais (extrema)": "minas gerais (extrema)",
-        "extrema": "minas gerais (extrema)",
-        "minas gerais (betim)": "minas gerais (betim)",
-        "betim": "minas gerais (betim)",
-        "rs": "rio grande do sul", "rio grande do sul": "rio grande do sul",
-        "sc": "santa catarina", "santa catarina": "santa catarina",
-        "df": "distrito federal", "distrito federal": "distrito federal",
-        "pe": "pernambuco", "pernambuco": "pernambuco",
-        "ce": "ceará", "ceara": "ceará",
-    }
-    
-    estados_conhecidos_db = [s[0].lower() for s in cursor.execute("SELECT DISTINCT estado FROM fornecedores").fetchall()]
-    for estado_db in estados_conhecidos_db:
-        if estado_db not in mapeamento_estados:
-            mapeamento_estados[estado_db] = estado_db
-
-    if current_stage == 'fim':
-        conn.close()
-        return chat_state.get('last_reply', "Até logo!"), chat_state
-
-    # Lógica para reiniciar a conversa a qualquer momento
-    if "reiniciar" in mensagem_usuario_lower or "começar de novo" in mensagem_usuario_lower:
-        resposta_bot = "Entendido! Vamos reiniciar a conversa."
+    etapa_atual = chat_state.get('stage', 'aguardando_categoria')
+    inicio = time.perf_counter()
+    resposta_bot = _processar_turno(mensagem_usuario, chat_state, etapa_atual)
+    metricas.observar("chat_etapa_segundos", time.perf_counter() - inicio, etapa=etapa_atual)
+    metricas.incrementar("chat_transicoes_total", de=etapa_atual, para=chat_state.get('stage', etapa_atual))
+    return resposta_bot, chat_state
+
+
+def _processar_turno(mensagem_usuario, chat_state, etapa_atual):
+    if etapa_atual == 'fim':
+        return chat_state.get('last_reply', respostas.ATE_LOGO)
+
+    turno = Turno(mensagem_usuario, chat_state, obter_catalogo())
+
+    # Reiniciar vale em qualquer etapa
+    if _pediu_reinicio(turno.texto):
         chat_state['stage'] = 'aguardando_categoria'
-        chat_state['selected_category'] = None
-        chat_state['selected_material'] = None
-        chat_state['selected_state'] = None
-        chat_state['available_materials'] = []
-        chat_state['available_categories'] = []
-        chat_state['initial_greeting_sent'] = True # para evitar saudação duplicada
-        
-        categorias_atuais = listar_categorias(cursor)
-        if categorias_atuais:
-            resposta_bot += "\n\nPor favor, escolha uma categoria:"
-            resposta_bot += "\n"
-            for i, cat in enumerate(categorias_atuais):
-                resposta_bot += f"\n{i+1}. {cat.capitalize()}"
-            chat_state['available_categories'] = [c.lower() for c in categorias_atuais]
-        else:
-            resposta_bot += "\n\nNão encontrei categorias disponíveis no momento."
-        conn.close()
-        return resposta_bot, chat_state
-
-    if current_stage == 'finalizou_consulta':
-        if "sim" in mensagem_usuario_lower:
-            chat_state['stage'] = 'aguardando_categoria'
-            chat_state['selected_category'] = None
-            chat_state['selected_material'] = None
-            chat_state['selected_state'] = None
-            chat_state['available_materials'] = []
-            chat_state['available_categories'] = []
-            chat_state['initial_greeting_sent'] = True # para evitar saudação duplicada
-            
-            # A resposta para "sim" será apenas a instrução para a nova consulta
-            resposta_bot = "Certo! Vamos começar uma nova consulta."
-            categorias = listar_categorias(cursor)
-            if categorias:
-                resposta_bot += "\n\nPor favor, escolha uma categoria:"
-                resposta_bot += "\n"
-                for i, cat in enumerate(categorias):
-                    resposta_bot += f"\n{i+1}. {cat.capitalize()}"
-                chat_state['available_categories'] = [c.lower() for c in categorias]
-            else:
-                resposta_bot += "\n\nNão encontrei categorias disponíveis no momento."
-            
-            conn.close()
-            return resposta_bot, chat_state 
-
-        elif "não" in mensagem_usuario_lower:
-            resposta_bot = "Obrigado por usar o MeliBuy! Até mais 👋"
-            chat_state['stage'] = 'fim'
-            chat_state['last_reply'] = resposta_bot
-            conn.close()
-            return resposta_bot, chat_state
-
-        else:
-            resposta_bot = "Não entendi sua resposta. Por favor, digite 'sim' para nova consulta ou 'não' para encerrar."
-            conn.close()
-            return resposta_bot, chat_state
-
-    # Lógica para especificação de Minas Gerais Betim/Extrema
-    elif current_stage == 'aguardando_especificacao_mg':
-        especificacao_encontrada = None
-        if "betim" in mensagem_usuario_lower:
-            especificacao_encontrada = "minas gerais (betim)"
-        elif "extrema" in mensagem_usuario_lower:
-            especificacao_encontrada = "minas gerais (extrema)"
-        
-        if especificacao_encontrada:
-            chat_state['selected_state'] = especificacao_encontrada
-            
-            material_encontrado = chat_state.get('selected_material')
-            if material_encontrado:
-                resultados = consultar_fornecedores(cursor, material_encontrado, especificacao_encontrada)
-                if resultados:
-                    resposta_bot = "Aqui estão os melhores fornecedores:\n\n"
-                    for i, r in enumerate(resultados, 1):
-                        resposta_bot += f"{i}. {r[0]} – R$ {r[5]:.4f} (Cod Forn: {r[2]}, Cod Mat: {r[4]})\n"
-                    resposta_bot += "\n\n🎯 Deseja fazer outra consulta? Digite 'sim' ou 'não'."
-                    chat_state['stage'] = 'finalizou_consulta'
-                else:
-                    resposta_bot = "Nenhum fornecedor encontrado para esse insumo em " + especificacao_encontrada.capitalize() + "."
-                    resposta_bot += "\n\nPor favor, tente outro estado ou diga 'reiniciar' para uma nova consulta."
-                    chat_state['stage'] = 'aguardando_estado'
-            else:
-                resposta_bot = "Houve um erro. Por favor, reinicie a conversa."
-                chat_state['stage'] = 'aguardando_categoria'
-        else:
-            resposta_bot = "Não entendi a sua especificação. Por favor, digite 'Betim' ou 'Extrema'."
-            chat_state['stage'] = 'aguardando_especificacao_mg' 
-
-    # Lógica principal baseada nos demais estágios da conversa
-    elif current_stage == 'aguardando_categoria': # Responsável em apresentar a lista de categorias
-        if chat_state.get('initial_greeting_sent', False) == False:
-            resposta_bot = "Olá! Sou MeliBuy, vou te ajudar a encontrar o melhor fornecedor para sua negociação."
-            chat_state['initial_greeting_sent'] = True
-        
-        elif "olá" in mensagem_usuario_lower or "oi" in mensagem_usuario_lower or "ola" in mensagem_usuario_lower:
-             resposta_bot = "Olá! Sou MeliBuy, vou te ajudar a encontrar o melhor fornecedor para sua negociação."
-  
-        if "escolha uma categoria" not in resposta_bot.lower():
-            resposta_bot += "\n\nPara começar, por favor, escolha uma categoria:"
-            resposta_bot += "\n" # Quebra de linha
-            
-        categorias = listar_categorias(cursor)
-        if categorias:
-            for i, cat in enumerate(categorias):
-                resposta_bot += f"\n{i+1}. {cat.capitalize()}"
-            chat_state['stage'] = 'aguardando_escolha_categoria'
-            chat_state['available_categories'] = [c.lower() for c in categorias]
-        else:
-            resposta_bot = "Não encontrei categorias disponíveis no momento. Por favor, tente novamente mais tarde."
-            chat_state['stage'] = 'aguardando_categoria'
-    
-    elif current_stage == 'aguardando_escolha_categoria': # Responsável pela lógica do input categoria do user
-        categorias = chat_state.get('available_categories', [])
-        
-        categoria_encontrada = None
-        if mensagem_usuario_lower.isdigit():
-            indice = int(mensagem_usuario_lower) - 1
-            if 0 <= indice < len(categorias):
-                categoria_encontrada = categorias[indice]
-        else:
-            for cat in categorias:
-                if mensagem_usuario_lower in cat:
-                    categoria_encontrada = cat
-                    break
-        
-        if categoria_encontrada:
-            selected_category = categoria_encontrada
-            chat_state['selected_category'] = selected_category
-            
-            materiais = listar_materiais_por_categoria(cursor, selected_category)
-            if materiais:
-                available_materials = [m.lower() for m in materiais]
-                chat_state['available_materials'] = available_materials
-                resposta_bot = f"Ótimo! Você escolheu a categoria '{selected_category.capitalize()}'. Agora, qual insumo você procura?"
-                resposta_bot += "\n"
-                for i, mat in enumerate(materiais):
-                    resposta_bot += f"\n{i+1}. {mat.capitalize()}"
-                chat_state['stage'] = 'aguardando_escolha_material'
-            else:
-                resposta_bot = f"Não encontrei insumos para a categoria '{selected_category.capitalize()}'. Por favor, escolha outra categoria."
-                chat_state['stage'] = 'aguardando_categoria'
-                categorias_atuais = listar_categorias(cursor)
-                if categorias_atuais:
-                    resposta_bot += "\n\nPor favor, escolha uma categoria:"
-                    resposta_bot += "\n"
-                    for i, cat in enumerate(categorias_atuais):
-                        resposta_bot += f"\n{i+1}. {cat.capitalize()}"
-                    chat_state['available_categories'] = [c.lower() for c in categorias_atuais]
-                else:
-                    resposta_bot += "\n\nNão encontrei categorias disponíveis no momento."
-        else:
-            resposta_bot = "Não entendi sua escolha de categoria. Por favor, digite o número ou o nome da categoria que deseja."
-            chat_state['stage'] = 'aguardando_escolha_categoria' 
-
-    elif current_stage == 'aguardando_escolha_material': # Responsável pela lógica do input material do user
-        materiais = chat_state.get('available_materials', [])
-        material_encontrado = None
-
-        if mensagem_usuario_lower.isdigit():
-            indice = int(mensagem_usuario_lower) - 1
-            if 0 <= indice < len(materiais):
-                material_encontrado = materiais[indice]
-        else:
-            for mat in materiais:
-                if mensagem_usuario_lower in mat:
-                    material_encontrado = mat
-                    break
-
-        if material_encontrado:
-            chat_state['selected_material'] = material_encontrado
-            resposta_bot = f"Você escolheu '{material_encontrado.capitalize()}'. Agora, para qual estado você precisa consultar?"
-            resposta_bot += "\nEx: SP, São Paulo, BA, Bahia, etc."
-            chat_state['stage'] = 'aguardando_estado'
-        else:
-            resposta_bot = "Não entendi o insumo que você escolheu. Por favor, digite o número ou o nome do insumo na lista."
-            chat_state['stage'] = 'aguardando_escolha_material' 
-
-    elif current_stage == 'aguardando_estado': # Responsável pela lógica do input estado do user
-        material_encontrado = chat_state.get('selected_material')
-        estado_encontrado = None
-
-        if "betim" in mensagem_usuario_lower:
-            estado_encontrado = "minas gerais (betim)"
-        elif "extrema" in mensagem_usuario_lower:
-            estado_encontrado = "minas gerais (extrema)"
-        else:
-            for est_key, est_full in mapeamento_estados.items():
-                if est_key in mensagem_usuario_lower:
-                    estado_encontrado = est_full
-                    break
-        
-        if estado_encontrado == "minas gerais":
-            has_betim = "minas gerais (betim)" in estados_conhecidos_db
-            has_extrema = "minas gerais (extrema)" in estados_conhecidos_db
-
-            if has_betim and has_extrema:
-                resposta_bot = "Para Minas Gerais, você se refere a Betim ou Extrema?"
-                chat_state['stage'] = 'aguardando_especificacao_mg'
-                conn.close()
-                return resposta_bot, chat_state
-            elif has_betim:
-                estado_encontrado = "minas gerais (betim)"
-            elif has_extrema:
-                estado_encontrado = "minas gerais (extrema)"
-
-        if material_encontrado and estado_encontrado:
-            resultados = consultar_fornecedores(cursor, material_encontrado, estado_encontrado)
-            if resultados:
-                resposta_bot = "Aqui estão os melhores fornecedores:\n\n"
-                for i, r in enumerate(resultados, 1):
-                    resposta_bot += f"{i}. {r[0]} – R$ {r[5]:.4f} (Cod Forn: {r[2]}, Cod Mat: {r[4]})\n"
-                resposta_bot += "\n\n🎯 Deseja fazer outra consulta? Digite 'sim' ou 'não'."
-                chat_state['stage'] = 'finalizou_consulta'
-            else:
-                resposta_bot = "Nenhum fornecedor encontrado para esse insumo em " + estado_encontrado.capitalize() + "."
-                resposta_bot += "\n\nPor favor, tente outro estado ou diga 'reiniciar' para uma nova consulta."
-                chat_state['stage'] = 'aguardando_estado'
-        else:
-            resposta_bot = "Não consegui identificar o estado. Por favor, digite o nome completo ou a sigla do estado (Ex: SP, São Paulo)."
-            chat_state['stage'] = 'aguardando_estado' 
-            
-    conn.close()
-    return resposta_bot, chat_state
\ No newline at end of file
+        _limpar_selecao(chat_state)
+        return turno.respostas.reinicio
+
+    etapa = ETAPAS.get(etapa_atual)
+    if etapa is None:
+        return ""
+    resultado, resposta_bot = etapa.tratar(turno)
+    chat_state['stage'] = etapa.transicoes[resultado]
+    return resposta_bot
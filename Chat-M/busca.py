@@ -0,0 +1,155 @@
+import heapq
+import threading
+
+from estados import tokenizar
+
+# -----------------------------------------------------------------------------
+# Busca de categorias e materiais por nome
+# -----------------------------------------------------------------------------
+# As etapas de escolha de categoria/material pegavam o primeiro item da lista
+# que contivesse o texto digitado: lento em catálogos grandes e com resultado
+# arbitrário. O índice abaixo guarda listas invertidas de trigramas (por
+# palavra, com preenchimento à moda do pg_trgm) sobre os nomes sem acento e
+# classifica os resultados em faixas:
+#
+#   0 - igual        "cimento"  == "cimento"
+#   1 - prefixo      "tubo"     -> "tubo pvc 100mm"
+#   2 - trecho       "lavada"   -> "areia lavada m³"
+#   3 - aproximado   "cimeto"   -> "cimento cp-ii 50kg" (similaridade de trigramas)
+#
+# Dentro da mesma faixa, nomes mais curtos (e depois a ordem original) vêm
+# primeiro. Os índices são montados uma vez por snapshot do catálogo.
+
+IGUAL, PREFIXO, TRECHO, APROXIMADO = range(4)
+SIMILARIDADE_MINIMA = 0.3
+MAX_CANDIDATOS = 5
+
+
+def _trigramas(texto_dobrado):
+    grams = set()
+    for palavra in texto_dobrado.split():
+        preenchida = "  " + palavra + " "
+        for i in range(len(preenchida) - 2):
+            grams.add(preenchida[i:i + 3])
+    return grams
+
+
+class IndiceBusca:
+    """Índice de trigramas sobre uma lista fixa de nomes."""
+
+    def __init__(self, nomes):
+        self.nomes = tuple(nomes)
+        self._dobrados = tuple(" ".join(tokenizar(n)) for n in self.nomes)
+        self._grams = []
+        self._postings = {}
+        self._exatos = {}
+        for pos, dobrado in enumerate(self._dobrados):
+            grams = _trigramas(dobrado)
+            self._grams.append(len(grams))
+            for gram in grams:
+                self._postings.setdefault(gram, []).append(pos)
+            self._exatos.setdefault(dobrado, pos)
+
+    def buscar(self, consulta, limite=MAX_CANDIDATOS):
+        """
+        Lista de (faixa, nome) ordenada do melhor para o pior.
+        """
+        dobrado = " ".join(tokenizar(consulta))
+        if not dobrado or dobrado.replace(" ", "").isdigit():
+            return []  # só número (ex.: "-1", "#2") é posição na lista, não nome
+
+        exato = self._exatos.get(dobrado)
+        if exato is not None:
+            return [(IGUAL, self.nomes[exato])]
+
+        resultados = self._por_trecho(dobrado)
+        if not resultados:
+            resultados = self._aproximados(dobrado)
+        melhores = heapq.nsmallest(limite, resultados)
+        return [(faixa, self.nomes[pos]) for faixa, _, _, pos in melhores]
+
+    def _por_trecho(self, dobrado):
+        # Quem contém a consulta contém todos os trigramas internos dela (sem
+        # o preenchimento), então basta intersectar as listas, da menor para
+        # a maior, e conferir o trecho só nos poucos que sobrarem.
+        internos = [g for g in _trigramas(dobrado) if " " not in g]
+        if not internos:
+            # consulta curta (1-2 letras): só faz sentido como começo de palavra
+            internos = ["  " + dobrado[:1]] if len(dobrado) == 1 else [" " + dobrado[:2]]
+        listas = sorted((self._postings.get(g, ()) for g in internos), key=len)
+        if not listas[0]:
+            return []
+        candidatos = set(listas[0])
+        for lista in listas[1:]:
+            candidatos.intersection_update(lista)
+            if not candidatos:
+                return []
+
+        resultados = []
+        for pos in candidatos:
+            nome_dobrado = self._dobrados[pos]
+            if nome_dobrado.startswith(dobrado):
+                resultados.append((PREFIXO, 0.0, len(nome_dobrado), pos))
+            elif dobrado in nome_dobrado:
+                resultados.append((TRECHO, 0.0, len(nome_dobrado), pos))
+        return resultados
+
+    def _aproximados(self, dobrado):
+        grams_consulta = _trigramas(dobrado)
+        compartilhados = {}
+        for gram in grams_consulta:
+            for pos in self._postings.get(gram, ()):
+                compartilhados[pos] = compartilhados.get(pos, 0) + 1
+
+        resultados = []
+        for pos, comuns in compartilhados.items():
+            similaridade = comuns / (len(grams_consulta) + self._grams[pos] - comuns)
+            if similaridade >= SIMILARIDADE_MINIMA:
+                resultados.append((APROXIMADO, -similaridade, len(self._dobrados[pos]), pos))
+        return resultados
+
+    def escolher(self, consulta, limite=MAX_CANDIDATOS):
+        """
+        Retorna (escolhido, candidatos).
+        escolhido é o nome quando há um único melhor resultado; caso contrário
+        é None e candidatos traz as opções empatadas na melhor faixa.
+        """
+        resultados = self.buscar(consulta, limite + 1)
+        if not resultados:
+            return None, []
+        melhor_faixa = resultados[0][0]
+        empatados = [nome for faixa, nome in resultados if faixa == melhor_faixa]
+        if len(empatados) == 1:
+            return empatados[0], []
+        return None, empatados[:limite]
+
+
+_cache = (None, {})  # (snapshot do catálogo, {chave: IndiceBusca})
+_cache_lock = threading.Lock()
+
+
+def _indice(catalogo, chave, nomes_fn):
+    global _cache
+    compilado_para, indices = _cache
+    if compilado_para is catalogo and chave in indices:
+        return indices[chave]
+    with _cache_lock:
+        compilado_para, indices = _cache
+        if compilado_para is not catalogo:
+            indices = {}
+            _cache = (catalogo, indices)
+        if chave not in indices:
+            indices[chave] = IndiceBusca(nomes_fn())
+        return indices[chave]
+
+
+def indice_categorias(catalogo):
+    """Índice sobre as categorias (em minúsculas, como no estado do chat)."""
+    return _indice(catalogo, None, lambda: [c.lower() for c in catalogo.categorias])
+
+
+def indice_materiais(catalogo, categoria):
+    """Índice sobre os materiais de uma categoria (em minúsculas)."""
+    chave = ("materiais", (categoria or "").lower())
+    return _indice(catalogo, chave, lambda: [m.lower() for m in catalogo.materiais(categoria)])
+
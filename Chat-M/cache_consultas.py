@@ -0,0 +1,115 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# -----------------------------------------------------------------------------
+# Cache de consultas do chat com coalescência (single-flight)
+# -----------------------------------------------------------------------------
+# No horário de pico muitos usuários pedem o mesmo insumo no mesmo estado ao
+# mesmo tempo, e cada turno em aguardando_estado/aguardando_especificacao_mg
+# consultava os fornecedores e formatava a mesma resposta. Aqui o resultado
+# fica guardado pela chave normalizada (material, estado, N) junto com a
+# versão dos preços daquela chave (indice_precos.versao_precos); se a versão
+# mudou ou o TTL venceu, a entrada é descartada.
+#
+# Coalescência: se a chave não está no cache e outra thread já está
+# calculando o mesmo resultado (mesma chave e versão), a thread espera por
+# ela em vez de repetir a consulta. Só a primeira (a "líder") executa.
+#
+#   CONSULTAS_CACHE            "0" desliga o cache (padrão: ligado)
+#   CONSULTAS_CACHE_TTL_S      validade de uma entrada (padrão: 30)
+#   CONSULTAS_CACHE_MAX_ITENS  limite do LRU (padrão: 10000)
+
+HABILITADO = os.environ.get("CONSULTAS_CACHE", "1") != "0"
+TTL_S = float(os.environ.get("CONSULTAS_CACHE_TTL_S", 30))
+MAX_ITENS = int(os.environ.get("CONSULTAS_CACHE_MAX_ITENS", 10000))
+
+
+class _EmAndamento:
+    """Resultado de uma consulta em execução, aguardado pelas coalescidas."""
+    __slots__ = ("pronto", "valor", "erro")
+
+    def __init__(self):
+        self.pronto = threading.Event()
+        self.valor = None
+        self.erro = None
+
+
+class CacheCoalescente:
+    def __init__(self, max_itens=MAX_ITENS, ttl_s=TTL_S, habilitado=HABILITADO):
+        self.max_itens = max_itens
+        self.ttl_s = ttl_s
+        self.habilitado = habilitado
+        self._itens = OrderedDict()  # chave -> (versao, expira_em, valor)
+        self._em_andamento = {}      # (chave, versao) -> _EmAndamento
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "coalescidas": 0, "expiradas": 0,
+                       "invalidadas": 0, "despejadas": 0, "erros": 0}
+
+    def obter(self, chave, versao, produzir):
+        """
+        Valor de `chave` na `versao`; em caso de miss chama produzir() uma
+        única vez, mesmo com várias threads pedindo a mesma chave ao mesmo tempo.
+        """
+        if not self.habilitado:
+            return produzir()
+        agora = time.monotonic()
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is not None:
+                if item[0] == versao and item[1] > agora:
+                    self._itens.move_to_end(chave)
+                    self._stats["hits"] += 1
+                    return item[2]
+                del self._itens[chave]
+                self._stats["invalidadas" if item[0] != versao else "expiradas"] += 1
+            voo = self._em_andamento.get((chave, versao))
+            lider = voo is None
+            if lider:
+                voo = self._em_andamento[(chave, versao)] = _EmAndamento()
+                self._stats["misses"] += 1
+            else:
+                self._stats["coalescidas"] += 1
+
+        if not lider:
+            voo.pronto.wait()
+            if voo.erro is not None:
+                raise voo.erro
+            return voo.valor
+
+        try:
+            voo.valor = produzir()
+        except BaseException as exc:
+            voo.erro = exc
+            raise
+        finally:
+            with self._lock:
+                del self._em_andamento[(chave, versao)]
+                if voo.erro is None:
+                    self._itens[chave] = (versao, time.monotonic() + self.ttl_s, voo.valor)
+                    self._itens.move_to_end(chave)
+                    while len(self._itens) > self.max_itens:
+                        self._itens.popitem(last=False)
+                        self._stats["despejadas"] += 1
+                else:
+                    self._stats["erros"] += 1
+            voo.pronto.set()
+        return voo.valor
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+    def estatisticas(self):
+        with self._lock:
+            dados = dict(self._stats)
+            dados["itens"] = len(self._itens)
+            dados["em_andamento"] = len(self._em_andamento)
+        pedidos = dados["hits"] + dados["misses"] + dados["coalescidas"]
+        # fração dos pedidos atendidos sem executar a consulta
+        dados["taxa_coalescencia"] = round((dados["hits"] + dados["coalescidas"]) / pedidos, 4) if pedidos else 0.0
+        return dados
+
+
+consultas = CacheCoalescente()
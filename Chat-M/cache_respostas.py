@@ -0,0 +1,174 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+
+from catalogo import obter_catalogo
+
+# -----------------------------------------------------------------------------
+# Cache HTTP das rotas de leitura do catálogo
+# -----------------------------------------------------------------------------
+# /categorias, /materiais e /fornecedores só mudam quando a base muda, mas
+# cada chamada recalculava e serializava o JSON. Aqui guardamos o corpo já
+# serializado (bytes), indexado por rota + parâmetros normalizados, num LRU
+# limitado por bytes. Cada entrada carrega a versão do catálogo em que foi
+# gerada; se a versão mudou, a entrada é descartada na leitura.
+#
+# Uma gravação de preço não muda a versão do catálogo: /fornecedores passa a
+# versão da própria chave (material, estado) no índice de preços, então só as
+# respostas das chaves alteradas expiram.
+#
+# As respostas levam ETag forte (hash do corpo), Last-Modified (mtime da base)
+# e Cache-Control, e condicionais (If-None-Match / If-Modified-Since) recebem
+# 304 sem corpo.
+#
+#   RESPONSE_CACHE_MAX_BYTES  limite de memória do cache (padrão: 32 MiB)
+#   RESPONSE_CACHE_MAX_AGE    max-age do Cache-Control em segundos (padrão: 60)
+
+MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+MAX_AGE = int(os.environ.get("RESPONSE_CACHE_MAX_AGE", 60))
+
+# Parâmetros que influenciam cada rota; os demais não entram na chave.
+PARAMETROS_POR_ROTA = {
+    "categorias": (),
+    "materiais": ("categoria", "limite", "cursor"),
+    "fornecedores": ("material", "estado", "n", "criterio", "raio_km"),
+}
+
+
+class EntradaCache:
+    __slots__ = ("versao", "status", "corpo", "etag", "last_modified", "tamanho")
+
+    def __init__(self, versao, status, corpo, last_modified):
+        self.versao = versao
+        self.status = status
+        self.corpo = corpo
+        self.etag = '"' + hashlib.sha1(corpo).hexdigest() + '"'
+        self.last_modified = last_modified
+        self.tamanho = len(corpo) + 200  # corpo + sobrecarga aproximada da entrada
+
+
+class CacheRespostas:
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._itens = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "expiradas": 0, "despejadas": 0, "nao_modificado": 0}
+
+    def obter(self, chave, versao):
+        with self._lock:
+            entrada = self._itens.get(chave)
+            if entrada is not None and entrada.versao != versao:
+                self._remover(chave)
+                self._stats["expiradas"] += 1
+                entrada = None
+            if entrada is None:
+                self._stats["misses"] += 1
+                return None
+            self._itens.move_to_end(chave)
+            self._stats["hits"] += 1
+            return entrada
+
+    def guardar(self, chave, entrada):
+        if entrada.tamanho > self.max_bytes // 8:
+            return  # respostas enormes não ocupam o cache
+        with self._lock:
+            self._remover(chave)
+            self._itens[chave] = entrada
+            self._bytes += entrada.tamanho
+            while self._bytes > self.max_bytes and self._itens:
+                antiga, _ = next(iter(self._itens.items()))
+                self._remover(antiga)
+                self._stats["despejadas"] += 1
+
+    def _remover(self, chave):
+        entrada = self._itens.pop(chave, None)
+        if entrada is not None:
+            self._bytes -= entrada.tamanho
+
+    def registrar_304(self):
+        with self._lock:
+            self._stats["nao_modificado"] += 1
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+            self._bytes = 0
+
+    def estatisticas(self):
+        with self._lock:
+            dados = dict(self._stats)
+            dados["itens"] = len(self._itens)
+            dados["bytes"] = self._bytes
+            dados["max_bytes"] = self.max_bytes
+        return dados
+
+
+cache = CacheRespostas()
+
+
+def chave_cache(rota, args):
+    """Rota + parâmetros relevantes normalizados (sem espaços, minúsculos)."""
+    return (rota,) + tuple(
+        (args.get(nome) or "").strip().lower() for nome in PARAMETROS_POR_ROTA[rota]
+    )
+
+
+def _ultima_modificacao(versao):
+    mtimes = [parte[1] for parte in versao if parte is not None]
+    return formatdate(max(mtimes) / 1e9, usegmt=True) if mtimes else None
+
+
+def _agora(_versao):
+    return formatdate(time.time(), usegmt=True)
+
+
+def _nao_modificado(entrada, if_none_match, if_modified_since):
+    if if_none_match:
+        etags = [e.strip() for e in if_none_match.split(",")]
+        return "*" in etags or entrada.etag in etags
+    if if_modified_since and entrada.last_modified:
+        try:
+            return parsedate_to_datetime(entrada.last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def responder(rota, args, produzir, serializar, publico=True,
+              if_none_match=None, if_modified_since=None, versao=None):
+    """
+    Resolve uma rota de leitura pelo cache.
+    produzir(): (payload, status) em caso de miss; serializar(payload): str.
+    versao: versão própria da resposta (padrão: a do catálogo); nesse caso o
+    Last-Modified é o momento em que a resposta foi gerada.
+    Retorna (status, corpo_bytes, headers) prontos para o framework HTTP.
+    """
+    if versao is None:
+        versao = obter_catalogo().versao
+        last_modified = _ultima_modificacao
+    else:
+        last_modified = _agora
+    chave = chave_cache(rota, args)
+    entrada = cache.obter(chave, versao)
+    if entrada is None:
+        payload, status = produzir()
+        corpo = serializar(payload).encode("utf-8")
+        if status != 200:
+            return status, corpo, []
+        entrada = EntradaCache(versao, status, corpo, last_modified(versao))
+        cache.guardar(chave, entrada)
+
+    headers = [
+        ("ETag", entrada.etag),
+        ("Cache-Control", f"{'public' if publico else 'private'}, max-age={MAX_AGE}"),
+    ]
+    if entrada.last_modified:
+        headers.append(("Last-Modified", entrada.last_modified))
+    if _nao_modificado(entrada, if_none_match, if_modified_since):
+        cache.registrar_304()
+        return 304, b"", headers
+    return entrada.status, entrada.corpo, headers
@@ -0,0 +1,180 @@
+import os
+import threading
+
+import metricas
+import mudancas
+import paginacao
+from db_pool import obter_pool
+
+# -----------------------------------------------------------------------------
+# Snapshot do catálogo (categorias, materiais e estados)
+# -----------------------------------------------------------------------------
+# Categorias, materiais e estados só mudam quando a base é recarregada, mas
+# eram consultados no SQLite a cada turno do chat. Aqui o catálogo é lido uma
+# vez para estruturas imutáveis (tuplas e dicts) e servido da memória.
+#
+# Invalidação: a cada acesso comparamos um "carimbo de versão" barato do
+# arquivo (inode, mtime e tamanho do .db e do -wal). Se mudou, um novo snapshot
+# é montado por completo e só então publicado numa única atribuição; quem já
+# pegou o snapshot anterior continua usando-o até o fim da requisição.
+#
+# Gravações de preço (escrita_precos.py) também mudam o carimbo, mas não o
+# catálogo: se o arquivo é o mesmo e o feed de mudanças (mudancas.py) só tem
+# preços desde a última leitura, o snapshot (e a sua versão, usada pelo cache
+# de respostas) é mantido.
+#
+# Com um snapshot binário ativo (catalogo_mmap.py), a fonte passa a ser o
+# arquivo mapeado em memória em vez do SQLite; o carimbo é o do arquivo.
+
+
+class CatalogoSnapshot:
+    """Visão imutável do catálogo numa versão da base."""
+
+    __slots__ = ("versao", "categorias", "materiais_por_categoria", "estados",
+                 "material_por_id", "id_por_material", "ids_por_categoria")
+
+    def __init__(self, versao, categorias, materiais_por_categoria, estados,
+                 material_por_id=None, id_por_material=None, ids_por_categoria=None):
+        self.versao = versao
+        self.categorias = categorias                            # tuple[str], ordem da base
+        self.materiais_por_categoria = materiais_por_categoria  # {categoria.lower(): tuple[str]}
+        self.estados = estados                                  # tuple[str], minúsculos
+        self.material_por_id = material_por_id or {}            # {id: nome}
+        self.id_por_material = id_por_material or {}            # {nome.lower(): id}
+        self.ids_por_categoria = ids_por_categoria or {}        # {categoria.lower(): tuple[int]}, paralela
+
+    def materiais(self, categoria):
+        return self.materiais_por_categoria.get((categoria or "").lower(), ())
+
+    def pagina_materiais(self, categoria, limite, cursor=None):
+        """
+        Uma página (keyset por id) dos materiais da categoria:
+        (inicio, nomes, proximo, anterior). ValueError se o cursor for inválido.
+        """
+        chave = (categoria or "").lower()
+        nomes = self.materiais_por_categoria.get(chave, ())
+        inicio, fim, proximo, anterior = paginacao.pagina(
+            self.ids_por_categoria.get(chave, ()), limite, cursor, escopo=chave)
+        return inicio, nomes[inicio:fim], proximo, anterior
+
+
+def carimbo_versao(caminho):
+    """Carimbo barato (só os.stat) que muda quando o arquivo da base muda."""
+    partes = []
+    for arquivo in (caminho, caminho + "-wal"):
+        try:
+            st = os.stat(arquivo)
+        except FileNotFoundError:
+            partes.append(None)
+            continue
+        partes.append((st.st_ino, st.st_mtime_ns, st.st_size))
+    return tuple(partes)
+
+
+def carregar_catalogo(cursor, versao=None):
+    """Lê o catálogo inteiro do SQLite e monta um CatalogoSnapshot."""
+    # ORDER BY id reproduz a ordem de SELECT DISTINCT/SELECT sem índice.
+    cursor.execute("SELECT id, nome, categoria FROM materiais ORDER BY id")
+    materiais = cursor.fetchall()
+    cursor.execute("SELECT DISTINCT estado FROM fornecedores")
+    estados = [linha[0] for linha in cursor]
+    return montar_catalogo(materiais, estados, versao)
+
+
+def montar_catalogo(materiais, estados, versao=None):
+    """
+    CatalogoSnapshot a partir de (id, nome, categoria) em ordem de id e dos
+    estados distintos dos fornecedores, na ordem em que a base os devolve.
+    """
+    categorias = []
+    vistas = set()
+    materiais_por_categoria = {}
+    ids_por_categoria = {}
+    material_por_id = {}
+    id_por_material = {}
+
+    for material_id, nome, categoria in materiais:
+        material_por_id[material_id] = nome
+        id_por_material.setdefault((nome or "").lower(), material_id)
+        chave = (categoria or "").lower()
+        if categoria not in vistas:
+            vistas.add(categoria)
+            categorias.append(categoria)
+        materiais_por_categoria.setdefault(chave, []).append(nome)
+        ids_por_categoria.setdefault(chave, []).append(material_id)
+
+    return CatalogoSnapshot(
+        versao=versao,
+        categorias=tuple(categorias),
+        materiais_por_categoria={k: tuple(v) for k, v in materiais_por_categoria.items()},
+        estados=tuple(estado.lower() for estado in estados if estado is not None),
+        material_por_id=material_por_id,
+        id_por_material=id_por_material,
+        ids_por_categoria={k: tuple(v) for k, v in ids_por_categoria.items()},
+    )
+
+
+_estado = (None, None, None)  # (snapshot, último carimbo conferido, último seq do feed)
+_recarga_lock = threading.Lock()
+_fonte = None  # snapshot binário (catalogo_mmap.FonteMmap) ou None para o SQLite
+
+
+def definir_fonte(fonte):
+    """Passa a ler o catálogo de `fonte` (None volta para o SQLite)."""
+    global _fonte
+    _fonte = fonte
+    invalidar_catalogo()
+
+
+def mesmo_arquivo(versao_a, versao_b):
+    """True se os dois carimbos são do mesmo arquivo (mesmo inode do .db)."""
+    return versao_a[0] is not None and versao_b[0] is not None and versao_a[0][0] == versao_b[0][0]
+
+
+def obter_catalogo():
+    """
+    Retorna o snapshot atual, recarregando-o se a base mudou.
+    Em regime permanente custa um os.stat e nenhuma consulta SQL.
+    """
+    global _estado
+    fonte = _fonte
+    if fonte is not None:
+        versao = carimbo_versao(fonte.caminho)
+    else:
+        pool = obter_pool()
+        versao = carimbo_versao(pool.caminho)
+    atual, conferido, _ = _estado
+    if atual is not None and conferido == versao:
+        return atual
+
+    with _recarga_lock:
+        atual, conferido, seq = _estado
+        if atual is not None and conferido == versao:
+            return atual
+        if fonte is not None:
+            with metricas.cronometro("db_consulta_segundos", operacao="carregar_catalogo_mmap"):
+                novo = fonte.catalogo(versao)
+            _estado = (novo, versao, None)
+            return novo
+        conn = pool.obter()
+        try:
+            cursor = conn.cursor()
+            if atual is not None and seq is not None and mesmo_arquivo(atual.versao, versao):
+                # só preços mudaram: o snapshot continua valendo
+                mudou, seq_atual = mudancas.estrutura_mudou(cursor, seq)
+                if not mudou:
+                    _estado = (atual, versao, seq_atual)
+                    return atual
+            seq = mudancas.ultima_seq(cursor)  # antes da leitura: no máximo relê algo
+            with metricas.cronometro("db_consulta_segundos", operacao="carregar_catalogo"):
+                novo = carregar_catalogo(cursor, versao)
+        finally:
+            conn.close()
+        _estado = (novo, versao, seq)  # troca atômica
+        return novo
+
+
+def invalidar_catalogo():
+    """Força a recarga no próximo acesso."""
+    global _estado
+    _estado = (None, None, None)
@@ -0,0 +1,500 @@
+"""
+Snapshot binário do catálogo e do índice de preços, compartilhado via mmap.
+
+Cada worker do gunicorn montava o próprio catálogo e o próprio índice de
+preços a partir do SQLite, então a memória total crescia com o número de
+workers. Aqui o catálogo e os preços são gravados uma vez num arquivo
+compacto, de formato fixo, que todos os workers mapeiam em modo leitura: as
+páginas ficam no page cache do sistema e são compartilhadas entre processos,
+sem cópia. O mesmo arquivo pode ser copiado para outros nós.
+
+Formato (little-endian, seções alinhadas em 8 bytes):
+
+  cabeçalho   "<8sIIQII": mágico, versão do formato, nº de seções,
+              tamanho total do arquivo, CRC32 de tudo após o cabeçalho, 0
+  tabela      "<8sQQ" por seção: nome, offset, tamanho
+  META        JSON com origem, contagens e data de criação
+  STRDADOS    textos em UTF-8, concatenados
+  STROFF      Q[n+1]  início de cada texto em STRDADOS
+  FNOME FESTADO FCOD          I[]  fornecedores (ids de texto)
+  MID MNOME MCOD MCAT         q[]/I[]  materiais em ordem de id
+  ESTADOS     I[]  estados distintos (como a base devolve)
+  CHAVES      I[]  "material\\x1festado" em minúsculas, ordenadas por bytes
+  CHAVEOFF    Q[n+1]  primeira linha de cada chave
+  VALOR       d[]  preço (NaN para NULL), por linha
+  RFORN RMAT  I[]  fornecedor e material de cada linha
+
+As linhas de uma chave estão em ordem de preço (NULL primeiro, desempate
+pelo id do preço), igual ao índice em memória: top-N é só um fatiamento.
+Texto ausente (NULL) usa o id 0xFFFFFFFF.
+
+Uso:
+  python catalogo_mmap.py construir --db base_chatbot2.db --saida catalogo.mmap
+  python catalogo_mmap.py verificar catalogo.mmap
+
+Na aplicação, SNAPSHOT_PATH aponta para o arquivo; ele é aberto e validado
+na importação de app.py (ver ativar_do_ambiente e gunicorn.conf.py).
+"""
+import argparse
+import json
+import logging
+import math
+import mmap
+import os
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+
+import catalogo
+import indice_precos
+import metricas
+from catalogo import carimbo_versao, montar_catalogo
+from indice_precos import LIMITE_PADRAO, _ordem, normalizar_chave
+
+MAGICO = b"MELIMMAP"
+VERSAO_FORMATO = 1
+CABECALHO = "<8sIIQII"
+ENTRADA_SECAO = "<8sQQ"
+TAM_CABECALHO = 32
+TAM_ENTRADA = 24
+NULO = 0xFFFFFFFF
+SEPARADOR = "\x1f"
+
+# nome da seção -> typecode de array (None = bytes)
+SECOES = (
+    ("META", None), ("STRDADOS", None), ("STROFF", "Q"),
+    ("FNOME", "I"), ("FESTADO", "I"), ("FCOD", "I"),
+    ("MID", "q"), ("MNOME", "I"), ("MCOD", "I"), ("MCAT", "I"),
+    ("ESTADOS", "I"), ("CHAVES", "I"), ("CHAVEOFF", "Q"),
+    ("VALOR", "d"), ("RFORN", "I"), ("RMAT", "I"),
+)
+
+
+_log = logging.getLogger(__name__)
+
+
+class ErroSnapshot(Exception):
+    pass
+
+
+def _exigir_little_endian():
+    if sys.byteorder != "little":
+        raise ErroSnapshot("o snapshot binário só é suportado em máquinas little-endian")
+
+
+# --- construção -------------------------------------------------------------------
+class _Textos:
+    def __init__(self):
+        self.ids = {}
+        self.dados = bytearray()
+        self.offsets = array("Q", [0])
+
+    def id(self, texto):
+        if texto is None:
+            return NULO
+        texto = str(texto)
+        existente = self.ids.get(texto)
+        if existente is not None:
+            return existente
+        novo = self.ids[texto] = len(self.offsets) - 1
+        self.dados += texto.encode("utf-8")
+        self.offsets.append(len(self.dados))
+        return novo
+
+
+def construir(db, destino):
+    """
+    Lê a base SQLite `db` e grava o snapshot em `destino` (troca atômica).
+    Retorna o dict META gravado.
+    """
+    _exigir_little_endian()
+    inicio = time.perf_counter()
+    conn = sqlite3.connect("file:" + os.path.abspath(db) + "?mode=ro", uri=True)
+    try:
+        textos = _Textos()
+        secoes = {}
+
+        forn_idx = {}
+        fnome, festado, fcod = array("I"), array("I"), array("I")
+        forn_estado_lower = []
+        for fid, nome, estado, codigo in conn.execute("SELECT id, nome, estado, codigo FROM fornecedores"):
+            forn_idx[fid] = len(fnome)
+            fnome.append(textos.id(nome))
+            festado.append(textos.id(estado))
+            fcod.append(textos.id(codigo))
+            forn_estado_lower.append((estado or "").lower())
+
+        mat_idx = {}
+        mid, mnome, mcod, mcat = array("q"), array("I"), array("I"), array("I")
+        mat_nome_lower = []
+        for material_id, nome, codigo, categoria in conn.execute(
+                "SELECT id, nome, codigo, categoria FROM materiais ORDER BY id"):
+            mat_idx[material_id] = len(mid)
+            mid.append(material_id)
+            mnome.append(textos.id(nome))
+            mcod.append(textos.id(codigo))
+            mcat.append(textos.id(categoria))
+            mat_nome_lower.append((nome or "").lower())
+
+        estados = array("I", (textos.id(e) for (e,) in conn.execute("SELECT DISTINCT estado FROM fornecedores")))
+
+        # Linhas de preço em arrays compactos; a chave de cada linha vira um
+        # inteiro para a ordenação por balde (evita uma tupla por linha).
+        chave_id = {}
+        rchave, rforn, rmat, rvalor, rpreco = array("I"), array("I"), array("I"), array("d"), array("q")
+        for preco_id, fornecedor_id, material_id, valor in conn.execute(
+                "SELECT id, fornecedor_id, material_id, valor FROM precos"):
+            fi = forn_idx.get(fornecedor_id)
+            mi = mat_idx.get(material_id)
+            if fi is None or mi is None:
+                continue  # o JOIN original também descartaria
+            chave = (mat_nome_lower[mi], forn_estado_lower[fi])
+            ci = chave_id.get(chave)
+            if ci is None:
+                ci = chave_id[chave] = len(chave_id)
+            rchave.append(ci)
+            rforn.append(fi)
+            rmat.append(mi)
+            rvalor.append(math.nan if valor is None else float(valor))
+            rpreco.append(preco_id)
+    finally:
+        conn.close()
+
+    # Chaves em ordem de bytes UTF-8 (a mesma comparação usada na busca).
+    textos_chave = {ci: SEPARADOR.join(chave).encode("utf-8") for chave, ci in chave_id.items()}
+    ordem_chaves = sorted(chave_id.values(), key=textos_chave.__getitem__)
+    posicao = array("I", bytes(4 * len(ordem_chaves)))
+    for pos, ci in enumerate(ordem_chaves):
+        posicao[ci] = pos
+
+    contagem = array("Q", bytes(8 * (len(ordem_chaves) + 1)))
+    for ci in rchave:
+        contagem[posicao[ci] + 1] += 1
+    for i in range(1, len(contagem)):
+        contagem[i] += contagem[i - 1]
+    chaveoff = array("Q", contagem)
+
+    proximo = array("Q", contagem[:-1])
+    linhas = array("Q", bytes(8 * len(rchave)))
+    for i, ci in enumerate(rchave):
+        pos = posicao[ci]
+        linhas[proximo[pos]] = i
+        proximo[pos] += 1
+    del rchave, proximo, contagem
+
+    valor_out, forn_out, mat_out = array("d"), array("I"), array("I")
+    for pos in range(len(ordem_chaves)):
+        balde = linhas[chaveoff[pos]:chaveoff[pos + 1]].tolist()
+        balde.sort(key=lambda i: _ordem(None if math.isnan(rvalor[i]) else rvalor[i], rpreco[i]))
+        for i in balde:
+            valor_out.append(rvalor[i])
+            forn_out.append(rforn[i])
+            mat_out.append(rmat[i])
+
+    chaves = array("I", (textos.id(textos_chave[ci].decode("utf-8")) for ci in ordem_chaves))
+
+    st = os.stat(db)
+    meta = {
+        "formato": VERSAO_FORMATO,
+        "criado_em": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "origem": {"caminho": os.path.abspath(db), "tamanho": st.st_size, "mtime_ns": st.st_mtime_ns},
+        "fornecedores": len(fnome),
+        "materiais": len(mid),
+        "chaves": len(chaves),
+        "linhas": len(valor_out),
+        "textos": len(textos.offsets) - 1,
+    }
+    secoes.update({
+        "META": json.dumps(meta, ensure_ascii=False, sort_keys=True).encode("utf-8"),
+        "STRDADOS": bytes(textos.dados), "STROFF": textos.offsets,
+        "FNOME": fnome, "FESTADO": festado, "FCOD": fcod,
+        "MID": mid, "MNOME": mnome, "MCOD": mcod, "MCAT": mcat,
+        "ESTADOS": estados, "CHAVES": chaves, "CHAVEOFF": chaveoff,
+        "VALOR": valor_out, "RFORN": forn_out, "RMAT": mat_out,
+    })
+    _gravar(destino, secoes)
+    meta["segundos"] = round(time.perf_counter() - inicio, 3)
+    return meta
+
+
+def _alinhar(n):
+    return (n + 7) & ~7
+
+
+def _gravar(destino, secoes):
+    destino = os.path.abspath(destino)
+    tabela, partes = [], []
+    offset = _alinhar(TAM_CABECALHO + TAM_ENTRADA * len(SECOES))
+    for nome, _ in SECOES:
+        conteudo = secoes[nome]
+        dados = memoryview(conteudo).cast("B")  # arrays sem cópia
+        tabela.append(struct.pack(ENTRADA_SECAO, nome.encode("ascii").ljust(8), offset, len(dados)))
+        partes.append(dados)
+        offset = _alinhar(offset + len(dados))
+    tamanho_total = offset
+
+    # Corpo gravado em sequência, com o CRC calculado durante a escrita; o
+    # cabeçalho (que leva o CRC) é gravado por último.
+    temporario = f"{destino}.novo-{os.getpid()}"
+    with open(temporario, "wb") as arquivo:
+        arquivo.write(bytes(TAM_CABECALHO))
+        crc, posicao = 0, TAM_CABECALHO
+        for dados in [b"".join(tabela)] + partes:
+            enchimento = bytes(_alinhar(posicao) - posicao)
+            for bloco in (enchimento, dados):
+                arquivo.write(bloco)
+                crc = zlib.crc32(bloco, crc)
+            posicao = _alinhar(posicao) + len(dados)
+        final = bytes(tamanho_total - posicao)
+        arquivo.write(final)
+        crc = zlib.crc32(final, crc)
+        arquivo.seek(0)
+        arquivo.write(struct.pack(CABECALHO, MAGICO, VERSAO_FORMATO, len(SECOES), tamanho_total, crc, 0))
+        arquivo.flush()
+        os.fsync(arquivo.fileno())
+    os.replace(temporario, destino)
+
+
+# --- leitura ---------------------------------------------------------------------
+def _crc_do_arquivo(caminho, inicio):
+    # Lido com read() e não pelo mmap, para a validação não inflar o RSS do worker.
+    crc = 0
+    with open(caminho, "rb") as arquivo:
+        arquivo.seek(inicio)
+        for bloco in iter(lambda: arquivo.read(1 << 20), b""):
+            crc = zlib.crc32(bloco, crc)
+    return crc
+
+
+class SnapshotMmap:
+    """Arquivo aberto e mapeado; top() no mesmo formato de IndicePrecos.top()."""
+
+    def __init__(self, caminho, verificar_crc=True, versao=None):
+        _exigir_little_endian()
+        self.caminho = caminho
+        self.versao = versao
+        with open(caminho, "rb") as arquivo:
+            tamanho = os.fstat(arquivo.fileno()).st_size
+            if tamanho < TAM_CABECALHO:
+                raise ErroSnapshot(f"{caminho}: arquivo pequeno demais para um snapshot")
+            self._mm = mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magico, formato, n_secoes, tamanho_total, crc, _ = struct.unpack_from(CABECALHO, self._mm, 0)
+        if magico != MAGICO:
+            raise ErroSnapshot(f"{caminho}: não é um snapshot do catálogo")
+        if formato != VERSAO_FORMATO:
+            raise ErroSnapshot(f"{caminho}: formato {formato}, esperado {VERSAO_FORMATO}")
+        if tamanho_total != tamanho or n_secoes != len(SECOES):
+            raise ErroSnapshot(f"{caminho}: arquivo truncado ou incompleto")
+        if verificar_crc and _crc_do_arquivo(caminho, TAM_CABECALHO) != crc:
+            raise ErroSnapshot(f"{caminho}: CRC não confere (arquivo corrompido)")
+
+        visao = memoryview(self._mm)
+        self._secoes = {}
+        for i, (nome, tipo) in enumerate(SECOES):
+            nome_lido, offset, tam = struct.unpack_from(ENTRADA_SECAO, self._mm, TAM_CABECALHO + i * TAM_ENTRADA)
+            if nome_lido.rstrip(b" ").decode("ascii") != nome or offset + tam > tamanho:
+                raise ErroSnapshot(f"{caminho}: tabela de seções inválida em {nome}")
+            fatia = visao[offset:offset + tam]
+            self._secoes[nome] = fatia.cast(tipo) if tipo else fatia
+            if nome == "STRDADOS":
+                self._strdados_offset = offset
+
+        s = self._secoes
+        self.meta = json.loads(bytes(s["META"]).decode("utf-8"))
+        self._stroff = s["STROFF"]
+        self._chaves, self._chaveoff = s["CHAVES"], s["CHAVEOFF"]
+        self._valor, self._rforn, self._rmat = s["VALOR"], s["RFORN"], s["RMAT"]
+        self._fnome, self._festado, self._fcod = s["FNOME"], s["FESTADO"], s["FCOD"]
+        self._mnome, self._mcod = s["MNOME"], s["MCOD"]
+        if len(self._chaveoff) != len(self._chaves) + 1 or self._chaveoff[-1] != len(self._valor):
+            raise ErroSnapshot(f"{caminho}: offsets das chaves inconsistentes")
+        if self._stroff[-1] != len(s["STRDADOS"]):
+            raise ErroSnapshot(f"{caminho}: tabela de textos inconsistente")
+
+    def __len__(self):
+        return len(self._valor)
+
+    # --- textos -----------------------------------------------------------------
+    def _bytes(self, texto_id):
+        base = self._strdados_offset
+        return self._mm[base + self._stroff[texto_id]:base + self._stroff[texto_id + 1]]
+
+    def texto(self, texto_id):
+        if texto_id == NULO:
+            return None
+        return self._bytes(texto_id).decode("utf-8")
+
+    # --- preços -----------------------------------------------------------------
+    def _posicao_chave(self, chave):
+        chaves = self._chaves
+        baixo, alto = 0, len(chaves)
+        while baixo < alto:
+            meio = (baixo + alto) // 2
+            if self._bytes(chaves[meio]) < chave:
+                baixo = meio + 1
+            else:
+                alto = meio
+        if baixo < len(chaves) and self._bytes(chaves[baixo]) == chave:
+            return baixo
+        return -1
+
+    def top(self, material, estado, limite=LIMITE_PADRAO):
+        """Mesmo formato de linha da consulta SQL original."""
+        pos = self._posicao_chave(SEPARADOR.join(normalizar_chave(material, estado)).encode("utf-8"))
+        if pos < 0:
+            return []
+        inicio, fim = self._chaveoff[pos], self._chaveoff[pos + 1]
+        if limite is not None:
+            fim = min(fim, inicio + max(0, limite))
+        texto = self.texto
+        linhas = []
+        for i in range(inicio, fim):
+            f, m, valor = self._rforn[i], self._rmat[i], self._valor[i]
+            linhas.append((texto(self._fnome[f]), texto(self._festado[f]), texto(self._fcod[f]),
+                           texto(self._mnome[m]), texto(self._mcod[m]),
+                           None if valor != valor else valor))
+        return linhas
+
+    # --- catálogo ---------------------------------------------------------------
+    def catalogo(self, versao=None):
+        s, texto = self._secoes, self.texto
+        materiais = [(s["MID"][i], texto(s["MNOME"][i]), texto(s["MCAT"][i])) for i in range(len(s["MID"]))]
+        estados = [texto(e) for e in s["ESTADOS"]]
+        return montar_catalogo(materiais, estados, versao)
+
+
+class FonteMmap:
+    """
+    Snapshot atual do arquivo `caminho`, reaberto quando o arquivo é trocado
+    (os.replace gera um inode novo). Quem ainda usa o mapeamento antigo
+    continua lendo-o até soltá-lo.
+
+    Se o arquivo novo for inválido (truncado, corrompido, sumiu no meio da
+    troca), o mapeamento anterior continua servindo e a falha vai para o log
+    e para snapshot_recusado_total. A versão recusada não é reaberta a cada
+    requisição: a próxima tentativa é quando o arquivo mudar de novo.
+    """
+
+    def __init__(self, caminho, verificar_crc=True):
+        self.caminho = os.path.abspath(caminho)
+        self.verificar_crc = verificar_crc
+        self._atual = None
+        self._recusada = None  # carimbo do último arquivo inválido
+        self._lock = threading.Lock()
+
+    def atual(self):
+        versao = carimbo_versao(self.caminho)
+        atual = self._atual
+        if atual is not None and versao in (atual.versao, self._recusada):
+            return atual
+        with self._lock:
+            atual = self._atual
+            if atual is None or versao not in (atual.versao, self._recusada):
+                try:
+                    novo = SnapshotMmap(self.caminho, self.verificar_crc, versao)
+                except (ErroSnapshot, OSError) as exc:
+                    if atual is None:
+                        raise  # sem mapeamento anterior (inicialização): falha mesmo
+                    self._recusada = versao
+                    metricas.incrementar("snapshot_recusado_total")
+                    _log.error("snapshot %s recusado, mantendo o anterior: %s", self.caminho, exc)
+                    return atual
+                self._atual = atual = novo
+            return atual
+
+    def catalogo(self, versao):
+        return self.atual().catalogo(versao)
+
+
+# --- ativação ---------------------------------------------------------------------
+_fonte = None
+
+
+def ativar(caminho, verificar_crc=True):
+    """Abre e valida o snapshot e passa a servir catálogo e preços dele."""
+    global _fonte
+    fonte = FonteMmap(caminho, verificar_crc)
+    fonte.atual()  # falha aqui (na inicialização) se o arquivo for inválido
+    catalogo.definir_fonte(fonte)
+    indice_precos.definir_fonte(fonte)
+    _fonte = fonte
+    return fonte
+
+
+def desativar():
+    global _fonte
+    catalogo.definir_fonte(None)
+    indice_precos.definir_fonte(None)
+    _fonte = None
+
+
+def fonte_ativa():
+    return _fonte
+
+
+def ativar_do_ambiente():
+    """
+    SNAPSHOT_PATH                 arquivo do snapshot (vazio = usa o SQLite)
+    SNAPSHOT_VERIFICAR_CRC        "0" confere só cabeçalho e estrutura (padrão: 1)
+    """
+    caminho = (os.environ.get("SNAPSHOT_PATH") or "").strip()
+    if not caminho:
+        return None
+    verificar = (os.environ.get("SNAPSHOT_VERIFICAR_CRC") or "1").strip() != "0"
+    return ativar(caminho, verificar)
+
+
+def desatualizado(caminho, db):
+    """True se o snapshot não existe ou foi gerado de outra versão da base local."""
+    if not os.path.exists(caminho):
+        return True
+    if not os.path.exists(db):
+        return False  # nó sem a base: usa o snapshot recebido como está
+    try:
+        origem = SnapshotMmap(caminho, verificar_crc=False).meta.get("origem", {})
+    except ErroSnapshot:
+        return True
+    st = os.stat(db)
+    return (origem.get("tamanho"), origem.get("mtime_ns")) != (st.st_size, st.st_mtime_ns)
+
+
+def garantir(caminho, db):
+    """Reconstrói o snapshot se necessário e o valida por completo (CRC)."""
+    meta = None
+    if desatualizado(caminho, db):
+        meta = construir(db, caminho)
+    SnapshotMmap(caminho, verificar_crc=True)
+    return meta
+
+
+def main(argv=None):
+    from db_pool import DB_PADRAO
+
+    parser = argparse.ArgumentParser(description="Snapshot binário do catálogo do MeliBuy.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_construir = sub.add_parser("construir", help="gera o snapshot a partir da base SQLite")
+    p_construir.add_argument("--db", default=os.environ.get("DB_PATH") or DB_PADRAO)
+    p_construir.add_argument("--saida", default=os.environ.get("SNAPSHOT_PATH") or "catalogo.mmap")
+    p_verificar = sub.add_parser("verificar", help="valida cabeçalho, estrutura e CRC")
+    p_verificar.add_argument("arquivo")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.comando == "construir":
+            resultado = construir(args.db, args.saida)
+        else:
+            resultado = SnapshotMmap(args.arquivo, verificar_crc=True).meta
+    except ErroSnapshot as exc:
+        print(f"erro: {exc}", file=sys.stderr)
+        return 1
+    print(json.dumps(resultado, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
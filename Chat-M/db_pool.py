@@ -0,0 +1,325 @@
+import fcntl
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from urllib.parse import quote
+
+import metricas
+
+# -----------------------------------------------------------------------------
+# Pool de conexões SQLite
+# -----------------------------------------------------------------------------
+# Abrir um sqlite3.connect por requisição custa caro (open do arquivo, leitura
+# do schema, cache de páginas frio). O pool mantém conexões reutilizáveis por
+# processo: cada thread pega uma conexão ociosa (ou cria uma nova), usa e
+# devolve. Como uma conexão só é usada por uma thread de cada vez, é seguro
+# abri-las com check_same_thread=False.
+#
+# Configuração por variáveis de ambiente (todas opcionais):
+#   DB_PATH              caminho do arquivo SQLite (padrão: base_chatbot2.db)
+#   DB_READONLY          "1" abre em modo URI read-only (padrão: 1)
+#   DB_POOL_MAX_OCIOSAS  máximo de conexões ociosas guardadas (padrão: 8)
+#   DB_JOURNAL_MODE      ex.: WAL (padrão: não altera o arquivo)
+#   DB_MMAP_SIZE         bytes para PRAGMA mmap_size (padrão: 256 MiB)
+#   DB_CACHE_SIZE        valor para PRAGMA cache_size (padrão: -65536 = 64 MiB)
+#   DB_QUERY_ONLY        "1" liga PRAGMA query_only (padrão: igual a DB_READONLY)
+#   DB_HEALTHCHECK_S     segundos ociosa antes de revalidar com SELECT 1 (padrão: 30)
+#
+# Toda conexão do pool ganha a função SQL minusculas(), a mesma normalização
+# que o Python usa nas chaves (str.lower). O LOWER() do SQLite só conhece
+# ASCII: LOWER('SÃO PAULO') dá 'sÃo paulo' e não casaria com 'são paulo'.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PADRAO = os.path.join(BASE_DIR, "base_chatbot2.db")
+
+
+def _env_bool(nome, padrao):
+    valor = os.environ.get(nome)
+    if valor is None or not valor.strip():
+        return padrao
+    return valor.strip().lower() in ("1", "true", "sim", "yes", "on")
+
+
+def _env_int(nome, padrao):
+    valor = (os.environ.get(nome) or "").strip()
+    return int(valor) if valor else padrao
+
+
+def minusculas(texto):
+    """Minúsculas com Unicode completo; exposta ao SQL como minusculas()."""
+    return texto.lower() if isinstance(texto, str) else texto
+
+
+class ConexaoPooled:
+    """
+    Proxy fino sobre sqlite3.Connection.
+    close() devolve a conexão ao pool em vez de fechá-la, então o código
+    existente (conn = conectar_db(); ...; conn.close()) continua igual.
+    Depois do close() o proxy não serve mais: a conexão já pode estar com
+    outra thread, então qualquer uso levanta sqlite3.ProgrammingError, como
+    numa conexão fechada.
+
+    Diferente do sqlite3.Connection, o bloco `with` também devolve a conexão
+    ao pool no fim (além do commit/rollback): `with pool.obter() as conn:`
+    é o equivalente de obter() + close() num finally.
+    """
+
+    __slots__ = ("_pool", "_conn", "_inode")
+
+    def __init__(self, pool, conn, inode=None):
+        self._pool = pool
+        self._conn = conn
+        self._inode = inode
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool._devolver(conn, self._inode)
+
+    def __getattr__(self, nome):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError("conexão já devolvida ao pool")
+        return getattr(self._conn, nome)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._conn is not None:
+            if exc_type is None:
+                self._conn.commit()
+            else:
+                self._conn.rollback()
+        self.close()  # ao contrário do sqlite3: o with devolve a conexão
+        return False
+
+
+class PoolConexoes:
+    def __init__(self, caminho=None, readonly=True, max_ociosas=8, pragmas=None,
+                 healthcheck_s=30.0):
+        self.caminho = caminho or DB_PADRAO
+        self.readonly = readonly
+        self.max_ociosas = max_ociosas
+        self.pragmas = dict(pragmas or {})
+        self.healthcheck_s = healthcheck_s
+
+        self._lock = threading.Lock()
+        self._ociosas = deque()  # (conn, instante_devolucao, inode)
+        self._pid = os.getpid()
+        self._em_uso = 0
+        self._stats = {
+            "criadas": 0,
+            "reutilizadas": 0,
+            "descartadas": 0,
+            "falhas_healthcheck": 0,
+        }
+
+    # --- criação --------------------------------------------------------------
+    def _inode_atual(self):
+        try:
+            return os.stat(self.caminho).st_ino
+        except FileNotFoundError:
+            return None
+
+    def _nova_conexao(self):
+        if self.readonly:
+            uri = "file:" + quote(self.caminho) + "?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.caminho, check_same_thread=False)
+        conn.create_function("minusculas", 1, minusculas, deterministic=True)
+        for nome, valor in self.pragmas.items():
+            conn.execute(f"PRAGMA {nome} = {valor}")
+        return conn
+
+    def _saudavel(self, conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            with self._lock:
+                self._stats["falhas_healthcheck"] += 1
+            return False
+
+    def _fechar(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._stats["descartadas"] += 1
+
+    # --- ciclo de vida --------------------------------------------------------
+    def _verificar_fork(self):
+        # Depois de um fork (gunicorn --preload), as conexões herdadas do
+        # processo pai não podem ser usadas: descarta sem fechar.
+        if os.getpid() != self._pid:
+            self._pid = os.getpid()
+            self._ociosas.clear()
+            self._em_uso = 0
+
+    def obter(self):
+        # Se o arquivo foi trocado (ingestao.py faz os.replace), as conexões
+        # ociosas ainda apontam para o inode antigo: descartamos todas.
+        inicio = time.perf_counter()
+        inode = self._inode_atual()
+        with self._lock:
+            self._verificar_fork()
+            self._em_uso += 1
+        # A candidata sai da fila sob o lock; o SELECT 1 do health check e o
+        # fechamento das descartadas rodam fora dele, sem segurar os outros obter().
+        conn = None
+        while conn is None:
+            with self._lock:
+                if not self._ociosas:
+                    break
+                candidata, devolvida_em, inode_conn = self._ociosas.pop()
+            if inode_conn != inode:
+                self._fechar(candidata)
+            elif time.monotonic() - devolvida_em > self.healthcheck_s and not self._saudavel(candidata):
+                self._fechar(candidata)
+            else:
+                conn = candidata
+        if conn is not None:
+            with self._lock:
+                self._stats["reutilizadas"] += 1
+            metricas.observar("db_conexao_segundos", time.perf_counter() - inicio, origem="reutilizada")
+        if conn is None:
+            try:
+                inode = self._inode_atual()
+                conn = self._nova_conexao()
+            except Exception:
+                with self._lock:
+                    self._em_uso -= 1
+                raise
+            with self._lock:
+                self._stats["criadas"] += 1
+            metricas.observar("db_conexao_segundos", time.perf_counter() - inicio, origem="nova")
+        return ConexaoPooled(self, conn, inode)
+
+    def _devolver(self, conn, inode=None):
+        # Transação pendente não pode vazar para o próximo usuário da conexão.
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            with self._lock:
+                self._em_uso -= 1
+            self._fechar(conn)
+            return
+        with self._lock:
+            self._em_uso -= 1
+            if os.getpid() == self._pid and len(self._ociosas) < self.max_ociosas:
+                self._ociosas.append((conn, time.monotonic(), inode))
+                return
+        self._fechar(conn)
+
+    def fechar_todas(self):
+        with self._lock:
+            ociosas = list(self._ociosas)
+            self._ociosas.clear()
+        for conn, _, _ in ociosas:
+            self._fechar(conn)
+
+    # --- observabilidade ------------------------------------------------------
+    def health(self):
+        """Abre (ou reutiliza) uma conexão e executa SELECT 1."""
+        conn = self.obter()
+        try:
+            return self._saudavel(conn._conn)
+        finally:
+            conn.close()
+
+    def metricas(self):
+        with self._lock:
+            dados = dict(self._stats)
+            dados["ociosas"] = len(self._ociosas)
+            dados["em_uso"] = self._em_uso
+            dados["max_ociosas"] = self.max_ociosas
+        return dados
+
+
+def _pragmas_do_ambiente(readonly):
+    pragmas = {
+        "mmap_size": _env_int("DB_MMAP_SIZE", 256 * 1024 * 1024),
+        "cache_size": _env_int("DB_CACHE_SIZE", -65536),
+    }
+    journal = (os.environ.get("DB_JOURNAL_MODE") or "").strip()
+    if journal and not readonly:
+        pragmas["journal_mode"] = journal
+    if _env_bool("DB_QUERY_ONLY", readonly):
+        pragmas["query_only"] = "ON"
+    return pragmas
+
+
+def criar_pool_do_ambiente(**sobrescritas):
+    readonly = sobrescritas.get("readonly", _env_bool("DB_READONLY", True))
+    config = dict(
+        caminho=os.environ.get("DB_PATH") or DB_PADRAO,
+        readonly=readonly,
+        max_ociosas=_env_int("DB_POOL_MAX_OCIOSAS", 8),
+        pragmas=_pragmas_do_ambiente(readonly),
+        healthcheck_s=float(_env_int("DB_HEALTHCHECK_S", 30)),
+    )
+    config.update(sobrescritas)
+    return PoolConexoes(**config)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def obter_pool():
+    """Pool padrão do processo (criado sob demanda)."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = criar_pool_do_ambiente()
+    return _pool
+
+
+def configurar_pool(**kwargs):
+    """
+    Substitui o pool padrão (útil para scripts e benchmarks). O que não for
+    informado segue as variáveis de ambiente.
+    """
+    global _pool
+    novo = criar_pool_do_ambiente(**kwargs)
+    with _pool_lock:
+        antigo, _pool = _pool, novo
+    if antigo is not None:
+        antigo.fechar_todas()
+    return novo
+
+
+# -----------------------------------------------------------------------------
+# Trava da troca do arquivo (carga em massa x gravação pela API)
+# -----------------------------------------------------------------------------
+# ingestao.py troca o arquivo da base com os.replace e escrita_precos.py grava
+# nele. Os dois combinam por um flock em "<base>.trava", que vale entre
+# processos: a carga segura a trava exclusiva da cópia da base até a troca, e
+# cada gravação segura a compartilhada (gravações entre si já são
+# serializadas pelo SQLite). Assim nenhuma gravação cai entre a cópia e a
+# troca, e nenhuma conexão de escrita atravessa a troca.
+
+class BaseTravada(Exception):
+    """A trava da base está com outro processo (esperar=False)."""
+
+
+@contextmanager
+def trava_base(caminho, exclusiva=False, esperar=True):
+    fd = os.open(caminho + ".trava", os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        modo = fcntl.LOCK_EX if exclusiva else fcntl.LOCK_SH
+        try:
+            fcntl.flock(fd, modo if esperar else modo | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise BaseTravada(caminho) from None
+        yield
+    finally:
+        os.close(fd)  # fechar o descritor solta a trava
+
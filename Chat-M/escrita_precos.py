@@ -0,0 +1,215 @@
+import math
+import os
+import sqlite3
+import threading
+
+import catalogo_mmap
+import metricas
+import mudancas
+from db_pool import BaseTravada, obter_pool, trava_base
+from indice_precos import indice_habilitado, normalizar_chave, obter_indice
+
+# -----------------------------------------------------------------------------
+# Gravação de preços (POST/PUT /precos)
+# -----------------------------------------------------------------------------
+# Cada chamada é uma transação (BEGIN IMMEDIATE): ou todos os itens entram,
+# ou nenhum. Os gatilhos de mudancas.py registram cada preço alterado no
+# feed, na mesma transação, e o seq resultante volta para quem gravou.
+#
+# A base passa a WAL na primeira gravação, para os leitores do pool
+# continuarem lendo enquanto alguém grava. Depois do COMMIT o índice de
+# preços deste processo é atualizado na hora (só as chaves afetadas, pelo
+# feed); os outros workers fazem o mesmo no próximo acesso, quando o
+# carimbo da base muda.
+#
+# Convivência com a carga em massa (ingestao.py): cada gravação segura a
+# trava compartilhada da base (db_pool.trava_base) e, antes de soltá-la, faz
+# checkpoint(TRUNCATE) e fecha a conexão. Entre gravações não há conexão de
+# escrita aberta nem -wal pendente, então a carga pode trocar o arquivo; com
+# a carga em andamento (trava exclusiva), a gravação recusa na hora com 503.
+#
+# Um item identifica o preço como na carga em massa (ingestao.py):
+#   {"codigo_fornecedor": "...", "estado": "...", "codigo_material": "...", "valor": 12.5}
+# e {"remover": true} no lugar de "valor" apaga o preço.
+#
+#   PRECOS_ESCRITA      "0" desliga as rotas de gravação (padrão: ligadas)
+#   PRECOS_LOTE_MAX     itens por chamada (padrão: 5000)
+#   PRECOS_BUSY_MS      espera por outra gravação em andamento (padrão: 5000)
+
+LOTE_MAXIMO = int(os.environ.get("PRECOS_LOTE_MAX", 5000))
+BUSY_S = int(os.environ.get("PRECOS_BUSY_MS", 5000)) / 1000
+
+_lock = threading.Lock()
+
+
+class ErroEscrita(Exception):
+    def __init__(self, mensagem, status=400):
+        super().__init__(mensagem)
+        self.status = status
+
+
+def escrita_habilitada():
+    return (os.environ.get("PRECOS_ESCRITA") or "1").strip() != "0"
+
+
+# --- validação ---------------------------------------------------------------------
+def _texto(item, campo, pos):
+    valor = item.get(campo)
+    valor = str(valor).strip() if valor is not None else ""
+    if not valor:
+        raise ErroEscrita(f"itens[{pos}]: '{campo}' é obrigatório")
+    return valor
+
+
+def normalizar_itens(itens):
+    """Valida os itens e devolve [(codigo_fornecedor, estado, codigo_material, valor|None)]."""
+    if not isinstance(itens, list) or not itens:
+        raise ErroEscrita("campo 'itens' deve ser uma lista não vazia")
+    if len(itens) > LOTE_MAXIMO:
+        raise ErroEscrita(f"no máximo {LOTE_MAXIMO} itens por chamada")
+    normalizados = []
+    for pos, item in enumerate(itens):
+        if not isinstance(item, dict):
+            raise ErroEscrita(f"itens[{pos}] deve ser um objeto")
+        codigo_fornecedor = _texto(item, "codigo_fornecedor", pos)
+        estado = _texto(item, "estado", pos)
+        codigo_material = _texto(item, "codigo_material", pos)
+        if item.get("remover") is True:
+            valor = None
+        else:
+            valor = item.get("valor")
+            if (isinstance(valor, bool) or not isinstance(valor, (int, float))
+                    or not math.isfinite(valor) or valor < 0):
+                raise ErroEscrita(f"itens[{pos}]: 'valor' deve ser um número maior ou igual a zero")
+            valor = float(valor)
+        normalizados.append((codigo_fornecedor, estado, codigo_material, valor))
+    return normalizados
+
+
+# --- conexão de escrita ----------------------------------------------------------
+def _abrir(caminho):
+    if not os.path.exists(caminho):
+        raise ErroEscrita("base de dados não encontrada", status=503)
+    conn = sqlite3.connect(caminho, timeout=BUSY_S, isolation_level=None, check_same_thread=False)
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        mudancas.instalar(conn)
+    except BaseException:
+        conn.close()
+        raise
+    return conn
+
+
+def _fechar(conn):
+    """Devolve o -wal para a base e fecha: nada fica aberto para a carga em massa."""
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    except sqlite3.Error:
+        pass  # um leitor segurou o -wal; o próximo checkpoint resolve
+    finally:
+        conn.close()
+
+
+# --- gravação ------------------------------------------------------------------------
+class _Resolvedor:
+    """codigo -> id dentro da transação, com cache por chamada."""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self._fornecedores = {}
+        self._materiais = {}
+
+    def fornecedor(self, codigo, estado, pos):
+        chave = (codigo, estado.lower())
+        if chave not in self._fornecedores:
+            self.cursor.execute("SELECT id, estado FROM fornecedores WHERE codigo = ?", (codigo,))
+            encontrados = [(fid, est) for fid, est in self.cursor if (est or "").lower() == chave[1]]
+            self._fornecedores[chave] = encontrados[0] if encontrados else None
+        resolvido = self._fornecedores[chave]
+        if resolvido is None:
+            raise ErroEscrita(f"itens[{pos}]: fornecedor '{codigo}' não encontrado em '{estado}'", status=404)
+        return resolvido
+
+    def material(self, codigo, pos):
+        if codigo not in self._materiais:
+            self.cursor.execute("SELECT id, nome FROM materiais WHERE codigo = ?", (codigo,))
+            self._materiais[codigo] = self.cursor.fetchone()
+        resolvido = self._materiais[codigo]
+        if resolvido is None:
+            raise ErroEscrita(f"itens[{pos}]: material '{codigo}' não encontrado", status=404)
+        return resolvido
+
+
+def _gravar_itens(cursor, itens, somente_existentes, contagem):
+    resolvedor = _Resolvedor(cursor)
+    chaves = set()
+    for pos, (codigo_fornecedor, estado, codigo_material, valor) in enumerate(itens):
+        fornecedor_id, estado_base = resolvedor.fornecedor(codigo_fornecedor, estado, pos)
+        material_id, material_nome = resolvedor.material(codigo_material, pos)
+        if valor is None:
+            cursor.execute("DELETE FROM precos WHERE fornecedor_id = ? AND material_id = ?",
+                           (fornecedor_id, material_id))
+            if cursor.rowcount == 0 and somente_existentes:
+                raise ErroEscrita(f"itens[{pos}]: preço não cadastrado", status=404)
+            contagem["removidos"] += cursor.rowcount
+        else:
+            cursor.execute("UPDATE precos SET valor = ? WHERE fornecedor_id = ? AND material_id = ?",
+                           (valor, fornecedor_id, material_id))
+            if cursor.rowcount:
+                contagem["atualizados"] += cursor.rowcount
+            elif somente_existentes:
+                raise ErroEscrita(f"itens[{pos}]: preço não cadastrado", status=404)
+            else:
+                cursor.execute("INSERT INTO precos (fornecedor_id, material_id, valor) VALUES (?, ?, ?)",
+                               (fornecedor_id, material_id, valor))
+                contagem["inseridos"] += 1
+        chaves.add(normalizar_chave(material_nome, estado_base))
+    return chaves
+
+
+def _transacao(conn, itens, somente_existentes, contagem):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+    except sqlite3.OperationalError as exc:
+        raise ErroEscrita(f"base ocupada, tente novamente: {exc}", status=503)
+    try:
+        chaves = _gravar_itens(cursor, itens, somente_existentes, contagem)
+        seq = mudancas.ultima_seq(cursor)
+        mudancas.podar(cursor, seq)
+        cursor.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            cursor.execute("ROLLBACK")
+        raise
+    return seq, chaves
+
+
+def gravar(itens, somente_existentes=False):
+    """
+    Grava os preços numa transação só. somente_existentes=True (PUT) recusa
+    itens cujo preço ainda não existe. Retorna o seq publicado no feed e as
+    contagens; em caso de erro nada é gravado (ErroEscrita com o status HTTP).
+    """
+    if catalogo_mmap.fonte_ativa() is not None:
+        raise ErroEscrita("gravação indisponível com o snapshot binário ativo (SNAPSHOT_PATH)", status=409)
+    itens = normalizar_itens(itens)
+    contagem = {"inseridos": 0, "atualizados": 0, "removidos": 0}
+
+    caminho = obter_pool().caminho
+    with metricas.cronometro("db_consulta_segundos", operacao="gravar_precos"), _lock:
+        try:
+            with trava_base(caminho, esperar=False):
+                conn = _abrir(caminho)
+                try:
+                    seq, chaves = _transacao(conn, itens, somente_existentes, contagem)
+                finally:
+                    _fechar(conn)
+        except BaseTravada:
+            raise ErroEscrita("carga em massa da base em andamento, tente novamente", status=503)
+
+    if indice_habilitado():
+        obter_indice()  # aplica já neste processo
+    metricas.incrementar("precos_gravados_total", len(itens))
+    return {"seq": seq, "chaves_afetadas": len(chaves), **contagem}
@@ -0,0 +1,145 @@
+import re
+import threading
+import unicodedata
+
+# -----------------------------------------------------------------------------
+# Resolução de estados a partir do texto do usuário
+# -----------------------------------------------------------------------------
+# Antes, cada turno remontava o dict de estados e testava `chave in mensagem`
+# para cada chave, em ordem: custo O(chaves x tamanho da mensagem) e falsos
+# positivos ("ba" casava dentro de "curitiba"). Aqui os apelidos viram uma
+# trie de tokens, compilada uma vez por versão do catálogo. A mensagem é
+# normalizada (minúsculas, sem acento), quebrada em palavras e percorrida uma
+# única vez; vence o apelido com mais palavras (e, no empate, o que aparece
+# primeiro), sempre respeitando limites de palavra.
+
+MAPEAMENTO_ESTADOS = {
+    "sp": "são paulo", "são paulo": "são paulo",
+    "ba": "bahia", "bahia": "bahia",
+    "rj": "rio de janeiro", "rio de janeiro": "rio de janeiro",
+    "mg": "minas gerais",  # Genérico para desambiguação
+    "minas gerais": "minas gerais",  # Genérico para desambiguação
+    "minas": "minas gerais",
+    "minas gerais (extrema)": "minas gerais (extrema)",
+    "extrema": "minas gerais (extrema)",
+    "minas gerais (betim)": "minas gerais (betim)",
+    "betim": "minas gerais (betim)",
+    "rs": "rio grande do sul", "rio grande do sul": "rio grande do sul",
+    "sc": "santa catarina", "santa catarina": "santa catarina",
+    "df": "distrito federal", "distrito federal": "distrito federal",
+    "pe": "pernambuco", "pernambuco": "pernambuco",
+    "ce": "ceará", "ceara": "ceará",
+    "pr": "paraná", "paraná": "paraná", "curitiba": "paraná",
+}
+
+MINAS_GERAIS = "minas gerais"
+MG_BETIM = "minas gerais (betim)"
+MG_EXTREMA = "minas gerais (extrema)"
+MG_SUBDIVISOES = [MG_BETIM, MG_EXTREMA]
+
+# Desambiguação explícita de Minas Gerais: se a mensagem cita a cidade, ela
+# vence qualquer outro apelido (ex.: "mg extrema" -> Extrema), como antes.
+DESAMBIGUACAO_MG = (
+    ("betim", MG_BETIM),
+    ("extrema", MG_EXTREMA),
+)
+
+_FIM = object()  # marcador de nó terminal na trie
+_PALAVRA = re.compile(r"[a-z0-9]+")
+
+
+def dobrar_acentos(texto):
+    """Minúsculas e sem acentos: 'São Paulo' -> 'sao paulo'."""
+    decomposto = unicodedata.normalize("NFKD", (texto or "").lower())
+    return "".join(c for c in decomposto if not unicodedata.combining(c))
+
+
+def tokenizar(texto):
+    return _PALAVRA.findall(dobrar_acentos(texto))
+
+
+class ResolvedorEstados:
+    """Trie de apelidos -> nome canônico do estado, pronta para consulta."""
+
+    def __init__(self, estados_db=(), mapeamento=None):
+        mapeamento = dict(MAPEAMENTO_ESTADOS if mapeamento is None else mapeamento)
+        self.estados_db = frozenset(estados_db)
+
+        # Se a base grafa o estado de outro jeito (ex.: "ceara" x "ceará"),
+        # usamos a grafia da base para que a consulta de preços encontre.
+        grafia_db = {dobrar_acentos(e): e for e in self.estados_db}
+        for estado_db in self.estados_db:
+            mapeamento.setdefault(estado_db, estado_db)
+
+        self._raiz = {}
+        for apelido, canonico in mapeamento.items():
+            tokens = tokenizar(apelido)
+            if not tokens:
+                continue
+            canonico = grafia_db.get(dobrar_acentos(canonico), canonico)
+            no = self._raiz
+            for token in tokens:
+                no = no.setdefault(token, {})
+            no.setdefault(_FIM, canonico)  # primeiro apelido definido vence
+
+    def subdivisao_mg(self, mensagem):
+        """'minas gerais (betim)'/'(extrema)' se a mensagem citar a cidade."""
+        tokens = set(tokenizar(mensagem))
+        for cidade, estado in DESAMBIGUACAO_MG:
+            if cidade in tokens:
+                return estado
+        return None
+
+    def resolver(self, mensagem):
+        """Nome canônico do estado citado na mensagem, ou None."""
+        tokens = tokenizar(mensagem)
+        for cidade, estado in DESAMBIGUACAO_MG:
+            if cidade in tokens:
+                return estado
+
+        melhor, melhor_tamanho = None, 0
+        for inicio in range(len(tokens)):
+            no = self._raiz
+            for pos in range(inicio, len(tokens)):
+                no = no.get(tokens[pos])
+                if no is None:
+                    break
+                tamanho = pos - inicio + 1
+                if _FIM in no and tamanho > melhor_tamanho:
+                    melhor, melhor_tamanho = no[_FIM], tamanho
+        return melhor
+
+    def resolver_mg(self, estado):
+        """
+        Para o genérico 'minas gerais', escolhe a subdivisão existente na base.
+        Retorna (estado, precisa_perguntar).
+        """
+        if estado != MINAS_GERAIS:
+            return estado, False
+        has_betim = MG_BETIM in self.estados_db
+        has_extrema = MG_EXTREMA in self.estados_db
+        if has_betim and has_extrema:
+            return estado, True
+        if has_betim:
+            return MG_BETIM, False
+        if has_extrema:
+            return MG_EXTREMA, False
+        return estado, False
+
+
+_cache = (None, None)  # (snapshot do catálogo, ResolvedorEstados)
+_cache_lock = threading.Lock()
+
+
+def obter_resolvedor(catalogo):
+    """Resolvedor compilado para a versão do catálogo informada."""
+    global _cache
+    compilado_para, resolvedor = _cache
+    if compilado_para is catalogo:
+        return resolvedor
+    with _cache_lock:
+        compilado_para, resolvedor = _cache
+        if compilado_para is not catalogo:
+            resolvedor = ResolvedorEstados(catalogo.estados)
+            _cache = (catalogo, resolvedor)
+        return resolvedor
@@ -0,0 +1,45 @@
+import multiprocessing
+import os
+
+import catalogo_mmap
+from db_pool import DB_PADRAO
+
+# -----------------------------------------------------------------------------
+# Configuração do gunicorn (gunicorn -c gunicorn.conf.py app:app)
+# -----------------------------------------------------------------------------
+# Com SNAPSHOT_PATH definido, o processo mestre gera (ou reaproveita) o
+# snapshot binário do catálogo antes de criar os workers e o valida por
+# completo. Cada worker só mapeia o arquivo (catalogo_mmap.ativar_do_ambiente
+# na importação de app.py): as páginas são compartilhadas pelo page cache,
+# então a memória por worker não cresce com o tamanho do catálogo.
+#
+#   SNAPSHOT_PATH          arquivo do snapshot (vazio = cada worker lê o SQLite)
+#   SNAPSHOT_RECONSTRUIR   "0" nunca regera; usa o arquivo como veio (outros nós)
+#   WEB_CONCURRENCY        número de workers (padrão: 2 x CPUs + 1); fica no
+#                          ambiente dos workers para dividir o teto da admissão
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+
+
+def on_starting(server):
+    # workers efetivos (o -w da linha de comando vence o arquivo): admissao.py
+    # divide ADMISSAO_MAX_CONCORRENCIA por eles
+    os.environ["WEB_CONCURRENCY"] = str(server.cfg.workers)
+    caminho = (os.environ.get("SNAPSHOT_PATH") or "").strip()
+    if not caminho:
+        return
+    db = os.environ.get("DB_PATH") or DB_PADRAO
+    if (os.environ.get("SNAPSHOT_RECONSTRUIR") or "1").strip() == "0":
+        catalogo_mmap.SnapshotMmap(caminho, verificar_crc=True)
+        server.log.info("snapshot %s validado", caminho)
+    else:
+        meta = catalogo_mmap.garantir(caminho, db)
+        if meta:
+            server.log.info("snapshot %s gerado: %s linhas em %ss", caminho, meta["linhas"], meta["segundos"])
+        else:
+            server.log.info("snapshot %s em dia e validado", caminho)
+    # O arquivo acabou de ser validado (CRC) aqui; nos workers basta conferir
+    # cabeçalho e estrutura, sem reler o arquivo inteiro em cada um.
+    os.environ.setdefault("SNAPSHOT_VERIFICAR_CRC", "0")
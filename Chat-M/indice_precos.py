@@ -0,0 +1,356 @@
+import json
+import os
+import threading
+
+import metricas
+import mudancas
+from db_pool import minusculas, obter_pool
+from catalogo import carimbo_versao, mesmo_arquivo
+
+# -----------------------------------------------------------------------------
+# Índice em memória dos fornecedores mais baratos por (material, estado)
+# -----------------------------------------------------------------------------
+# consultar_fornecedores fazia um JOIN de três tabelas com LOWER() nos dois
+# predicados e ORDER BY valor, sem nenhum índice na base: varredura completa a
+# cada consulta. Aqui os preços ficam agrupados pela chave normalizada
+# (minusculas(material), minusculas(estado)) em listas já ordenadas por valor,
+# então o top-N é só um fatiamento da lista.
+#
+# Memória limitada: cada chave guarda só as PRECOS_POR_CHAVE linhas mais
+# baratas, não a tabela de preços inteira. Quem pede mais do que isso numa
+# chave que tem mais linhas (limite=None, ranking) é servido pela consulta
+# SQL da chave (ler_fornecedores), que usa a mesma normalização.
+#
+# Atualização pelo feed de mudanças (mudancas.py): quando o carimbo da base
+# muda, perguntamos ao feed quais chaves tiveram preços alterados depois do
+# último seq aplicado e relemos só o top delas, numa consulta por lote de
+# chaves. Cada chave guarda o seq da última mudança que a afetou, e
+# versao_chave() vira a versão do cache de /fornecedores daquela chave. A
+# releitura completa fica para quando mudancas.estrutura_mudou() avisa (nomes,
+# estados, carga em massa, feed podado), para outro arquivo ou base sem feed.
+# Cada chave afetada recebe uma lista nova (copy-on-write), então leitores
+# concorrentes nunca veem uma lista pela metade.
+#
+#   INDICE_PRECOS=0           desliga o índice e volta para a consulta SQL
+#   INDICE_PRECOS_POR_CHAVE   linhas guardadas por chave (padrão: 50)
+#
+# Com um snapshot binário ativo (catalogo_mmap.py), obter_indice() devolve o
+# snapshot mapeado em memória, que tem o mesmo top().
+
+LIMITE_PADRAO = 3
+
+PRECOS_POR_CHAVE = int(os.environ.get("INDICE_PRECOS_POR_CHAVE", 50))
+
+# Chaves por consulta nas leituras por lote de chaves (limita o tamanho de
+# cada resultado).
+CHAVES_POR_CONSULTA = 1000
+
+# As consultas usam minusculas(), registrada nas conexões do pool (db_pool.py).
+SQL_FORNECEDORES = """
+SELECT f.nome, f.estado, f.codigo, m.nome, m.codigo, p.valor
+FROM materiais m
+JOIN precos p ON p.material_id = m.id
+JOIN fornecedores f ON f.id = p.fornecedor_id
+WHERE minusculas(m.nome) = ? AND minusculas(f.estado) = ?
+ORDER BY p.valor ASC, p.id ASC
+LIMIT ?
+"""
+
+# precos_chave: as linhas de preço com a chave normalizada, de todas as chaves
+# (releitura completa) ou só das chaves de um lote, passadas num parâmetro
+# JSON ([[material, estado], ...]). No lote, materiais e fornecedores são
+# resolvidos uma vez e os preços vêm pelo índice (fornecedor_id, material_id).
+PRECOS_TODOS = """
+precos_chave AS (
+    SELECT minusculas(m.nome) AS chave_material, minusculas(f.estado) AS chave_estado,
+           p.id, f.nome, f.estado, f.codigo, m.nome AS material, m.codigo AS material_codigo, p.valor
+    FROM precos p
+    JOIN fornecedores f ON f.id = p.fornecedor_id
+    JOIN materiais m ON m.id = p.material_id
+)"""
+
+PRECOS_DAS_CHAVES = """
+chaves AS (
+    SELECT json_extract(value, '$[0]') AS chave_material, json_extract(value, '$[1]') AS chave_estado
+    FROM json_each(?)
+),
+mats AS MATERIALIZED (
+    SELECT id, nome, codigo, minusculas(nome) AS chave FROM materiais
+    WHERE minusculas(nome) IN (SELECT chave_material FROM chaves)
+),
+forns AS MATERIALIZED (
+    SELECT id, nome, estado, codigo, minusculas(estado) AS chave FROM fornecedores
+    WHERE minusculas(estado) IN (SELECT chave_estado FROM chaves)
+),
+precos_chave AS (
+    SELECT c.chave_material, c.chave_estado, p.id, f.nome, f.estado, f.codigo,
+           m.nome AS material, m.codigo AS material_codigo, p.valor
+    FROM chaves c
+    JOIN mats m ON m.chave = c.chave_material
+    JOIN forns f ON f.chave = c.chave_estado
+    JOIN precos p ON p.fornecedor_id = f.id AND p.material_id = m.id
+)"""
+
+# As `limite` linhas mais baratas de cada chave, em ordem de chave e preço.
+SQL_TOP_POR_CHAVE = """
+WITH {precos}
+SELECT chave_material, chave_estado, id, nome, estado, codigo, material, material_codigo, valor, posicao
+FROM (
+    SELECT *, ROW_NUMBER() OVER (PARTITION BY chave_material, chave_estado
+                                 ORDER BY valor ASC, id ASC) AS posicao
+    FROM precos_chave
+)
+WHERE posicao <= ?
+ORDER BY chave_material, chave_estado, posicao
+"""
+
+# Menor preço de cada fornecedor em cada chave, na ordem em que uma leitura
+# da chave por preço encontraria cada fornecedor.
+SQL_MENORES_POR_FORNECEDOR = """
+WITH {precos}
+SELECT chave_material, chave_estado, codigo, nome, estado, MIN(valor)
+FROM precos_chave
+GROUP BY chave_material, chave_estado, codigo, nome, estado
+HAVING MIN(valor) IS NOT NULL
+ORDER BY chave_material, chave_estado, MIN(valor), MIN(id)
+"""
+
+# Chaves com preços alterados no intervalo do feed. Sem mudança de estrutura
+# no intervalo, nomes e estados atuais são os mesmos da época da mudança.
+SQL_CHAVES_ALTERADAS = """
+SELECT minusculas(m.nome), minusculas(f.estado), MAX(x.seq)
+FROM mudancas x
+JOIN materiais m ON m.id = x.material_id
+JOIN fornecedores f ON f.id = x.fornecedor_id
+WHERE x.seq > ? AND x.seq <= ? AND x.tabela = 'precos'
+GROUP BY 1, 2
+"""
+
+
+def indice_habilitado():
+    return (os.environ.get("INDICE_PRECOS") or "1").strip() != "0"
+
+
+def normalizar_chave(material, estado):
+    return (minusculas(material or ""), minusculas(estado or ""))
+
+
+def _ordem(valor, preco_id):
+    # ORDER BY valor ASC no SQLite coloca NULL primeiro; desempate pelo id.
+    return (float("-inf") if valor is None else valor, preco_id)
+
+
+def ler_fornecedores(cursor, material, estado, limite=LIMITE_PADRAO):
+    """
+    Top `limite` da chave direto da base (limite=None: todas as linhas), no
+    formato de IndicePrecos.top(). Com cursor=None usa uma conexão do pool.
+    """
+    if cursor is None:
+        conn = obter_pool().obter()
+        try:
+            return ler_fornecedores(conn.cursor(), material, estado, limite)
+        finally:
+            conn.close()
+    cursor.execute(SQL_FORNECEDORES, (*normalizar_chave(material, estado), -1 if limite is None else limite))
+    return cursor.fetchall()
+
+
+def _lotes_de_chaves(chaves):
+    """(lote, precos_chave, parâmetros) de cada lote de até CHAVES_POR_CONSULTA chaves."""
+    chaves = list(chaves)
+    for inicio in range(0, len(chaves), CHAVES_POR_CONSULTA):
+        lote = chaves[inicio:inicio + CHAVES_POR_CONSULTA]
+        yield lote, PRECOS_DAS_CHAVES, (json.dumps(lote, ensure_ascii=False),)
+
+
+def _linhas_top(cursor, limite, precos=PRECOS_TODOS, parametros=()):
+    """(chave, posição, preco_id, linha) das `limite` linhas mais baratas de cada chave."""
+    cursor.execute(SQL_TOP_POR_CHAVE.format(precos=precos), (*parametros, limite))
+    for chave_material, chave_estado, preco_id, *linha, posicao in cursor:
+        yield (chave_material, chave_estado), posicao, preco_id, tuple(linha)
+
+
+def ler_tops(cursor, chaves, limite):
+    """
+    {chave: [linha, ...]} com as `limite` linhas mais baratas de cada chave
+    de `chaves`, uma consulta por lote de chaves. Chaves sem preço ficam de fora.
+    """
+    tops = {}
+    for _, precos, parametros in _lotes_de_chaves(chaves):
+        for chave, _, _, linha in _linhas_top(cursor, limite, precos, parametros):
+            tops.setdefault(chave, []).append(linha)
+    return tops
+
+
+def ler_menores(cursor, chaves):
+    """
+    {chave: {(codigo, fornecedor, estado): menor preço}} das chaves de
+    `chaves`, uma consulta por lote de chaves (MIN ... GROUP BY fornecedor).
+    """
+    menores = {}
+    for _, precos, parametros in _lotes_de_chaves(chaves):
+        cursor.execute(SQL_MENORES_POR_FORNECEDOR.format(precos=precos), parametros)
+        for chave_material, chave_estado, codigo, nome, estado, menor in cursor:
+            menores.setdefault((chave_material, chave_estado), {})[(codigo, nome, estado)] = float(menor)
+    return menores
+
+
+class IndicePrecos:
+    def __init__(self, por_chave=None):
+        self.por_chave = PRECOS_POR_CHAVE if por_chave is None else por_chave
+        self.versao = None
+        self.seq = None         # último seq do feed aplicado (None: base sem feed)
+        self.geracao = 0        # incrementa a cada releitura completa
+        self._por_chave = {}    # chave -> list[entrada] ordenada, até por_chave linhas
+        self._cortadas = frozenset()  # chaves com mais linhas na base do que na lista
+        self._seq_por_chave = {}  # chave -> seq da última mudança aplicada
+        self._linhas = 0
+        self._lock = threading.Lock()
+
+    # --- leitura --------------------------------------------------------------
+    def top(self, material, estado, limite=LIMITE_PADRAO):
+        """Mesmo formato de linha da consulta SQL original."""
+        chave = normalizar_chave(material, estado)
+        lista = self._por_chave.get(chave, ())
+        if (limite is None or limite > len(lista)) and chave in self._cortadas:
+            return ler_fornecedores(None, material, estado, limite)
+        return [entrada[2] for entrada in lista[:limite]]
+
+    def versao_chave(self, material, estado):
+        """Muda sempre que o top() da chave pode ter mudado."""
+        return self.geracao, self._seq_por_chave.get(normalizar_chave(material, estado), 0)
+
+    def __len__(self):
+        """Linhas de preço guardadas (no máximo por_chave por chave)."""
+        return self._linhas
+
+    # --- carga ----------------------------------------------------------------
+    def _ler_tops(self, cursor, precos=PRECOS_TODOS, parametros=()):
+        """{chave: lista ordenada} e o conjunto das chaves cortadas."""
+        por_chave = {}
+        cortadas = set()
+        # Uma linha a mais que o limite só para saber que a chave foi cortada.
+        for chave, posicao, preco_id, linha in _linhas_top(cursor, self.por_chave + 1, precos, parametros):
+            if posicao > self.por_chave:
+                cortadas.add(chave)
+            else:
+                por_chave.setdefault(chave, []).append((_ordem(linha[5], preco_id), preco_id, linha))
+        return por_chave, cortadas
+
+    def sincronizar(self, cursor, versao=None):
+        """
+        Releitura completa: monta o top de todas as chaves numa consulta só.
+        Retorna o número de chaves.
+        """
+        with self._lock:
+            por_chave, cortadas = self._ler_tops(cursor)
+            self._por_chave = por_chave
+            self._cortadas = frozenset(cortadas)
+            self._linhas = sum(map(len, por_chave.values()))
+            self._seq_por_chave = {}
+            self.geracao += 1
+            self.versao = versao
+            return len(por_chave)
+
+    def atualizar_chaves(self, cursor, seq_por_chave, seq=None, versao=None):
+        """
+        Relê da base o top só das chaves em `seq_por_chave` ({chave: seq da
+        mudança}); as que não voltam ficaram sem preços. Retorna quantas
+        chaves foram relidas.
+        """
+        with self._lock:
+            cortadas = set(self._cortadas)
+            for lote, precos, parametros in _lotes_de_chaves(seq_por_chave):
+                lidas, cortadas_lote = self._ler_tops(cursor, precos, parametros)
+                for chave in lote:
+                    anterior = self._por_chave.get(chave, ())
+                    lista = lidas.get(chave)
+                    self._linhas += len(lista or ()) - len(anterior)
+                    if lista:
+                        self._por_chave[chave] = lista
+                    else:
+                        self._por_chave.pop(chave, None)
+                    if chave in cortadas_lote:
+                        cortadas.add(chave)
+                    else:
+                        cortadas.discard(chave)
+                    self._seq_por_chave[chave] = seq_por_chave[chave]
+            self._cortadas = frozenset(cortadas)
+            if seq is not None:
+                self.seq = seq
+            if versao is not None:
+                self.versao = versao
+            return len(seq_por_chave)
+
+
+_indice = IndicePrecos()
+_sync_lock = threading.Lock()
+_fonte = None  # catalogo_mmap.FonteMmap ou None
+
+
+def definir_fonte(fonte):
+    """Passa a servir top() a partir de `fonte` (None volta para o índice em memória)."""
+    global _fonte
+    _fonte = fonte
+
+
+def obter_indice():
+    """Índice do processo, sincronizado com a versão atual da base."""
+    fonte = _fonte
+    if fonte is not None:
+        return fonte.atual()
+    pool = obter_pool()
+    versao = carimbo_versao(pool.caminho)
+    if _indice.versao == versao:
+        return _indice
+    with _sync_lock:
+        if _indice.versao != versao:
+            conn = pool.obter()
+            try:
+                cursor = conn.cursor()
+                if not _aplicar_feed(cursor, versao):
+                    seq = mudancas.ultima_seq(cursor)  # antes da leitura: no máximo reaplica algo
+                    with metricas.cronometro("db_consulta_segundos", operacao="sincronizar_indice"):
+                        _indice.sincronizar(cursor, versao)
+                    _indice.seq = seq
+            finally:
+                conn.close()
+    return _indice
+
+
+def versao_precos(material, estado):
+    """
+    Versão dos preços da chave (material, estado) para caches: muda sempre
+    que o top() dela pode ter mudado.
+    """
+    fonte = _fonte
+    if fonte is not None:
+        return carimbo_versao(fonte.caminho)
+    if not indice_habilitado():
+        return carimbo_versao(obter_pool().caminho)
+    return obter_indice().versao_chave(material, estado)
+
+
+def versao_precos_material(material, estados):
+    """Como versao_precos, para o material em todos os `estados` de uma vez."""
+    fonte = _fonte
+    if fonte is not None:
+        return carimbo_versao(fonte.caminho)
+    if not indice_habilitado():
+        return carimbo_versao(obter_pool().caminho)
+    indice = obter_indice()
+    return indice.geracao, tuple(indice.versao_chave(material, estado)[1] for estado in estados)
+
+
+def _aplicar_feed(cursor, versao):
+    """Atualiza o índice pelo feed de mudanças; False se precisar reler tudo."""
+    if _indice.seq is None or _indice.versao is None or not mesmo_arquivo(_indice.versao, versao):
+        return False
+    with metricas.cronometro("db_consulta_segundos", operacao="aplicar_mudancas_indice"):
+        mudou, seq = mudancas.estrutura_mudou(cursor, _indice.seq)
+        if mudou or seq is None:
+            return False
+        cursor.execute(SQL_CHAVES_ALTERADAS, (_indice.seq, seq))
+        alteradas = {(material, estado): ultimo for material, estado, ultimo in cursor}
+        _indice.atualizar_chaves(cursor, alteradas, seq, versao)
+    return True
@@ -0,0 +1,337 @@
+"""
+Carga em massa do catálogo (materiais, fornecedores e preços).
+
+Lê planilhas CSV (com cabeçalho) ou JSONL em blocos, grava tudo num arquivo
+novo ao lado da base e, no fim, troca o arquivo de lugar com os.replace
+(atômico): quem já está lendo a base antiga continua lendo-a, e as próximas
+conexões do pool já abrem a nova.
+
+Colunas esperadas:
+  materiais:    codigo, nome, categoria
+  fornecedores: codigo, nome, estado
+  precos:       codigo_fornecedor, estado, codigo_material, valor
+
+Um fornecedor é identificado por (codigo, estado): a mesma rede tem uma
+linha por estado. Materiais são identificados pelo codigo e preços por
+(fornecedor, material). Linhas repetidas atualizam as anteriores (upsert).
+
+Uso:
+  python ingestao.py --materiais m.csv --fornecedores f.csv --precos p.jsonl
+  python ingestao.py --precos p.csv --destino outra_base.db --vazia
+"""
+import argparse
+import csv
+import json
+import os
+import resource
+import sqlite3
+import sys
+import time
+from itertools import islice
+from urllib.parse import quote
+
+import mudancas
+from db_pool import DB_PADRAO, trava_base
+
+TAMANHO_LOTE = 50_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fornecedores (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    nome TEXT,
+    estado TEXT,
+    codigo TEXT
+);
+CREATE TABLE IF NOT EXISTS materiais (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    nome TEXT,
+    codigo TEXT,
+    categoria TEXT
+);
+CREATE TABLE IF NOT EXISTS precos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fornecedor_id INTEGER,
+    material_id INTEGER,
+    valor REAL,
+    FOREIGN KEY (fornecedor_id) REFERENCES fornecedores(id),
+    FOREIGN KEY (material_id) REFERENCES materiais(id)
+);
+"""
+
+# Chaves de upsert: precisam existir antes da carga.
+INDICES_UNICOS = """
+CREATE UNIQUE INDEX IF NOT EXISTS ux_materiais_codigo ON materiais(codigo);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_fornecedores_codigo_estado ON fornecedores(codigo, estado);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_precos_fornecedor_material ON precos(fornecedor_id, material_id);
+"""
+
+# Índices de consulta: criados depois da carga (bem mais rápido que mantê-los
+# a cada INSERT). consultar_fornecedores compara com minusculas() (LOWER() só
+# conhece ASCII) e chega aos preços por ix_precos_material_valor; os de LOWER()
+# ficam para consultas feitas de fora do app.
+INDICES_CONSULTA = """
+CREATE INDEX IF NOT EXISTS ix_precos_material_valor ON precos(material_id, valor, fornecedor_id);
+CREATE INDEX IF NOT EXISTS ix_materiais_nome_lower ON materiais(LOWER(nome));
+CREATE INDEX IF NOT EXISTS ix_materiais_categoria_lower ON materiais(LOWER(categoria));
+CREATE INDEX IF NOT EXISTS ix_fornecedores_estado_lower ON fornecedores(LOWER(estado));
+"""
+
+PRAGMAS_CARGA = (
+    "PRAGMA journal_mode = OFF",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA locking_mode = EXCLUSIVE",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -262144",
+)
+
+SQL_MATERIAIS = """
+INSERT INTO materiais (codigo, nome, categoria) VALUES (?, ?, ?)
+ON CONFLICT(codigo) DO UPDATE SET nome = excluded.nome, categoria = excluded.categoria
+"""
+
+SQL_FORNECEDORES = """
+INSERT INTO fornecedores (codigo, nome, estado) VALUES (?, ?, ?)
+ON CONFLICT(codigo, estado) DO UPDATE SET nome = excluded.nome
+"""
+
+# A resolução codigo -> id acontece dentro do SQLite, pelos índices únicos,
+# então a memória do processo não cresce com o número de linhas de preço.
+SQL_PRECOS = """
+INSERT INTO precos (fornecedor_id, material_id, valor)
+SELECT f.id, m.id, ?
+FROM fornecedores f, materiais m
+WHERE f.codigo = ? AND f.estado = ? AND m.codigo = ?
+ON CONFLICT(fornecedor_id, material_id) DO UPDATE SET valor = excluded.valor
+"""
+
+
+class ErroIngestao(Exception):
+    pass
+
+
+# --- leitura --------------------------------------------------------------------
+def ler_registros(caminho):
+    """Gera dicts linha a linha (CSV com cabeçalho ou JSONL), sem carregar o arquivo."""
+    if caminho.endswith((".jsonl", ".ndjson")):
+        with open(caminho, encoding="utf-8") as arquivo:
+            for numero, linha in enumerate(arquivo, 1):
+                linha = linha.strip()
+                if not linha:
+                    continue
+                try:
+                    registro = json.loads(linha)
+                except ValueError as exc:
+                    raise ErroIngestao(f"{caminho}:{numero}: JSON inválido ({exc})") from None
+                if not isinstance(registro, dict):
+                    raise ErroIngestao(f"{caminho}:{numero}: a linha não é um objeto JSON")
+                yield registro
+    else:
+        with open(caminho, newline="", encoding="utf-8-sig") as arquivo:
+            yield from csv.DictReader(arquivo)
+
+
+def _texto(valor):
+    return str(valor).strip() if valor is not None else ""
+
+
+def _valor(valor):
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    texto = _texto(valor)
+    if "," in texto and "." not in texto:
+        texto = texto.replace(",", ".")  # planilhas com vírgula decimal
+    return float(texto)
+
+
+def tuplas_materiais(registros, rejeitadas):
+    for r in registros:
+        codigo, nome = _texto(r.get("codigo")), _texto(r.get("nome"))
+        if not codigo or not nome:
+            rejeitadas["materiais"] += 1
+            continue
+        yield codigo, nome, _texto(r.get("categoria"))
+
+
+def tuplas_fornecedores(registros, rejeitadas):
+    for r in registros:
+        codigo, nome, estado = _texto(r.get("codigo")), _texto(r.get("nome")), _texto(r.get("estado"))
+        if not codigo or not nome or not estado:
+            rejeitadas["fornecedores"] += 1
+            continue
+        yield codigo, nome, estado
+
+
+def tuplas_precos(registros, rejeitadas):
+    for r in registros:
+        try:
+            valor = _valor(r.get("valor"))
+        except (TypeError, ValueError):
+            rejeitadas["precos"] += 1
+            continue
+        yield (valor, _texto(r.get("codigo_fornecedor")), _texto(r.get("estado")),
+               _texto(r.get("codigo_material")))
+
+
+def em_lotes(iteravel, tamanho):
+    iterador = iter(iteravel)
+    while True:
+        lote = list(islice(iterador, tamanho))
+        if not lote:
+            return
+        yield lote
+
+
+# --- carga ----------------------------------------------------------------------
+def _preparar_arquivo(destino, temporario, vazia):
+    if os.path.exists(temporario):
+        os.remove(temporario)
+    conn = sqlite3.connect(temporario, isolation_level=None)
+    if not vazia and os.path.exists(destino):
+        origem = sqlite3.connect("file:" + quote(destino) + "?mode=ro", uri=True)
+        try:
+            origem.backup(conn)  # cópia consistente mesmo com leitores ativos
+        finally:
+            origem.close()
+    for pragma in PRAGMAS_CARGA:
+        conn.execute(pragma)
+    conn.executescript(SCHEMA)
+    try:
+        conn.executescript(INDICES_UNICOS)
+    except sqlite3.IntegrityError as exc:
+        conn.close()
+        os.remove(temporario)
+        raise ErroIngestao(f"a base atual tem códigos duplicados, não dá para fazer upsert: {exc}")
+    return conn
+
+
+def _carregar(conn, sql, tuplas, tamanho_lote, contadores, tabela):
+    for lote in em_lotes(tuplas, tamanho_lote):
+        antes = conn.total_changes
+        conn.execute("BEGIN")
+        conn.executemany(sql, lote)
+        conn.execute("COMMIT")
+        gravadas = conn.total_changes - antes
+        contadores["lidas"][tabela] += len(lote)
+        contadores["gravadas"][tabela] += gravadas
+        if tabela == "precos":
+            # INSERT ... SELECT não grava nada quando o código não existe
+            contadores["rejeitadas"]["precos"] += len(lote) - gravadas
+
+
+def _esvaziar_wal(destino):
+    """
+    Devolve o -wal deixado pelas gravações da API para a base antes da cópia.
+    Chamada com a trava exclusiva: nenhuma gravação está em andamento.
+    """
+    wal = destino + "-wal"
+    if not os.path.exists(wal) or os.path.getsize(wal) == 0:
+        return
+    conn = sqlite3.connect(destino, timeout=30.0)
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+    if os.path.exists(wal) and os.path.getsize(wal) > 0:
+        raise ErroIngestao("a base atual tem um -wal pendente (leitor preso?); tente de novo")
+
+
+def ingerir(destino=None, materiais=None, fornecedores=None, precos=None,
+            vazia=False, tamanho_lote=TAMANHO_LOTE, verificar=False):
+    """
+    Monta a base nova e a coloca no lugar de `destino`.
+    Retorna um dict com contagens, tempo e linhas/s.
+    Aceita caminhos de arquivo ou iteráveis de dicts em cada fonte.
+    """
+    destino = os.path.abspath(destino or os.environ.get("DB_PATH") or DB_PADRAO)
+    temporario = f"{destino}.novo-{os.getpid()}"
+
+    contadores = {
+        "lidas": {"materiais": 0, "fornecedores": 0, "precos": 0},
+        "gravadas": {"materiais": 0, "fornecedores": 0, "precos": 0},
+        "rejeitadas": {"materiais": 0, "fornecedores": 0, "precos": 0},
+    }
+    rejeitadas = contadores["rejeitadas"]
+
+    def fonte(origem):
+        return ler_registros(origem) if isinstance(origem, str) else origem
+
+    inicio = time.perf_counter()
+    # Trava exclusiva da cópia até a troca: gravações da API (escrita_precos.py)
+    # recusam nesse intervalo, em vez de cair na base que vai ser descartada.
+    with trava_base(destino, exclusiva=True):
+        _esvaziar_wal(destino)
+        conn = _preparar_arquivo(destino, temporario, vazia)
+        # Os gatilhos do feed de mudanças (mudancas.py) gravariam uma linha por
+        # preço carregado: saem durante a carga e voltam no fim com uma marca de
+        # recarga geral.
+        com_feed = mudancas.remover_gatilhos(conn)
+        try:
+            if materiais is not None:
+                _carregar(conn, SQL_MATERIAIS, tuplas_materiais(fonte(materiais), rejeitadas),
+                          tamanho_lote, contadores, "materiais")
+            if fornecedores is not None:
+                _carregar(conn, SQL_FORNECEDORES, tuplas_fornecedores(fonte(fornecedores), rejeitadas),
+                          tamanho_lote, contadores, "fornecedores")
+            if precos is not None:
+                _carregar(conn, SQL_PRECOS, tuplas_precos(fonte(precos), rejeitadas),
+                          tamanho_lote, contadores, "precos")
+
+            if com_feed:
+                mudancas.instalar(conn)
+                mudancas.registrar_recarga(conn)
+
+            t_indices = time.perf_counter()
+            conn.executescript(INDICES_CONSULTA)
+            conn.execute("ANALYZE")
+            contadores["segundos_indices"] = round(time.perf_counter() - t_indices, 3)
+
+            if verificar:
+                resultado = conn.execute("PRAGMA quick_check").fetchone()[0]
+                if resultado != "ok":
+                    raise ErroIngestao(f"quick_check falhou: {resultado}")
+            conn.close()
+        except BaseException:
+            conn.close()
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+
+        with open(temporario, "rb") as arquivo:
+            os.fsync(arquivo.fileno())
+        os.replace(temporario, destino)
+
+    segundos = time.perf_counter() - inicio
+    total = sum(contadores["lidas"].values())
+    contadores["destino"] = destino
+    contadores["segundos"] = round(segundos, 3)
+    contadores["linhas_por_segundo"] = round(total / segundos) if segundos else total
+    contadores["rss_max_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return contadores
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Carga em massa do catálogo do MeliBuy.")
+    parser.add_argument("--materiais", help="CSV/JSONL com codigo, nome, categoria")
+    parser.add_argument("--fornecedores", help="CSV/JSONL com codigo, nome, estado")
+    parser.add_argument("--precos", help="CSV/JSONL com codigo_fornecedor, estado, codigo_material, valor")
+    parser.add_argument("--destino", help="arquivo SQLite de destino (padrão: DB_PATH ou base_chatbot2.db)")
+    parser.add_argument("--vazia", action="store_true", help="não parte da base atual; monta do zero")
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE, help="linhas por executemany")
+    parser.add_argument("--verificar", action="store_true", help="roda PRAGMA quick_check antes da troca")
+    args = parser.parse_args(argv)
+
+    if not (args.materiais or args.fornecedores or args.precos):
+        parser.error("informe ao menos um de --materiais, --fornecedores ou --precos")
+
+    try:
+        resultado = ingerir(args.destino, args.materiais, args.fornecedores, args.precos,
+                            vazia=args.vazia, tamanho_lote=args.lote, verificar=args.verificar)
+    except ErroIngestao as exc:
+        print(f"erro: {exc}", file=sys.stderr)
+        return 1
+    print(json.dumps(resultado, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+import bisect
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+
+# -----------------------------------------------------------------------------
+# Métricas do processo (formato texto do Prometheus) e perfil por amostragem
+# -----------------------------------------------------------------------------
+# Contadores e histogramas ficam em memória, por processo; cada worker do
+# gunicorn expõe os seus em /metrics (o Prometheus agrega por instância).
+# O custo de uma medida é um perf_counter() e um incremento sob lock.
+#
+# O perfil por amostragem é opcional: com PERFIL_HABILITADO=1, uma
+# requisição com o header "X-Profile: 1" é acompanhada por uma thread que
+# lê a pilha da thread da requisição a cada PERFIL_INTERVALO_MS e conta as
+# pilhas no formato "collapsed" (entrada de flamegraph.pl / speedscope).
+#
+#   METRICAS             "0" desliga a coleta (padrão: ligada)
+#   PERFIL_HABILITADO    "1" permite o header X-Profile (padrão: desligado)
+#   PERFIL_INTERVALO_MS  intervalo entre amostras (padrão: 1)
+#   PERFIL_MAX_GUARDADOS perfis mantidos para consulta (padrão: 20)
+
+HABILITADAS = os.environ.get("METRICAS", "1") != "0"
+PERFIL_HABILITADO = os.environ.get("PERFIL_HABILITADO", "0") == "1"
+PERFIL_INTERVALO_S = float(os.environ.get("PERFIL_INTERVALO_MS", 1)) / 1000
+PERFIL_MAX_GUARDADOS = int(os.environ.get("PERFIL_MAX_GUARDADOS", 20))
+
+# Limites (segundos) dos buckets: de 10µs a 5s, cobrindo desde um acerto no
+# índice em memória até uma recarga de catálogo grande.
+BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+           0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+DESCRICOES = {
+    "http_requisicoes_segundos": "Duração das requisições HTTP por rota, método e status.",
+    "db_conexao_segundos": "Tempo para obter uma conexão do pool (reuso ou abertura).",
+    "db_consulta_segundos": "Duração das operações de banco e de catálogo do bot.",
+    "chat_etapa_segundos": "Duração de um turno de processar_mensagem_chatbot por etapa de origem.",
+    "chat_transicoes_total": "Turnos de chat por transição de etapa (de -> para).",
+    "precos_gravados_total": "Itens gravados por POST/PUT /precos.",
+    "aquecimento_etapa_segundos": "Duração de cada etapa do aquecimento do worker.",
+    "admissao_total": "Requisições protegidas por cliente, rota e resultado da admissão.",
+    "snapshot_recusado_total": "Trocas do snapshot mmap recusadas por arquivo inválido.",
+}
+
+_lock = threading.Lock()
+_contadores = {}   # (nome, rotulos) -> valor
+_histogramas = {}  # (nome, rotulos) -> [contagens por bucket..., soma, total]
+
+
+def _chave(nome, rotulos):
+    return nome, tuple(sorted(rotulos.items()))
+
+
+def incrementar(nome, valor=1, **rotulos):
+    if not HABILITADAS:
+        return
+    chave = _chave(nome, rotulos)
+    with _lock:
+        _contadores[chave] = _contadores.get(chave, 0) + valor
+
+
+def observar(nome, segundos, **rotulos):
+    if not HABILITADAS:
+        return
+    chave = _chave(nome, rotulos)
+    posicao = bisect.bisect_left(BUCKETS, segundos)
+    with _lock:
+        dados = _histogramas.get(chave)
+        if dados is None:
+            dados = _histogramas[chave] = [0] * (len(BUCKETS) + 2)
+        if posicao < len(BUCKETS):
+            dados[posicao] += 1
+        dados[-2] += segundos
+        dados[-1] += 1
+
+
+class cronometro:
+    """
+    Mede o bloco e registra no histograma `nome`:
+
+        with cronometro("db_consulta_segundos", operacao="fornecedores"):
+            ...
+    """
+    __slots__ = ("nome", "rotulos", "inicio")
+
+    def __init__(self, nome, **rotulos):
+        self.nome = nome
+        self.rotulos = rotulos
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observar(self.nome, time.perf_counter() - self.inicio, **self.rotulos)
+        return False
+
+
+def limpar():
+    with _lock:
+        _contadores.clear()
+        _histogramas.clear()
+
+
+# --- exportação ---------------------------------------------------------------
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _rotulos_texto(rotulos):
+    if not rotulos:
+        return ""
+    return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in rotulos) + "}"
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def _cabecalho(linhas, nome, tipo, vistos):
+    if nome in vistos:
+        return
+    vistos.add(nome)
+    if nome in DESCRICOES:
+        linhas.append(f"# HELP {nome} {DESCRICOES[nome]}")
+    linhas.append(f"# TYPE {nome} {tipo}")
+
+
+def exportar(medidores=()):
+    """
+    Texto no formato de exposição do Prometheus (versão 0.0.4).
+    `medidores`: amostras extras (nome, valor, {rotulos}, ajuda) exportadas
+    como gauge, para estados lidos na hora (pool, cache...).
+    """
+    with _lock:
+        contadores = sorted(_contadores.items())
+        histogramas = sorted((chave, list(dados)) for chave, dados in _histogramas.items())
+
+    linhas, vistos = [], set()
+    for (nome, rotulos), valor in contadores:
+        _cabecalho(linhas, nome, "counter", vistos)
+        linhas.append(f"{nome}{_rotulos_texto(rotulos)} {_numero(valor)}")
+
+    for (nome, rotulos), dados in histogramas:
+        _cabecalho(linhas, nome, "histogram", vistos)
+        acumulado = 0
+        for limite, contagem in zip(BUCKETS, dados):
+            acumulado += contagem
+            linhas.append(f"{nome}_bucket{_rotulos_texto(rotulos + (('le', repr(limite)),))} {acumulado}")
+        linhas.append(f"{nome}_bucket{_rotulos_texto(rotulos + (('le', '+Inf'),))} {dados[-1]}")
+        linhas.append(f"{nome}_sum{_rotulos_texto(rotulos)} {_numero(dados[-2])}")
+        linhas.append(f"{nome}_count{_rotulos_texto(rotulos)} {dados[-1]}")
+
+    for nome, valor, rotulos, ajuda in medidores:
+        if nome not in vistos:
+            vistos.add(nome)
+            linhas.append(f"# HELP {nome} {ajuda}")
+            linhas.append(f"# TYPE {nome} gauge")
+        linhas.append(f"{nome}{_rotulos_texto(tuple(sorted(rotulos.items())))} {_numero(valor)}")
+    return "\n".join(linhas) + "\n"
+
+
+# --- perfil por amostragem -----------------------------------------------------
+def perfil_solicitado(valor_header):
+    return PERFIL_HABILITADO and (valor_header or "").strip().lower() in ("1", "true", "sim")
+
+
+class AmostradorPerfil:
+    """Amostra a pilha de uma thread até parar(); resultado em formato collapsed."""
+
+    def __init__(self, thread_id=None, intervalo_s=None):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.intervalo_s = intervalo_s if intervalo_s is not None else PERFIL_INTERVALO_S
+        self.pilhas = Counter()
+        self.amostras = 0
+        self._parar = threading.Event()
+        self._thread = None
+        self.inicio = self.fim = None
+
+    def _amostrar(self):
+        proprio = threading.get_ident()
+        while not self._parar.wait(self.intervalo_s):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None or self.thread_id == proprio or self._parar.is_set():
+                continue
+            pilha = []
+            while frame is not None:
+                codigo = frame.f_code
+                pilha.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.pilhas[";".join(reversed(pilha))] += 1
+            self.amostras += 1
+
+    def iniciar(self):
+        self.inicio = time.perf_counter()
+        self._thread = threading.Thread(target=self._amostrar, name="perfil", daemon=True)
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.fim = time.perf_counter()
+        return self
+
+    def collapsed(self):
+        return "".join(f"{pilha} {n}\n" for pilha, n in self.pilhas.most_common())
+
+
+_perfis = OrderedDict()  # id -> (descrição, texto collapsed)
+_perfis_lock = threading.Lock()
+
+
+def guardar_perfil(amostrador, descricao):
+    """Guarda o perfil para consulta posterior e devolve o id."""
+    texto = (f"# {descricao} amostras={amostrador.amostras} "
+             f"duracao_ms={(amostrador.fim - amostrador.inicio) * 1000:.2f}\n" + amostrador.collapsed())
+    with _perfis_lock:
+        perfil_id = f"{time.time_ns():x}"
+        _perfis[perfil_id] = texto
+        while len(_perfis) > PERFIL_MAX_GUARDADOS:
+            _perfis.popitem(last=False)
+    return perfil_id
+
+
+def obter_perfil(perfil_id):
+    with _perfis_lock:
+        return _perfis.get(perfil_id)
@@ -0,0 +1,146 @@
+import os
+import sqlite3
+
+# -----------------------------------------------------------------------------
+# Feed de mudanças da base (sequência publicada para caches e workers)
+# -----------------------------------------------------------------------------
+# Gatilhos em precos, materiais e fornecedores gravam uma linha por registro
+# alterado na tabela `mudancas`, na mesma transação da alteração. O `seq`
+# (AUTOINCREMENT, nunca reaproveitado) é o número de sequência das mudanças:
+# quem guardou o último seq que viu pergunta só "o que veio depois?" e
+# invalida apenas o que mudou.
+#
+#   - linhas de 'precos' carregam fornecedor_id/material_id, o que basta para
+#     saber qual chave (material, estado) do índice de preços foi afetada;
+#   - linhas de 'materiais' e 'fornecedores' mudam nomes, categorias ou
+#     estados: quem lê o feed recarrega tudo.
+#
+# O feed é podado (MUDANCAS_RETENCAO linhas mais recentes). Quem ficou para
+# trás além disso, ou está olhando outro arquivo (carga com os.replace),
+# recebe None e faz a releitura completa.
+#
+#   MUDANCAS_RETENCAO  linhas mantidas no feed (padrão: 100000)
+
+RETENCAO = int(os.environ.get("MUDANCAS_RETENCAO", 100_000))
+
+DDL = """
+CREATE TABLE IF NOT EXISTS mudancas (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    tabela TEXT NOT NULL,
+    registro_id INTEGER,
+    fornecedor_id INTEGER,
+    material_id INTEGER,
+    criado_em TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+);
+
+CREATE TRIGGER IF NOT EXISTS mudancas_precos_insert AFTER INSERT ON precos BEGIN
+    INSERT INTO mudancas (tabela, registro_id, fornecedor_id, material_id)
+    VALUES ('precos', NEW.id, NEW.fornecedor_id, NEW.material_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS mudancas_precos_update AFTER UPDATE ON precos BEGIN
+    INSERT INTO mudancas (tabela, registro_id, fornecedor_id, material_id)
+    SELECT 'precos', OLD.id, OLD.fornecedor_id, OLD.material_id
+    WHERE OLD.id IS NOT NEW.id
+       OR OLD.fornecedor_id IS NOT NEW.fornecedor_id
+       OR OLD.material_id IS NOT NEW.material_id;
+    INSERT INTO mudancas (tabela, registro_id, fornecedor_id, material_id)
+    VALUES ('precos', NEW.id, NEW.fornecedor_id, NEW.material_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS mudancas_precos_delete AFTER DELETE ON precos BEGIN
+    INSERT INTO mudancas (tabela, registro_id, fornecedor_id, material_id)
+    VALUES ('precos', OLD.id, OLD.fornecedor_id, OLD.material_id);
+END;
+"""
+
+# materiais e fornecedores: só o registro, quem lê recarrega tudo
+for _tabela in ("materiais", "fornecedores"):
+    for _evento, _linha in (("insert", "NEW"), ("update", "NEW"), ("delete", "OLD")):
+        DDL += f"""
+CREATE TRIGGER IF NOT EXISTS mudancas_{_tabela}_{_evento} AFTER {_evento.upper()} ON {_tabela} BEGIN
+    INSERT INTO mudancas (tabela, registro_id) VALUES ('{_tabela}', {_linha}.id);
+END;
+"""
+del _tabela, _evento, _linha
+
+
+def instalar(conn):
+    """Cria a tabela e os gatilhos (idempotente). `conn` precisa poder escrever."""
+    conn.executescript(DDL)
+
+
+def remover_gatilhos(conn):
+    """Desliga os gatilhos (carga em massa); a tabela continua lá. True se existiam."""
+    nomes = [linha[0] for linha in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'mudancas_%'")]
+    for nome in nomes:
+        conn.execute(f"DROP TRIGGER {nome}")
+    return bool(nomes)
+
+
+def registrar_recarga(conn):
+    """
+    Marca no feed uma mudança geral (ex.: depois de uma carga em massa): quem
+    lê o feed trata como mudança de estrutura e recarrega tudo.
+    """
+    conn.execute("INSERT INTO mudancas (tabela) VALUES ('recarga')")
+
+
+def ultima_seq(cursor):
+    """Último seq publicado; 0 se nada mudou ainda e None se a base não tem feed."""
+    try:
+        cursor.execute("SELECT MAX(seq) FROM mudancas")
+    except sqlite3.OperationalError:
+        return None
+    return cursor.fetchone()[0] or 0
+
+
+def _faixa(cursor, desde):
+    """(menor, maior) seq do feed, ou None se o feed não cobre o que veio depois de `desde`."""
+    try:
+        cursor.execute("SELECT MIN(seq), MAX(seq) FROM mudancas")
+    except sqlite3.OperationalError:
+        return None
+    menor, maior = cursor.fetchone()
+    if maior is None:
+        return (0, 0) if desde == 0 else None
+    if desde > maior or (desde < menor - 1):
+        return None  # outro arquivo ou entradas já podadas
+    return menor, maior
+
+
+def estrutura_mudou(cursor, desde):
+    """
+    (mudou, seq_atual): mudou=True se, depois de `desde`, algo além de preços
+    mudou ou o feed não cobre o intervalo.
+    """
+    faixa = _faixa(cursor, desde)
+    if faixa is None:
+        return True, ultima_seq(cursor)
+    cursor.execute("SELECT 1 FROM mudancas WHERE seq > ? AND tabela <> 'precos' LIMIT 1", (desde,))
+    return cursor.fetchone() is not None, faixa[1]
+
+
+def ler(cursor, desde, limite=None):
+    """
+    Mudanças com seq > `desde`, em ordem: (seq_atual, [(seq, tabela,
+    registro_id, fornecedor_id, material_id), ...]). Com `limite`, seq_atual
+    é o da última linha devolvida. None quando o feed não cobre o intervalo.
+    """
+    faixa = _faixa(cursor, desde)
+    if faixa is None:
+        return None
+    cursor.execute(
+        "SELECT seq, tabela, registro_id, fornecedor_id, material_id FROM mudancas "
+        "WHERE seq > ? ORDER BY seq LIMIT ?",
+        (desde, -1 if limite is None else limite))
+    linhas = cursor.fetchall()
+    if limite is not None and len(linhas) == limite:
+        return linhas[-1][0], linhas
+    return faixa[1], linhas
+
+
+def podar(conn, seq_atual, retencao=RETENCAO):
+    """Remove as entradas além das `retencao` mais recentes."""
+    conn.execute("DELETE FROM mudancas WHERE seq <= ?", (seq_atual - retencao,))
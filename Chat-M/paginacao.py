@@ -0,0 +1,60 @@
+import zlib
+from bisect import bisect_left, bisect_right
+
+# -----------------------------------------------------------------------------
+# Paginação por chave (keyset) com cursores opacos
+# -----------------------------------------------------------------------------
+# Uma página é definida pela chave da última (ou primeira) linha da página
+# anterior, não por um deslocamento: inserções e remoções entre uma página e
+# outra não fazem linhas pularem nem se repetirem. As chaves são os ids da
+# base em ordem crescente (a mesma ordem das listagens), então achar o início
+# da página é uma busca binária.
+#
+# O cursor é texto curto, só com [0-9a-f.pa], para sobreviver à normalização
+# (minúsculas) da chave do cache de respostas:
+#   "p<id>.<escopo>"  próxima página: ids maiores que <id>
+#   "a<id>.<escopo>"  página anterior: ids menores que <id>
+# <escopo> (crc32 do que está sendo listado, ex.: a categoria) impede usar o
+# cursor de uma listagem em outra.
+
+
+def _escopo(escopo):
+    return format(zlib.crc32(escopo.lower().encode("utf-8")), "x")
+
+
+def codificar(direcao, chave, escopo):
+    return f"{direcao}{chave:x}.{_escopo(escopo)}"
+
+
+def decodificar(cursor, escopo):
+    """(direcao, chave) do cursor; ValueError se for inválido ou de outra listagem."""
+    cursor = (cursor or "").strip().lower()
+    corpo, _, assinatura = cursor.partition(".")
+    if len(corpo) < 2 or corpo[0] not in "pa" or assinatura != _escopo(escopo):
+        raise ValueError("cursor inválido")
+    return corpo[0], int(corpo[1:], 16)
+
+
+def pagina(chaves, limite, cursor=None, escopo=""):
+    """
+    Fatia [inicio, fim) de `chaves` (ordenadas) para a página pedida, mais os
+    cursores da próxima e da anterior (None quando não há).
+    """
+    total = len(chaves)
+    if not cursor:
+        inicio = 0
+        fim = min(limite, total)
+    else:
+        direcao, chave = decodificar(cursor, escopo)
+        if direcao == "p":
+            inicio = bisect_right(chaves, chave)
+            fim = min(inicio + limite, total)
+        else:
+            fim = bisect_left(chaves, chave)
+            inicio = max(0, fim - limite)
+    proximo = anterior = None
+    if fim < total:
+        proximo = codificar("p", chaves[fim - 1] if fim else chaves[0] - 1, escopo)
+    if inicio > 0:
+        anterior = codificar("a", chaves[inicio] if inicio < total else chaves[-1] + 1, escopo)
+    return inicio, fim, proximo, anterior
@@ -0,0 +1,378 @@
+import heapq
+import math
+import os
+from array import array
+from functools import lru_cache
+
+import metricas
+from cache_consultas import CacheCoalescente
+from catalogo import obter_catalogo
+from db_pool import obter_pool
+from estados import dobrar_acentos
+from indice_precos import indice_habilitado, obter_indice, versao_precos_material
+
+try:
+    import numpy as np
+except ImportError:  # opcional: sem NumPy o mesmo cálculo roda em Python puro
+    np = None
+
+# -----------------------------------------------------------------------------
+# Ranking de fornecedores por vários critérios
+# -----------------------------------------------------------------------------
+# consultar_fornecedores só devolve os mais baratos de um material num único
+# estado. Aqui os preços de um material em todos os estados ficam numa tabela
+# em colunas (valor, fornecedor), agrupada por estado e em ordem de preço
+# dentro de cada um, montada uma vez por versão dos preços do material e
+# guardada num LRU. A consulta calcula distância, prazo e pontuação das
+# linhas de uma vez (vetorizado com NumPy, se instalado) e pega os k
+# melhores sem ordenar tudo.
+#
+# Nos critérios em que preço maior nunca pontua melhor na mesma distância
+# (todos os de fábrica), só as k linhas mais baratas de cada estado dentro do
+# raio podem entrar no top-k: a consulta custa O(estados x k), não importa o
+# tamanho do catálogo. A cesta, que precisa da melhor linha de cada
+# fornecedor, pontua todas as linhas dos estados no raio.
+#
+# A base não tem endereço nem prazo de entrega: a distância é em linha reta
+# entre as capitais (ou a cidade, nas subdivisões de MG) e o prazo é
+# estimado a partir dela. "Vizinhos" são os estados dentro de raio_km.
+#
+# Critérios (menor pontuação vence; empate fica com o menor preço):
+#   preco        só o preço
+#   preco_frete  preço + frete proporcional à distância
+#   prazo        prazo estimado em dias
+# Novos critérios entram com registrar_criterio().
+#
+#   RANKING_NUMPY             "0" força o cálculo em Python puro (padrão: 1)
+#   RANKING_FRETE_POR_1000KM  frete, em fração do preço, a cada 1000 km (padrão: 0.1)
+#   RANKING_KM_POR_DIA        distância percorrida por dia de entrega (padrão: 500)
+#   RANKING_PRAZO_BASE_DIAS   prazo dentro do próprio estado (padrão: 1)
+#   RANKING_RAIO_MAX_KM       maior raio aceito nas consultas (padrão: 5000)
+#   RANKING_MATERIAIS_MAX     tabelas de materiais mantidas em memória (padrão: 2048)
+#   RANKING_RAIO_CHAT_KM      raio da comparação "região" do chat (padrão: 1000)
+
+USAR_NUMPY = np is not None and os.environ.get("RANKING_NUMPY", "1") != "0"
+FRETE_POR_1000KM = float(os.environ.get("RANKING_FRETE_POR_1000KM", 0.1))
+KM_POR_DIA = float(os.environ.get("RANKING_KM_POR_DIA", 500))
+PRAZO_BASE_DIAS = int(os.environ.get("RANKING_PRAZO_BASE_DIAS", 1))
+RAIO_MAXIMO_KM = float(os.environ.get("RANKING_RAIO_MAX_KM", 5000))
+MATERIAIS_MAX = int(os.environ.get("RANKING_MATERIAIS_MAX", 2048))
+RAIO_CHAT_KM = float(os.environ.get("RANKING_RAIO_CHAT_KM", 1000))
+
+CRITERIO_PADRAO = "preco"
+CRITERIO_CHAT = "preco_frete"
+
+# (latitude, longitude) das capitais, pelo nome sem acentos; nas subdivisões
+# de Minas Gerais usadas pela base, a da cidade.
+COORDENADAS = {
+    "acre": (-9.97, -67.81), "alagoas": (-9.67, -35.74), "amapa": (0.03, -51.07),
+    "amazonas": (-3.12, -60.02), "bahia": (-12.97, -38.50), "ceara": (-3.73, -38.52),
+    "distrito federal": (-15.79, -47.88), "espirito santo": (-20.32, -40.34),
+    "goias": (-16.68, -49.25), "maranhao": (-2.53, -44.30), "mato grosso": (-15.60, -56.10),
+    "mato grosso do sul": (-20.44, -54.65), "minas gerais": (-19.92, -43.94),
+    "minas gerais (betim)": (-19.97, -44.20), "minas gerais (extrema)": (-22.85, -46.32),
+    "para": (-1.46, -48.50), "paraiba": (-7.12, -34.86), "parana": (-25.43, -49.27),
+    "pernambuco": (-8.05, -34.88), "piaui": (-5.09, -42.80), "rio de janeiro": (-22.91, -43.17),
+    "rio grande do norte": (-5.79, -35.21), "rio grande do sul": (-30.03, -51.23),
+    "rondonia": (-8.76, -63.90), "roraima": (2.82, -60.67), "santa catarina": (-27.60, -48.55),
+    "sao paulo": (-23.55, -46.63), "sergipe": (-10.91, -37.07), "tocantins": (-10.18, -48.33),
+}
+
+RAIO_TERRA_KM = 6371.0
+
+SQL_PRECOS_MATERIAL = """
+SELECT f.nome, f.estado, f.codigo, m.nome, m.codigo, p.valor
+FROM precos p
+JOIN fornecedores f ON f.id = p.fornecedor_id
+JOIN materiais m ON m.id = p.material_id
+WHERE minusculas(m.nome) = minusculas(?)
+ORDER BY p.valor ASC, p.id ASC
+"""
+
+
+# --- critérios ---------------------------------------------------------------------
+CRITERIOS = {}
+
+
+def registrar_criterio(nome, funcao, crescente_no_preco=False):
+    """
+    funcao(valor, km, prazo) -> pontuação (menor é melhor). Recebe vetores do
+    NumPy ou números soltos, conforme o modo, então deve usar só aritmética.
+    crescente_no_preco=True declara que, na mesma distância, preço maior nunca
+    pontua melhor: o top-k só precisa das k linhas mais baratas de cada estado.
+    """
+    CRITERIOS[nome] = (funcao, crescente_no_preco)
+
+
+registrar_criterio("preco", lambda valor, km, prazo: valor, crescente_no_preco=True)
+registrar_criterio("preco_frete", lambda valor, km, prazo: valor * (1 + FRETE_POR_1000KM * km / 1000),
+                   crescente_no_preco=True)
+registrar_criterio("prazo", lambda valor, km, prazo: prazo, crescente_no_preco=True)
+
+
+# --- distâncias --------------------------------------------------------------------
+def _normalizar_estado(estado):
+    return dobrar_acentos(estado).strip()
+
+
+def distancia_km(origem, destino):
+    """Distância em linha reta entre dois estados; None se faltar coordenada."""
+    a, b = _normalizar_estado(origem), _normalizar_estado(destino)
+    if a == b:
+        return 0.0
+    if a not in COORDENADAS or b not in COORDENADAS:
+        return None
+    (lat1, lon1), (lat2, lon2) = COORDENADAS[a], COORDENADAS[b]
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    h = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * RAIO_TERRA_KM * math.asin(math.sqrt(h))
+
+
+def prazo_dias(km):
+    return PRAZO_BASE_DIAS + math.ceil(km / KM_POR_DIA)
+
+
+@lru_cache(maxsize=1024)
+def _distancias(origem, estados):
+    """(km, prazo) de `origem` até cada um de `estados`, na mesma ordem (inf se sem coordenada)."""
+    km = []
+    for estado in estados:
+        d = distancia_km(origem, estado)
+        km.append(math.inf if d is None else d)
+    prazo = [math.inf if d == math.inf else float(prazo_dias(d)) for d in km]
+    return tuple(km), tuple(prazo)
+
+
+# --- tabelas por material ----------------------------------------------------------
+class TabelaMaterial:
+    """
+    Preços de um material em colunas, agrupados por estado (na ordem de
+    `estados`) e, dentro de cada estado, em ordem de preço.
+
+    A coluna `fornecedor` guarda ids locais da tabela: fornecedores[id] é a
+    chave (codigo, nome, estado). Os ids nascem e morrem com a tabela (uma
+    por versão dos preços), então não acumulam ao longo das recargas.
+    """
+
+    __slots__ = ("estados", "inicio", "linhas", "valor", "fornecedor", "fornecedores")
+
+    def __init__(self, estados, linhas):
+        posicao = {estado: i for i, estado in enumerate(estados)}
+        por_estado = [(posicao.get((linha[1] or "").lower()), linha) for linha in linhas if linha[5] is not None]
+        por_estado = [par for par in por_estado if par[0] is not None]
+        por_estado.sort(key=lambda par: par[0])  # estável: mantém a ordem de preço da fonte
+
+        self.estados = estados  # tuple[str] do catálogo
+        self.linhas = [linha for _, linha in por_estado]  # formato de consultar_fornecedores
+        self.inicio = [0] * (len(estados) + 1)  # linhas do estado e: inicio[e]:inicio[e + 1]
+        for pos, _ in por_estado:
+            self.inicio[pos + 1] += 1
+        for e in range(len(estados)):
+            self.inicio[e + 1] += self.inicio[e]
+        valor = [float(linha[5]) for linha in self.linhas]
+        ids = {}  # (codigo, nome, estado) -> id local
+        fornecedor = [ids.setdefault((linha[2], linha[0], linha[1]), len(ids)) for linha in self.linhas]
+        self.fornecedores = list(ids)
+        if USAR_NUMPY:
+            self.valor = np.array(valor, dtype=np.float64)
+            self.fornecedor = np.array(fornecedor, dtype=np.intp)
+        else:
+            self.valor, self.fornecedor = array("d", valor), array("l", fornecedor)
+
+    def __len__(self):
+        return len(self.linhas)
+
+
+def _linhas_material(material, estados):
+    """Linhas do material em todos os estados, em ordem de preço dentro de cada estado."""
+    if indice_habilitado():
+        indice = obter_indice()
+        return [linha for estado in estados for linha in indice.top(material, estado, None)]
+    conn = obter_pool().obter()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(SQL_PRECOS_MATERIAL, (material,))
+        return cursor.fetchall()
+    finally:
+        conn.close()
+
+
+# Tabelas montadas uma vez por versão dos preços do material; consultas
+# simultâneas ao mesmo material esperam a mesma montagem.
+_tabelas = CacheCoalescente(max_itens=MATERIAIS_MAX, ttl_s=math.inf, habilitado=True)
+
+
+def versao(material, catalogo=None):
+    """Muda sempre que algum preço do material pode ter mudado (para caches)."""
+    catalogo = catalogo or obter_catalogo()
+    return catalogo.estados, versao_precos_material(material, catalogo.estados)
+
+
+def obter_tabela(material, catalogo=None):
+    catalogo = catalogo or obter_catalogo()
+    estados = catalogo.estados
+
+    def montar():
+        with metricas.cronometro("db_consulta_segundos", operacao="ranking_tabela"):
+            return TabelaMaterial(estados, _linhas_material(material, estados))
+
+    return _tabelas.obter((material or "").lower(), versao(material, catalogo), montar)
+
+
+# --- pontuação e top-k -------------------------------------------------------------
+def _pontuar(tabela, origem, raio_km, funcao, por_estado=None):
+    """
+    Linhas dos estados dentro do raio (só as `por_estado` mais baratas de
+    cada um, se informado) e, para cada linha, (km, prazo, pontuação).
+    """
+    km_estado, prazo_estado = _distancias(_normalizar_estado(origem), tabela.estados)
+    faixas = []  # (inicio, fim, km, prazo) por estado
+    for e, km in enumerate(km_estado):
+        if km <= raio_km:
+            inicio, fim = tabela.inicio[e], tabela.inicio[e + 1]
+            if por_estado is not None:
+                fim = min(fim, inicio + por_estado)
+            if fim > inicio:
+                faixas.append((inicio, fim, km, prazo_estado[e]))
+    if USAR_NUMPY:
+        if not faixas:
+            vazio = np.zeros(0)
+            return np.zeros(0, dtype=np.intp), vazio, vazio, vazio
+        dentro = np.concatenate([np.arange(inicio, fim) for inicio, fim, _, _ in faixas])
+        tamanhos = [fim - inicio for inicio, fim, _, _ in faixas]
+        km = np.repeat([faixa[2] for faixa in faixas], tamanhos)
+        prazo = np.repeat([faixa[3] for faixa in faixas], tamanhos)
+        pontos = np.asarray(funcao(tabela.valor[dentro], km, prazo), dtype=np.float64)
+        return dentro, km, prazo, pontos
+    dentro, km, prazo = [], [], []
+    for inicio, fim, km_faixa, prazo_faixa in faixas:
+        dentro.extend(range(inicio, fim))
+        km.extend([km_faixa] * (fim - inicio))
+        prazo.extend([prazo_faixa] * (fim - inicio))
+    pontos = [funcao(tabela.valor[i], k, p) for i, k, p in zip(dentro, km, prazo)]
+    return dentro, km, prazo, pontos
+
+
+def tem_vizinhos(material, estado, raio_km):
+    """True se `material` tem preço em outro estado a até raio_km de `estado`."""
+    tabela = obter_tabela(material)
+    km_estado, _ = _distancias(_normalizar_estado(estado), tabela.estados)
+    return any(0 < km <= raio_km and tabela.inicio[e + 1] > tabela.inicio[e]
+               for e, km in enumerate(km_estado))
+
+
+def _menores(pontos, valores, k):
+    """Posições das k menores pontuações; no empate, o menor preço e depois a posição."""
+    n = len(pontos)
+    if not USAR_NUMPY:
+        return heapq.nsmallest(k, range(n), key=lambda i: (pontos[i], valores[i], i))
+    if k < n:
+        corte = np.partition(pontos, k - 1)[k - 1]
+        candidatas = np.flatnonzero(pontos <= corte)
+    else:
+        candidatas = np.arange(n)
+    return candidatas[np.lexsort((valores[candidatas], pontos[candidatas]))][:k].tolist()
+
+
+def _criterio(nome):
+    criterio = CRITERIOS.get(nome)
+    if criterio is None:
+        raise ValueError(f"critério desconhecido: {nome}")
+    return criterio
+
+
+def melhores(material, estado, k=3, raio_km=0.0, criterio=CRITERIO_PADRAO):
+    """
+    Os k melhores preços de `material` para quem está em `estado`, entre os
+    fornecedores a até raio_km: [(linha, km, prazo, pontuação)].
+    """
+    funcao, crescente_no_preco = _criterio(criterio)
+    with metricas.cronometro("db_consulta_segundos", operacao="ranking"):
+        tabela = obter_tabela(material)
+        dentro, km, prazo, pontos = _pontuar(tabela, estado, raio_km, funcao,
+                                             por_estado=k if crescente_no_preco else None)
+        valores = [tabela.valor[i] for i in dentro] if not USAR_NUMPY else tabela.valor[dentro]
+        return [(tabela.linhas[dentro[i]], float(km[i]), float(prazo[i]), float(pontos[i]))
+                for i in _menores(pontos, valores, k)]
+
+
+def melhores_cesta(itens, estado, k=3, raio_km=0.0, criterio=CRITERIO_PADRAO):
+    """
+    Fornecedores que melhor atendem a cesta itens=[(material, quantidade)].
+    Cada fornecedor entra com a sua melhor linha de cada material; ganha quem
+    atende mais itens e, entre esses, a menor soma de pontuação x quantidade.
+    Retorna [((codigo, nome, estado), atendidos, faltando, custo, pontuação, km)].
+    """
+    funcao, _ = _criterio(criterio)
+    with metricas.cronometro("db_consulta_segundos", operacao="ranking_cesta"):
+        tabelas = [(material, quantidade, obter_tabela(material)) for material, quantidade in itens]
+        if USAR_NUMPY:
+            return _cesta_numpy(tabelas, estado, k, raio_km, funcao)
+        return _cesta_python(tabelas, estado, k, raio_km, funcao)
+
+
+def _cesta_numpy(tabelas, estado, k, raio_km, funcao):
+    # ids da consulta: só os fornecedores das tabelas da cesta, densos a partir de 0
+    ids = {}
+    mapas = [np.array([ids.setdefault(chave, len(ids)) for chave in tabela.fornecedores], dtype=np.intp)
+             for _, _, tabela in tabelas]
+    chaves = list(ids)  # id -> (codigo, nome, estado)
+    n = len(chaves)
+    atendidos = np.zeros(n, dtype=np.intp)
+    pontuacao = np.zeros(n)
+    custo = np.zeros(n)
+    km_fornecedor = np.full(n, np.inf)
+    por_item = []
+    for (material, quantidade, tabela), mapa in zip(tabelas, mapas):
+        dentro, km, _, pontos = _pontuar(tabela, estado, raio_km, funcao)
+        valores = tabela.valor[dentro]
+        ordem = np.lexsort((valores, pontos))
+        fornecedores, primeira = np.unique(mapa[tabela.fornecedor[dentro][ordem]], return_index=True)
+        melhor = ordem[primeira]  # melhor linha de cada fornecedor para o material
+        atendidos[fornecedores] += 1
+        pontuacao[fornecedores] += pontos[melhor] * quantidade
+        custo[fornecedores] += valores[melhor] * quantidade
+        km_fornecedor[fornecedores] = km[melhor]
+        por_item.append((material, fornecedores))
+
+    candidatos = np.flatnonzero(atendidos)
+    ordem = candidatos[np.lexsort((custo[candidatos], pontuacao[candidatos], -atendidos[candidatos]))].tolist()
+
+    def chave(f):
+        return -int(atendidos[f]), float(pontuacao[f]), float(custo[f])
+
+    # empates exatos no fim do top-k: decide a chave do fornecedor, não a
+    # ordem em que os ids foram criados
+    fim = min(k, len(ordem))
+    while fim < len(ordem) and chave(ordem[fim]) == chave(ordem[fim - 1]):
+        fim += 1
+    escolhidos = sorted(ordem[:fim], key=lambda f: chave(f) + (chaves[f],))[:k]
+    return [(chaves[f], int(atendidos[f]),
+             [material for material, fornecedores in por_item if not np.isin(f, fornecedores)],
+             float(custo[f]), float(pontuacao[f]), float(km_fornecedor[f]))
+            for f in escolhidos]
+
+
+def _cesta_python(tabelas, estado, k, raio_km, funcao):
+    totais = {}  # (codigo, nome, estado) -> [atendidos, pontuação, custo, km]
+    por_item = []
+    for material, quantidade, tabela in tabelas:
+        dentro, km, _, pontos = _pontuar(tabela, estado, raio_km, funcao)
+        vistos = set()
+        for i in sorted(range(len(dentro)), key=lambda i: (pontos[i], tabela.valor[dentro[i]], i)):
+            f = tabela.fornecedores[tabela.fornecedor[dentro[i]]]
+            if f in vistos:
+                continue
+            vistos.add(f)
+            total = totais.setdefault(f, [0, 0.0, 0.0, km[i]])
+            total[0] += 1
+            total[1] += pontos[i] * quantidade
+            total[2] += tabela.valor[dentro[i]] * quantidade
+        por_item.append((material, vistos))
+
+    ordem = sorted(totais, key=lambda f: (-totais[f][0], totais[f][1], totais[f][2], f))[:k]
+    return [(f, totais[f][0],
+             [material for material, vistos in por_item if f not in vistos],
+             totais[f][2], totais[f][1], totais[f][3])
+            for f in ordem]
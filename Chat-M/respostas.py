@@ -0,0 +1,170 @@
+import os
+import threading
+
+# -----------------------------------------------------------------------------
+# Textos do chat e menus pré-renderizados por versão do catálogo
+# -----------------------------------------------------------------------------
+# O menu numerado de categorias era montado com += em quatro lugares, a cada
+# turno, e o de materiais a cada escolha de categoria. Aqui os menus (e as
+# respostas inteiras que só dependem do catálogo) são renderizados uma vez
+# por snapshot e reaproveitados; o turno só concatena o que depende da
+# mensagem. Os textos são os mesmos de antes, byte a byte.
+#
+# Categorias com mais de CHAT_MATERIAIS_POR_PAGINA insumos são mostradas em
+# páginas (mesmo cursor por id de /materiais); a numeração continua de uma
+# página para a outra, então o número digitado vale em qualquer página.
+#
+#   CHAT_MATERIAIS_POR_PAGINA  insumos por resposta do chat (padrão: 20)
+
+MATERIAIS_POR_PAGINA = int(os.environ.get("CHAT_MATERIAIS_POR_PAGINA", 20))
+
+SAUDACAO = "Olá! Sou MeliBuy, vou te ajudar a encontrar o melhor fornecedor para sua negociação."
+
+PEDIR_CATEGORIA_INICIO = "\n\nPara começar, por favor, escolha uma categoria:\n"
+PEDIR_CATEGORIA = "\n\nPor favor, escolha uma categoria:\n"
+SEM_CATEGORIAS = "\n\nNão encontrei categorias disponíveis no momento."
+SEM_CATEGORIAS_TENTE_DEPOIS = "Não encontrei categorias disponíveis no momento. Por favor, tente novamente mais tarde."
+
+REINICIO = "Entendido! Vamos reiniciar a conversa."
+NOVA_CONSULTA = "Certo! Vamos começar uma nova consulta."
+DESPEDIDA = "Obrigado por usar o MeliBuy! Até mais 👋"
+ATE_LOGO = "Até logo!"
+
+NAO_ENTENDI_SIM_NAO = "Não entendi sua resposta. Por favor, digite 'sim' para nova consulta ou 'não' para encerrar."
+NAO_ENTENDI_CATEGORIA = "Não entendi sua escolha de categoria. Por favor, digite o número ou o nome da categoria que deseja."
+NAO_ENTENDI_MATERIAL = "Não entendi o insumo que você escolheu. Por favor, digite o número ou o nome do insumo na lista."
+NAO_ENTENDI_ESTADO = "Não consegui identificar o estado. Por favor, digite o nome completo ou a sigla do estado (Ex: SP, São Paulo)."
+NAO_ENTENDI_MG = "Não entendi a sua especificação. Por favor, digite 'Betim' ou 'Extrema'."
+PERGUNTA_MG = "Para Minas Gerais, você se refere a Betim ou Extrema?"
+ERRO_REINICIE = "Houve um erro. Por favor, reinicie a conversa."
+
+CABECALHO_RESULTADOS = "Aqui estão os melhores fornecedores:\n\n"
+RODAPE_RESULTADOS = "\n\n🎯 Deseja fazer outra consulta? Digite 'sim' ou 'não'."
+DICA_REGIAO = "\n\n📍 Digite 'região' para comparar com fornecedores de estados vizinhos (preço + frete)."
+RODAPE_SEM_RESULTADOS = "\n\nPor favor, tente outro estado ou diga 'reiniciar' para uma nova consulta."
+
+SEM_MAIS_PAGINAS = "Não há mais insumos nessa direção.\n\n"
+
+
+def menu_numerado(nomes, inicio=1):
+    return "".join([f"\n{i}. {nome.capitalize()}" for i, nome in enumerate(nomes, inicio)])
+
+
+def navegacao_paginas(proximo, anterior):
+    opcoes = []
+    if proximo:
+        opcoes.append("'mais' para ver os próximos")
+    if anterior:
+        opcoes.append("'voltar' para ver os anteriores")
+    if not opcoes:
+        return ""
+    return "\n\nDigite o número ou o nome do insumo, ou " + " ou ".join(opcoes) + "."
+
+
+def menu_lista(nomes):
+    return "".join([f"\n- {nome.capitalize()}" for nome in nomes])
+
+
+def resposta_ambigua(mensagem_usuario, candidatos, o_que):
+    return (f"Encontrei mais de uma opção para '{mensagem_usuario.strip()}':\n"
+            + menu_lista(candidatos)
+            + f"\n\nPor favor, digite o número ou o nome completo {o_que} que deseja.")
+
+
+def resposta_material_escolhido(material):
+    return (f"Você escolheu '{material.capitalize()}'. Agora, para qual estado você precisa consultar?"
+            "\nEx: SP, São Paulo, BA, Bahia, etc.")
+
+
+def resposta_fornecedores(resultados, regiao=False):
+    """regiao=True acrescenta a dica do comando 'região' (há estados vizinhos com o insumo)."""
+    linhas = [f"{i}. {r[0]} – R$ {r[5]:.4f} (Cod Forn: {r[2]}, Cod Mat: {r[4]})\n"
+              for i, r in enumerate(resultados, 1)]
+    return CABECALHO_RESULTADOS + "".join(linhas) + (DICA_REGIAO if regiao else "") + RODAPE_RESULTADOS
+
+
+def resposta_regiao(classificados, estado, raio_km):
+    """Ranking do chat (ranking.py): linhas (linha, km, prazo, pontuação), preço + frete."""
+    linhas = [f"{i}. {r[0]} ({r[1]}, ~{km:.0f} km, entrega em ~{prazo:.0f} dia(s)) – "
+              f"R$ {r[5]:.4f}, R$ {pontuacao:.4f} com frete (Cod Forn: {r[2]}, Cod Mat: {r[4]})\n"
+              for i, (r, km, prazo, pontuacao) in enumerate(classificados, 1)]
+    return (f"Melhores opções até {raio_km:.0f} km de {estado.capitalize()}, com frete estimado:\n\n"
+            + "".join(linhas) + RODAPE_RESULTADOS)
+
+
+def resposta_sem_regiao(estado, raio_km):
+    return (f"Nenhum fornecedor encontrado para esse insumo até {raio_km:.0f} km de "
+            f"{estado.capitalize()}." + RODAPE_RESULTADOS)
+
+
+def resposta_sem_fornecedores(estado):
+    return "Nenhum fornecedor encontrado para esse insumo em " + estado.capitalize() + "." + RODAPE_SEM_RESULTADOS
+
+
+class RespostasCatalogo:
+    """Menus e respostas fixas de um snapshot do catálogo."""
+
+    def __init__(self, catalogo):
+        self._catalogo = catalogo
+        self.tem_categorias = bool(catalogo.categorias)
+        menu = menu_numerado(catalogo.categorias)
+        bloco = PEDIR_CATEGORIA + menu if self.tem_categorias else SEM_CATEGORIAS
+
+        # aguardando_categoria: com e sem saudação
+        self.menu_inicial = PEDIR_CATEGORIA_INICIO + menu
+        self.saudacao_com_menu = SAUDACAO + self.menu_inicial
+        # reinício, "sim" após uma consulta e categoria sem materiais
+        self.bloco_categorias = bloco
+        self.reinicio = REINICIO + bloco
+        self.nova_consulta = NOVA_CONSULTA + bloco
+
+        self._por_categoria = {}
+        self._lock = threading.Lock()
+
+    def categoria_escolhida(self, categoria):
+        """(tem_materiais, resposta) para a categoria escolhida, renderizada uma vez."""
+        pronta = self._por_categoria.get(categoria)
+        if pronta is not None:
+            return pronta
+        materiais = self._catalogo.materiais(categoria)
+        if len(materiais) > MATERIAIS_POR_PAGINA:
+            _, nomes, proximo, anterior = self._catalogo.pagina_materiais(categoria, MATERIAIS_POR_PAGINA)
+            pronta = (True, f"Ótimo! Você escolheu a categoria '{categoria.capitalize()}'. "
+                            f"Ela tem {len(materiais)} insumos. Agora, qual insumo você procura?\n"
+                            + menu_numerado(nomes) + navegacao_paginas(proximo, anterior))
+        elif materiais:
+            pronta = (True, f"Ótimo! Você escolheu a categoria '{categoria.capitalize()}'. "
+                            "Agora, qual insumo você procura?\n" + menu_numerado(materiais))
+        else:
+            pronta = (False, f"Não encontrei insumos para a categoria '{categoria.capitalize()}'. "
+                             "Por favor, escolha outra categoria." + self.bloco_categorias)
+        with self._lock:
+            return self._por_categoria.setdefault(categoria, pronta)
+
+    def pagina_materiais(self, categoria, cursor):
+        """(resposta, proximo, anterior) da página de insumos apontada por `cursor`."""
+        total = len(self._catalogo.materiais(categoria))
+        inicio, nomes, proximo, anterior = self._catalogo.pagina_materiais(
+            categoria, MATERIAIS_POR_PAGINA, cursor)
+        resposta = (f"Insumos da categoria '{categoria.capitalize()}' "
+                    f"({inicio + 1} a {inicio + len(nomes)} de {total}):\n"
+                    + menu_numerado(nomes, inicio + 1) + navegacao_paginas(proximo, anterior))
+        return resposta, proximo, anterior
+
+
+_cache = (None, None)  # (snapshot do catálogo, RespostasCatalogo)
+_cache_lock = threading.Lock()
+
+
+def obter_respostas(catalogo):
+    """Respostas pré-renderizadas para o snapshot informado."""
+    global _cache
+    compilado_para, respostas = _cache
+    if compilado_para is catalogo:
+        return respostas
+    with _cache_lock:
+        compilado_para, respostas = _cache
+        if compilado_para is not catalogo:
+            respostas = RespostasCatalogo(catalogo)
+            _cache = (catalogo, respostas)
+        return respostas
@@ -0,0 +1,621 @@
+import json
+import math
+import os
+from itertools import islice
+
+import admissao
+import aquecimento
+import cache_consultas
+import cache_respostas
+import catalogo_mmap
+import escrita_precos
+import indice_precos
+import metricas
+import mudancas
+import ranking
+from db_pool import obter_pool
+from bot_logica import (
+    processar_mensagem_chatbot,
+    listar_categorias,
+    listar_materiais_por_categoria,
+    paginar_materiais_por_categoria,
+    consultar_fornecedores,
+)
+from catalogo import obter_catalogo
+from indice_precos import LIMITE_PADRAO, normalizar_chave, versao_precos
+from sessoes import EstadoChat, obter_armazem
+
+# -----------------------------------------------------------------------------
+# Regras das rotas, independentes do framework HTTP
+# -----------------------------------------------------------------------------
+# Cada função recebe valores já extraídos da requisição e devolve
+# (payload, status). O app Flask (app.py) e o ponto de entrada ASGI (asgi.py)
+# só cuidam de HTTP e chamam estas funções, então os contratos JSON são os
+# mesmos nos dois.
+
+# API_KEY opcional (para proteger os endpoints que o Verdi chamará). Aceita
+# várias chaves separadas por vírgula, uma por integração: cada chave tem o
+# seu balde no controle de admissão (admissao.py).
+API_KEY = os.environ.get("API_KEY", "").strip()
+API_KEYS = frozenset(chave.strip() for chave in API_KEY.split(",") if chave.strip())
+
+# Teto para o parâmetro 'n' de /fornecedores
+LIMITE_MAXIMO = int(os.environ.get("FORNECEDORES_N_MAX", 50))
+
+# Máximo de pares (material, estado) aceitos em /fornecedores/batch
+LOTE_MAXIMO = int(os.environ.get("FORNECEDORES_BATCH_MAX", 5000))
+
+# Página máxima de /materiais (?limite=) e tamanho a partir do qual a lista
+# completa de uma categoria é enviada em partes, sem montar o JSON inteiro
+MATERIAIS_PAGINA_MAXIMA = int(os.environ.get("MATERIAIS_PAGINA_MAX", 1000))
+MATERIAIS_STREAM_MINIMO = int(os.environ.get("MATERIAIS_STREAM_MIN", 5000))
+
+# Máximo de materiais numa cesta de /fornecedores/cesta
+CESTA_MAXIMA = int(os.environ.get("FORNECEDORES_CESTA_MAX", 200))
+
+# Nomes por pedaço enviado no modo em partes
+NOMES_POR_PARTE = 1000
+
+NAO_AUTORIZADO = ({"error": "unauthorized"}, 401)
+
+
+def serializar_json(payload):
+    """Mesma serialização do jsonify do Flask em produção (com quebra de linha)."""
+    return json.dumps(payload, sort_keys=True, separators=(",", ":")) + "\n"
+
+
+def api_key_valida(valor_header):
+    """True se API_KEY não estiver configurada ou se o header for uma das chaves."""
+    return not API_KEYS or valor_header in API_KEYS
+
+
+def admitir(valor_header, endereco, rota, encaminhado=None):
+    """
+    Controle de admissão (admissao.py) de uma rota protegida: None se a
+    requisição pode seguir, senão (payload, status, retry_after). Quem segue
+    chama liberar(rota) quando a resposta terminar. `encaminhado` é o
+    X-Forwarded-For (só usado com ADMISSAO_PROXIES).
+    """
+    controle = admissao.obter_admissao()
+    if controle is None:
+        return None
+    # sem API_KEY configurada o header é livre (trocar de valor não pode
+    # render um balde novo): o cliente passa a ser o IP
+    endereco = admissao.endereco_cliente(endereco, encaminhado)
+    return controle.admitir(valor_header if API_KEYS else None, endereco, rota)
+
+
+def admissao_bloqueante():
+    """True se admitir() faz I/O (armazém sqlite) e não deve rodar no event loop."""
+    controle = admissao.obter_admissao()
+    return controle is not None and controle.baldes.BLOQUEANTE
+
+
+def liberar(rota):
+    controle = admissao.obter_admissao()
+    if controle is not None:
+        controle.liberar(rota)
+
+
+def _inteiro(valor, padrao):
+    """Converte parâmetro de querystring; None se o valor vier inválido."""
+    valor = (valor or "").strip()
+    if not valor:
+        return padrao
+    try:
+        return int(valor)
+    except ValueError:
+        return None
+
+
+def _numero(valor, padrao):
+    """Como _inteiro, para números reais (finitos)."""
+    valor = (valor or "").strip()
+    if not valor:
+        return padrao
+    try:
+        numero = float(valor)
+    except ValueError:
+        return None
+    return numero if math.isfinite(numero) else None
+
+
+def linha_para_resultado(r):
+    return {
+        "fornecedor": r[0],
+        "estado": r[1],
+        "codigo_fornecedor": r[2],
+        "material": r[3],
+        "codigo_material": r[4],
+        "preco": float(r[5]),
+    }
+
+
+def health():
+    pool = obter_pool()
+    try:
+        db_ok = pool.health()
+    except Exception:
+        db_ok = False
+    status = "ok" if db_ok else "degradado"
+    payload = {"status": status, "db_pool": pool.metricas()}
+    fonte = catalogo_mmap.fonte_ativa()
+    if fonte is not None:
+        payload["snapshot"] = {"caminho": fonte.caminho, **fonte.atual().meta}
+    return payload, (200 if db_ok else 503)
+
+
+def vivo():
+    """Liveness: o processo está de pé (não depende do banco nem do aquecimento)."""
+    return {"status": "ok", "pid": os.getpid()}, 200
+
+
+def pronto():
+    """
+    Readiness: 200 só depois do aquecimento deste worker e com o banco
+    respondendo; antes disso 503 com o progresso de cada etapa.
+    """
+    execucao = aquecimento.atual()
+    try:
+        db_ok = obter_pool().health()
+    except Exception:
+        db_ok = False
+    payload = {"pid": os.getpid(), "db": db_ok}
+    ok = db_ok
+    if execucao is not None:
+        payload["aquecimento"] = execucao.relatorio()
+        ok = ok and execucao.pronto
+    if ok:
+        payload["status"] = "pronto"
+    elif execucao is not None and execucao.erro:
+        payload["status"] = "erro"
+    else:
+        payload["status"] = "aquecendo"
+    return payload, (200 if ok else 503)
+
+
+def metricas_prometheus():
+    """Texto de /metrics: contadores/histogramas + estado do pool e dos caches."""
+    medidores = []
+    for nome, valor in obter_pool().metricas().items():
+        if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            medidores.append(("db_pool", valor, {"medida": nome}, "Estado do pool de conexões SQLite."))
+    for nome, valor in cache_respostas.cache.estatisticas().items():
+        medidores.append(("cache_respostas", valor, {"medida": nome}, "Contadores do cache de respostas."))
+    for nome, valor in cache_consultas.consultas.estatisticas().items():
+        medidores.append(("cache_consultas", valor, {"medida": nome},
+                          "Cache de consultas do chat (hits, coalescidas, taxa_coalescencia...)."))
+    controle = admissao.obter_admissao()
+    if controle is not None:
+        for nome, valor in controle.estatisticas().items():
+            medidores.append(("admissao", valor, {"medida": nome},
+                              "Controle de admissão deste worker (vagas em uso e limites)."))
+    return metricas.exportar(medidores)
+
+
+def categorias():
+    return {"categorias": listar_categorias()}, 200
+
+
+def _paginado(args):
+    return bool((args.get("limite") or "").strip() or (args.get("cursor") or "").strip())
+
+
+def _pagina_materiais(categoria, args):
+    """((nomes, proximo, anterior), None) ou (None, erro)."""
+    limite = _inteiro(args.get("limite"), 100)
+    if limite is None or not 1 <= limite <= MATERIAIS_PAGINA_MAXIMA:
+        return None, ({"error": f"parametro 'limite' deve ser um inteiro entre 1 e {MATERIAIS_PAGINA_MAXIMA}"}, 400)
+    try:
+        return paginar_materiais_por_categoria(categoria, limite, args.get("cursor")), None
+    except ValueError:
+        return None, ({"error": "parametro 'cursor' inválido para esta categoria"}, 400)
+
+
+def materiais(args):
+    categoria = (args.get("categoria") or "").strip()
+    if not categoria:
+        return {"error": "parametro 'categoria' é obrigatório"}, 400
+    if _paginado(args):
+        pagina, erro = _pagina_materiais(categoria, args)
+        if erro:
+            return erro
+        nomes, proximo, anterior = pagina
+        return {"materiais": nomes, "proximo": proximo, "anterior": anterior}, 200
+    return {"materiais": listar_materiais_por_categoria(None, categoria)}, 200
+
+
+def modo_materiais(args, accept=None):
+    """
+    Como responder /materiais: "ndjson" (pedido pelo cliente), "partes"
+    (lista completa de uma categoria grande, JSON enviado aos pedaços) ou
+    None (resposta normal, pelo cache).
+    """
+    if quer_ndjson(args.get("formato"), accept):
+        return "ndjson"
+    categoria = (args.get("categoria") or "").strip()
+    if categoria and not _paginado(args) and len(obter_catalogo().materiais(categoria)) >= MATERIAIS_STREAM_MINIMO:
+        return "partes"
+    return None
+
+
+def materiais_streaming(args, modo):
+    """
+    /materiais sem montar a lista: (gerador de str, 200) ou (erro, 400).
+    "ndjson": uma linha {"material": ...} por insumo e, se paginado, uma última
+    com "proximo"/"anterior". "partes": os mesmos bytes de materiais(),
+    gerados aos pedaços.
+    """
+    categoria = (args.get("categoria") or "").strip()
+    if not categoria:
+        return {"error": "parametro 'categoria' é obrigatório"}, 400
+    paginado = _paginado(args)
+    if paginado:
+        pagina, erro = _pagina_materiais(categoria, args)
+        if erro:
+            return erro
+        nomes, proximo, anterior = pagina
+    else:
+        nomes = obter_catalogo().materiais(categoria)  # tupla do snapshot, sem cópia
+    if modo == "ndjson":
+        return _linhas_ndjson_materiais(nomes, paginado and (proximo, anterior)), 200
+    return _partes_json_materiais(nomes), 200
+
+
+def _linhas_ndjson_materiais(nomes, cursores):
+    for nome in nomes:
+        yield serializar_json({"material": nome})
+    if cursores:
+        yield serializar_json({"proximo": cursores[0], "anterior": cursores[1]})
+
+
+def _partes_json_materiais(nomes):
+    iterador = iter(nomes)
+    yield '{"materiais":['
+    separador = ""
+    while True:
+        parte = list(islice(iterador, NOMES_POR_PARTE))
+        if not parte:
+            break
+        yield separador + ",".join(json.dumps(nome) for nome in parte)
+        separador = ","
+    yield "]}\n"
+
+
+def fornecedores(args):
+    material = (args.get("material") or "").strip()
+    estado = (args.get("estado") or "").strip()
+
+    if not material or not estado:
+        return {"error": "parametros 'material' e 'estado' são obrigatórios"}, 400
+
+    n = _inteiro(args.get("n"), LIMITE_PADRAO)
+    if n is None or not 1 <= n <= LIMITE_MAXIMO:
+        return {"error": f"parametro 'n' deve ser um inteiro entre 1 e {LIMITE_MAXIMO}"}, 400
+
+    if _ranqueado(args):
+        opcoes, erro = _opcoes_ranking((args.get("criterio") or "").strip().lower(),
+                                       _numero(args.get("raio_km"), 0.0))
+        if erro:
+            return erro
+        criterio, raio_km = opcoes
+        classificados = ranking.melhores(material, estado, n, raio_km, criterio)
+        return {"resultados": [resultado_ranqueado(c) for c in classificados],
+                "criterio": criterio, "raio_km": raio_km}, 200
+
+    rows = consultar_fornecedores(None, material, estado, n)
+    return {"resultados": [linha_para_resultado(r) for r in rows]}, 200
+
+
+def versao_fornecedores(args):
+    """
+    Versão do cache de /fornecedores: a da chave (material, estado) no índice
+    de preços, que só muda quando um preço daquela chave muda. Com ranking,
+    a do material em todos os estados.
+    """
+    if _ranqueado(args):
+        return ranking.versao(args.get("material"))
+    return versao_precos(args.get("material"), args.get("estado"))
+
+
+# -----------------------------------------------------------------------------
+# Ranking por critério, estados vizinhos e cesta de materiais (ranking.py)
+# -----------------------------------------------------------------------------
+def _ranqueado(args):
+    """/fornecedores com 'criterio' ou 'raio_km' usa o ranking; sem eles, o top-N de antes."""
+    return bool((args.get("criterio") or "").strip() or (args.get("raio_km") or "").strip())
+
+
+def _opcoes_ranking(criterio, raio_km):
+    """Valida critério e raio já convertidos. Retorna ((criterio, raio_km), erro)."""
+    criterio = criterio or ranking.CRITERIO_PADRAO
+    if criterio not in ranking.CRITERIOS:
+        nomes = ", ".join(sorted(ranking.CRITERIOS))
+        return None, ({"error": f"parametro 'criterio' deve ser um de: {nomes}"}, 400)
+    if (isinstance(raio_km, bool) or not isinstance(raio_km, (int, float))
+            or not 0 <= raio_km <= ranking.RAIO_MAXIMO_KM):
+        return None, ({"error": f"parametro 'raio_km' deve ser um número entre 0 e {ranking.RAIO_MAXIMO_KM:g}"}, 400)
+    return (criterio, float(raio_km)), None
+
+
+def resultado_ranqueado(classificado):
+    linha, km, prazo, pontuacao = classificado
+    return {
+        **linha_para_resultado(linha),
+        "distancia_km": round(km, 1),
+        "prazo_dias": int(prazo),
+        "pontuacao": round(pontuacao, 4),
+    }
+
+
+def _itens_cesta(itens):
+    """[(material, quantidade)] com materiais repetidos somados, ou (None, erro)."""
+    if not isinstance(itens, list) or not itens:
+        return None, ({"error": "campo 'itens' deve ser uma lista não vazia"}, 400)
+    if len(itens) > CESTA_MAXIMA:
+        return None, ({"error": f"no máximo {CESTA_MAXIMA} itens por cesta"}, 400)
+    cesta = {}
+    for pos, item in enumerate(itens):
+        if not isinstance(item, dict):
+            return None, ({"error": f"itens[{pos}] deve ser um objeto"}, 400)
+        material = str(item.get("material") or "").strip()
+        if not material:
+            return None, ({"error": f"itens[{pos}]: 'material' é obrigatório"}, 400)
+        quantidade = item.get("quantidade", 1)
+        if (isinstance(quantidade, bool) or not isinstance(quantidade, (int, float))
+                or not math.isfinite(quantidade) or quantidade <= 0):
+            return None, ({"error": f"itens[{pos}]: 'quantidade' deve ser um número positivo"}, 400)
+        nome, total = cesta.get(material.lower(), (material, 0))
+        cesta[material.lower()] = (nome, total + quantidade)
+    return list(cesta.values()), None
+
+
+def fornecedores_cesta(data):
+    """
+    Melhores fornecedores para uma cesta de materiais entregue em 'estado':
+    quem atende mais itens primeiro, depois a menor pontuação total.
+    """
+    estado = str(data.get("estado") or "").strip()
+    if not estado:
+        return {"error": "campo 'estado' é obrigatório"}, 400
+    itens, erro = _itens_cesta(data.get("itens"))
+    if erro:
+        return erro
+    k = data.get("k", LIMITE_PADRAO)
+    if isinstance(k, bool) or not isinstance(k, int) or not 1 <= k <= LIMITE_MAXIMO:
+        return {"error": f"campo 'k' deve ser um inteiro entre 1 e {LIMITE_MAXIMO}"}, 400
+    opcoes, erro = _opcoes_ranking(str(data.get("criterio") or "").strip().lower(), data.get("raio_km", 0))
+    if erro:
+        return erro
+    criterio, raio_km = opcoes
+
+    fornecedores = []
+    for (codigo, nome, estado_forn), atendidos, faltando, custo, pontuacao, km in ranking.melhores_cesta(
+            itens, estado, k, raio_km, criterio):
+        fornecedores.append({
+            "fornecedor": nome,
+            "estado": estado_forn,
+            "codigo_fornecedor": codigo,
+            "itens_atendidos": atendidos,
+            "itens_faltando": faltando,
+            "custo_total": round(custo, 4),
+            "pontuacao": round(pontuacao, 4),
+            "distancia_km": round(km, 1),
+        })
+    return {"estado": estado, "criterio": criterio, "raio_km": raio_km,
+            "itens": len(itens), "fornecedores": fornecedores}, 200
+
+
+def chat(sid, data):
+    """Um turno de conversa para a sessão `sid` (estado no armazém do servidor)."""
+    mensagem = (data.get("message") or "").strip()
+    if not mensagem:
+        return {"error": "campo 'message' é obrigatório no corpo JSON"}, 400
+
+    armazem = obter_armazem()
+    estado = armazem.carregar(sid)
+
+    # Sem estado (sessão nova/expirada) ou conversa anterior em 'fim': recomeça
+    if estado is None or estado.stage == "fim":
+        estado = EstadoChat()
+
+    catalogo = obter_catalogo()
+    reply, novo_estado = processar_mensagem_chatbot(mensagem, estado.para_dict(catalogo))
+    armazem.salvar(sid, EstadoChat.de_dict(novo_estado, catalogo))
+
+    is_fim = (novo_estado.get("stage") == "fim")
+    return {"reply": reply, "fim": is_fim}, 200
+
+
+# -----------------------------------------------------------------------------
+# Cotação em lote
+# -----------------------------------------------------------------------------
+def _itens_lote(data):
+    """Valida o corpo de /fornecedores/batch. Retorna (itens, erro)."""
+    itens = data.get("itens")
+    if not isinstance(itens, list) or not itens:
+        return None, ({"error": "campo 'itens' deve ser uma lista não vazia"}, 400)
+    if len(itens) > LOTE_MAXIMO:
+        return None, ({"error": f"no máximo {LOTE_MAXIMO} itens por lote"}, 400)
+
+    n_padrao = data.get("n", LIMITE_PADRAO)
+    normalizados = []
+    for pos, item in enumerate(itens):
+        if not isinstance(item, dict):
+            return None, ({"error": f"itens[{pos}] deve ser um objeto"}, 400)
+        material = str(item.get("material") or "").strip()
+        estado = str(item.get("estado") or "").strip()
+        if not material or not estado:
+            return None, ({"error": f"itens[{pos}]: 'material' e 'estado' são obrigatórios"}, 400)
+        n = item.get("n", n_padrao)
+        if isinstance(n, bool) or not isinstance(n, int) or not 1 <= n <= LIMITE_MAXIMO:
+            return None, ({"error": f"itens[{pos}]: 'n' deve ser um inteiro entre 1 e {LIMITE_MAXIMO}"}, 400)
+        quantidade = item.get("quantidade", 1)
+        if (isinstance(quantidade, bool) or not isinstance(quantidade, (int, float))
+                or not math.isfinite(quantidade) or quantidade <= 0):
+            return None, ({"error": f"itens[{pos}]: 'quantidade' deve ser um número positivo"}, 400)
+        normalizados.append((material, estado, n, quantidade))
+    return normalizados, None
+
+
+def _consultar_pares(n_por_chave):
+    """
+    {chave: (top-n, menores)} dos pares pedidos, com duas consultas por lote
+    de chaves: o top-n de cada par (janela ROW_NUMBER) e o menor preço de cada
+    fornecedor (MIN ... GROUP BY). Nenhuma lista de preços inteira passa pelo
+    Python. Lê sempre a base SQLite, também com o snapshot binário ativo
+    (que é gerado a partir dela).
+    """
+    conn = obter_pool().obter()
+    try:
+        cursor = conn.cursor()
+        with metricas.cronometro("db_consulta_segundos", operacao="fornecedores_lote"):
+            tops = indice_precos.ler_tops(cursor, n_por_chave, max(n_por_chave.values()))
+            menores = indice_precos.ler_menores(cursor, n_por_chave)
+    finally:
+        conn.close()
+    return {chave: (tops.get(chave, [])[:n], menores.get(chave, {})) for chave, n in n_por_chave.items()}
+
+
+def _linhas_lote(itens):
+    """
+    Gera um resultado por item e, por último, os totais por fornecedor.
+    Os itens são consultados em blocos (indice_precos.CHAVES_POR_CONSULTA
+    pares por vez); pares repetidos no lote (mesma chave normalizada) são
+    consultados uma vez. De cada par fica guardado só o top-n (o maior n
+    pedido para ele) e o menor preço por fornecedor.
+    """
+    n_por_chave = {}
+    for material, estado, n, _ in itens:
+        chave = normalizar_chave(material, estado)
+        n_por_chave[chave] = max(n, n_por_chave.get(chave, 0))
+
+    consultados = {}
+    totais = {}
+    for inicio in range(0, len(itens), indice_precos.CHAVES_POR_CONSULTA):
+        bloco = itens[inicio:inicio + indice_precos.CHAVES_POR_CONSULTA]
+        novas = {}
+        for material, estado, _, _ in bloco:
+            chave = normalizar_chave(material, estado)
+            if chave not in consultados:
+                novas[chave] = n_por_chave[chave]
+        if novas:
+            consultados.update(_consultar_pares(novas))
+        yield from _resultados_bloco(bloco, consultados, totais)
+
+    ordenados = sorted(totais.values(), key=lambda t: (-t["itens_atendidos"], t["custo_total"]))
+    for total in ordenados:
+        total["custo_total"] = round(total["custo_total"], 4)
+    yield {"totais_por_fornecedor": ordenados}
+
+
+def _resultados_bloco(bloco, consultados, totais):
+    """Um resultado por item do bloco; acumula o custo em `totais`."""
+    for material, estado, n, quantidade in bloco:
+        top, menores = consultados[normalizar_chave(material, estado)]
+
+        # Custo por fornecedor usa o menor preço dele para o par, mesmo fora do top-N.
+        for id_fornecedor, preco in menores.items():
+            total = totais.get(id_fornecedor)
+            if total is None:
+                total = totais[id_fornecedor] = {
+                    "fornecedor": id_fornecedor[1],
+                    "estado": id_fornecedor[2],
+                    "codigo_fornecedor": id_fornecedor[0],
+                    "itens_atendidos": 0,
+                    "custo_total": 0.0,
+                }
+            total["itens_atendidos"] += 1
+            total["custo_total"] += preco * quantidade
+
+        yield {
+            "material": material,
+            "estado": estado,
+            "quantidade": quantidade,
+            "resultados": [linha_para_resultado(r) for r in top[:n]],
+        }
+
+
+def quer_ndjson(formato, accept):
+    """Streaming NDJSON via ?formato=ndjson ou Accept: application/x-ndjson."""
+    return (formato or "").strip().lower() == "ndjson" or "application/x-ndjson" in (accept or "")
+
+
+def fornecedores_lote(data, streaming=False):
+    """
+    Cotação de vários pares (material, estado) numa chamada.
+    Com streaming=True o payload é um gerador de objetos (um por linha NDJSON).
+    """
+    itens, erro = _itens_lote(data)
+    if erro:
+        return erro
+    linhas = _linhas_lote(itens)
+    if streaming:
+        return linhas, 200
+    *resultados, totais = linhas
+    return {"resultados": resultados, **totais}, 200
+
+
+# -----------------------------------------------------------------------------
+# Gravação de preços e feed de mudanças
+# -----------------------------------------------------------------------------
+def gravar_precos(data, somente_existentes=False):
+    """
+    POST /precos (upsert) e PUT /precos (somente_existentes=True: só altera
+    preços já cadastrados). Corpo: um item ou {"itens": [...]}.
+    """
+    if not escrita_precos.escrita_habilitada():
+        return {"error": "gravação de preços desligada (PRECOS_ESCRITA=0)"}, 403
+    itens = data.get("itens") if "itens" in data else [data]
+    try:
+        return escrita_precos.gravar(itens, somente_existentes), 200
+    except escrita_precos.ErroEscrita as exc:
+        return {"error": str(exc)}, exc.status
+
+
+SQL_MUDANCAS_CHAVES = """
+SELECT f.id, f.estado, m.id, m.nome
+FROM fornecedores f, materiais m
+WHERE f.id = ? AND m.id = ?
+"""
+
+
+def mudancas_precos(args):
+    """
+    Feed de mudanças para quem mantém cache: sem 'desde', só o seq atual
+    (barato para polling); com 'desde', as chaves (material, estado) que
+    mudaram depois dele. "recarregar": true pede para descartar tudo (mudou
+    algo além de preços ou o feed não cobre mais o intervalo).
+    """
+    desde = _inteiro(args.get("desde"), None)
+    limite = _inteiro(args.get("limite"), 1000)
+    if desde is None and (args.get("desde") or "").strip():
+        return {"error": "parametro 'desde' deve ser um inteiro"}, 400
+    if limite is None or not 1 <= limite <= 10000:
+        return {"error": "parametro 'limite' deve ser um inteiro entre 1 e 10000"}, 400
+
+    conn = obter_pool().obter()
+    try:
+        cursor = conn.cursor()
+        if desde is None:
+            return {"seq": mudancas.ultima_seq(cursor) or 0}, 200
+        lidas = mudancas.ler(cursor, desde, limite)
+        if lidas is None:
+            return {"seq": mudancas.ultima_seq(cursor) or 0, "recarregar": True, "mudancas": []}, 200
+        seq, entradas = lidas
+        itens = []
+        nomes = {}
+        for seq_item, tabela, _, fornecedor_id, material_id in entradas:
+            if tabela != "precos":
+                return {"seq": seq, "recarregar": True, "mudancas": []}, 200
+            par = (fornecedor_id, material_id)
+            if par not in nomes:
+                cursor.execute(SQL_MUDANCAS_CHAVES, par)
+                linha = cursor.fetchone()
+                nomes[par] = (linha[3], linha[1]) if linha else None
+            if nomes[par] is not None:
+                material, estado = nomes[par]
+                itens.append({"seq": seq_item, "material": material, "estado": estado})
+        return {"seq": seq, "recarregar": False, "mudancas": itens}, 200
+    finally:
+        conn.close()
@@ -0,0 +1,225 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from armazenamento import arquivo_privado
+
+# -----------------------------------------------------------------------------
+# Estado do chat guardado no servidor
+# -----------------------------------------------------------------------------
+# O /chat guardava o chat_state inteiro no cookie assinado do Flask, incluindo
+# as listas de categorias/materiais: tudo era serializado, assinado e enviado
+# a cada requisição, crescendo com o catálogo. Agora o cookie leva só um id
+# de sessão e o estado fica num armazém do servidor, como um registro enxuto
+# que referencia o material pelo id do catálogo.
+#
+# Armazéns disponíveis (CHAT_STATE_BACKEND):
+#   memoria - LRU com TTL no próprio processo (um único worker)
+#   sqlite  - arquivo SQLite compartilhado entre os workers do gunicorn (padrão)
+# Qualquer outro (ex.: Redis) só precisa implementar ArmazemSessoes.
+#
+#   CHAT_STATE_TTL_S      validade do estado ocioso (padrão: 86400)
+#   CHAT_STATE_MAX_ITENS  limite do LRU em memória (padrão: 10000)
+#   CHAT_STATE_DB         arquivo do armazém sqlite (padrão: chatbot_sessoes.db na
+#                         pasta privada da instância, ver armazenamento.arquivo_privado)
+
+ESTAGIO_INICIAL = "aguardando_categoria"
+
+
+@dataclass(slots=True)
+class EstadoChat:
+    stage: str = ESTAGIO_INICIAL
+    selected_category: str = None
+    material_id: int = None
+    selected_state: str = None
+    initial_greeting_sent: bool = False
+    last_reply: str = None
+    materiais_cursor: str = None  # página de insumos em exibição (paginacao.py)
+
+    @classmethod
+    def de_dict(cls, chat_state, catalogo):
+        """Converte o dict usado por processar_mensagem_chatbot no registro."""
+        material = chat_state.get("selected_material")
+        return cls(
+            stage=chat_state.get("stage", ESTAGIO_INICIAL),
+            selected_category=chat_state.get("selected_category"),
+            material_id=catalogo.id_por_material.get(material.lower()) if material else None,
+            selected_state=chat_state.get("selected_state"),
+            initial_greeting_sent=bool(chat_state.get("initial_greeting_sent")),
+            last_reply=chat_state.get("last_reply"),
+            materiais_cursor=chat_state.get("materiais_cursor"),
+        )
+
+    def para_dict(self, catalogo):
+        """Dict no formato esperado por processar_mensagem_chatbot."""
+        material = catalogo.material_por_id.get(self.material_id)
+        chat_state = {
+            "stage": self.stage,
+            "selected_category": self.selected_category,
+            "selected_material": material.lower() if material else None,
+            "selected_state": self.selected_state,
+            "initial_greeting_sent": self.initial_greeting_sent,
+        }
+        if self.last_reply is not None:
+            chat_state["last_reply"] = self.last_reply
+        if self.materiais_cursor is not None:
+            chat_state["materiais_cursor"] = self.materiais_cursor
+        return chat_state
+
+    # Serialização compacta (lista JSON posicional) para armazéns externos
+    def para_bytes(self):
+        return json.dumps(
+            [self.stage, self.selected_category, self.material_id, self.selected_state,
+             self.initial_greeting_sent, self.last_reply, self.materiais_cursor],
+            ensure_ascii=False, separators=(",", ":"),
+        ).encode("utf-8")
+
+    @classmethod
+    def de_bytes(cls, dados):
+        return cls(*json.loads(dados))
+
+
+def novo_id_sessao():
+    return uuid.uuid4().hex
+
+
+class ArmazemSessoes(ABC):
+    """
+    Interface dos armazéns de estado do chat. Um armazém que não implementa
+    os três métodos falha ao ser criado, não no meio de uma requisição.
+    """
+
+    @abstractmethod
+    def carregar(self, sid):
+        """EstadoChat da sessão ou None se não existir/expirou."""
+
+    @abstractmethod
+    def salvar(self, sid, estado):
+        """Grava (ou substitui) o estado da sessão."""
+
+    @abstractmethod
+    def remover(self, sid):
+        """Apaga a sessão; não é erro se ela não existir."""
+
+
+class ArmazemMemoria(ArmazemSessoes):
+    def __init__(self, max_itens=10000, ttl_s=86400.0):
+        self.max_itens = max_itens
+        self.ttl_s = ttl_s
+        self._itens = OrderedDict()  # sid -> (expira_em, bytes)
+        self._lock = threading.Lock()
+
+    def carregar(self, sid):
+        agora = time.monotonic()
+        with self._lock:
+            item = self._itens.get(sid)
+            if item is None:
+                return None
+            expira_em, dados = item
+            if expira_em < agora:
+                del self._itens[sid]
+                return None
+            self._itens.move_to_end(sid)
+        # guardamos bytes para o chamador nunca compartilhar o objeto mutável
+        return EstadoChat.de_bytes(dados)
+
+    def salvar(self, sid, estado):
+        dados = estado.para_bytes()
+        with self._lock:
+            self._itens[sid] = (time.monotonic() + self.ttl_s, dados)
+            self._itens.move_to_end(sid)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+
+    def remover(self, sid):
+        with self._lock:
+            self._itens.pop(sid, None)
+
+
+class ArmazemSQLite(ArmazemSessoes):
+    """Arquivo SQLite (WAL) compartilhado entre processos da mesma máquina."""
+
+    LIMPEZA_A_CADA = 1000  # gravações entre limpezas de itens expirados
+
+    def __init__(self, caminho, ttl_s=86400.0):
+        self.caminho = caminho
+        self.ttl_s = ttl_s
+        self._local = threading.local()
+        self._gravacoes = 0
+        conn = self._conexao()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessoes ("
+            " sid TEXT PRIMARY KEY, dados BLOB NOT NULL, expira_em REAL NOT NULL)"
+        )
+        conn.commit()
+
+    def _conexao(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.caminho, timeout=5.0)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def carregar(self, sid):
+        linha = self._conexao().execute(
+            "SELECT dados FROM sessoes WHERE sid = ? AND expira_em >= ?", (sid, time.time())
+        ).fetchone()
+        return EstadoChat.de_bytes(linha[0]) if linha else None
+
+    def salvar(self, sid, estado):
+        conn = self._conexao()
+        with conn:
+            conn.execute(
+                "INSERT INTO sessoes (sid, dados, expira_em) VALUES (?, ?, ?) "
+                "ON CONFLICT(sid) DO UPDATE SET dados = excluded.dados, expira_em = excluded.expira_em",
+                (sid, estado.para_bytes(), time.time() + self.ttl_s),
+            )
+        self._gravacoes += 1
+        if self._gravacoes % self.LIMPEZA_A_CADA == 0:
+            with conn:
+                conn.execute("DELETE FROM sessoes WHERE expira_em < ?", (time.time(),))
+
+    def remover(self, sid):
+        conn = self._conexao()
+        with conn:
+            conn.execute("DELETE FROM sessoes WHERE sid = ?", (sid,))
+
+
+def criar_armazem_do_ambiente():
+    backend = (os.environ.get("CHAT_STATE_BACKEND") or "sqlite").strip().lower()
+    ttl_s = float(os.environ.get("CHAT_STATE_TTL_S") or 86400)
+    if backend == "memoria":
+        return ArmazemMemoria(int(os.environ.get("CHAT_STATE_MAX_ITENS") or 10000), ttl_s)
+    if backend == "sqlite":
+        caminho = os.environ.get("CHAT_STATE_DB") or arquivo_privado("chatbot_sessoes.db")
+        return ArmazemSQLite(caminho, ttl_s)
+    raise ValueError(f"CHAT_STATE_BACKEND desconhecido: {backend!r}")
+
+
+_armazem = None
+_armazem_lock = threading.Lock()
+
+
+def obter_armazem():
+    global _armazem
+    if _armazem is None:
+        with _armazem_lock:
+            if _armazem is None:
+                _armazem = criar_armazem_do_ambiente()
+    return _armazem
+
+
+def configurar_armazem(armazem):
+    """Substitui o armazém padrão (útil para scripts e benchmarks)."""
+    global _armazem
+    _armazem = armazem
+    return armazem
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Os módulos do app ficam em Chat-M/, sem pacote.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Sem a thread de aquecimento ao importar app.py nos testes.
+os.environ.setdefault("AQUECIMENTO", "0")
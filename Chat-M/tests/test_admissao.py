@@ -0,0 +1,113 @@
+import asyncio
+import json
+import sqlite3
+import time
+
+import pytest
+
+import admissao
+import app as app_flask
+import asgi
+
+LOTE = {"itens": [{"material": "cimento", "estado": "sp"}]}
+
+
+@pytest.fixture
+def controle():
+    def configurar(taxa=1000.0, rajada=1000.0, max_concorrencia=8, baldes=None):
+        return admissao.configurar_admissao(admissao.Admissao(
+            admissao.BaldesMemoria() if baldes is None else baldes, taxa=taxa, rajada=rajada,
+            max_concorrencia=max_concorrencia))
+    yield configurar
+    admissao.configurar_admissao(None)
+
+
+@pytest.fixture
+def cliente():
+    return app_flask.app.test_client()
+
+
+def test_sem_ficha_responde_429_com_retry_after(controle, cliente):
+    controle(taxa=0.5, rajada=2)
+    assert cliente.get("/categorias").status_code == 200
+    assert cliente.get("/categorias").status_code == 200
+    resposta = cliente.get("/categorias")
+    assert resposta.status_code == 429
+    assert resposta.headers["Retry-After"] == "2"
+    assert resposta.get_json() == {"error": "too many requests", "retry_after": 2}
+
+
+def test_no_teto_de_concorrencia_responde_503(controle, cliente):
+    atual = controle(max_concorrencia=1)
+    assert atual.admitir(None, "10.0.0.9", "/fornecedores") is None  # ocupa a única vaga
+    resposta = cliente.get("/fornecedores", query_string={"material": "cimento", "estado": "sp"})
+    assert resposta.status_code == 503
+    assert resposta.headers["Retry-After"] == "1"
+    assert cliente.get("/categorias").status_code == 200  # fora de ROTAS_BANCO
+    atual.liberar("/fornecedores")
+    assert cliente.get("/fornecedores", query_string={"material": "cimento", "estado": "sp"}).status_code == 200
+    assert atual.em_andamento == 0
+
+
+def test_resposta_em_streaming_libera_a_vaga_no_fim(controle, cliente):
+    atual = controle(max_concorrencia=1)
+    resposta = cliente.post("/fornecedores/batch?formato=ndjson", json=LOTE, buffered=False)
+    assert resposta.status_code == 200
+    assert resposta.is_streamed
+    assert atual.em_andamento == 1  # o corpo ainda não saiu
+    linhas = [json.loads(linha) for linha in resposta.get_data(as_text=True).splitlines()]
+    resposta.close()
+    assert "totais_por_fornecedor" in linhas[-1]
+    assert atual.em_andamento == 0
+
+
+def test_asgi_streaming_libera_a_vaga(controle):
+    atual = controle(max_concorrencia=1)
+    mensagens = [{"type": "http.request", "body": json.dumps(LOTE).encode(), "more_body": False}]
+    enviadas = []
+
+    async def receive():
+        return mensagens.pop(0)
+
+    async def send(mensagem):
+        enviadas.append((mensagem, atual.em_andamento))
+
+    escopo = {"type": "http", "method": "POST", "path": "/fornecedores/batch",
+              "query_string": b"formato=ndjson", "headers": []}
+    asyncio.run(asgi.app(escopo, receive, send))
+    assert enviadas[0][0]["status"] == 200
+    assert all(vagas == 1 for _, vagas in enviadas)  # ocupada durante todo o envio
+    assert atual.em_andamento == 0
+
+
+def test_armazem_travado_responde_503_rapido(controle, tmp_path):
+    caminho = str(tmp_path / "admissao.db")
+    atual = controle(baldes=admissao.BaldesSQLite(caminho, espera_ms=50))
+    outro = sqlite3.connect(caminho, isolation_level=None)
+    outro.execute("BEGIN IMMEDIATE")  # outro worker segurando a escrita
+    try:
+        inicio = time.perf_counter()
+        recusa = atual.admitir(None, "10.0.0.1", "/chat")
+        assert time.perf_counter() - inicio < 1
+    finally:
+        outro.execute("ROLLBACK")
+        outro.close()
+    assert recusa[1:] == (503, admissao.ESPERA_SOBRECARGA_S)
+    assert atual.em_andamento == 0
+    assert atual.admitir(None, "10.0.0.1", "/chat") is None
+
+
+def test_ip_do_x_forwarded_for_so_com_proxies_confiaveis():
+    assert admissao.endereco_cliente("10.0.0.1", "1.2.3.4", proxies=0) == "10.0.0.1"
+    assert admissao.endereco_cliente("10.0.0.1", "9.9.9.9, 1.2.3.4", proxies=1) == "1.2.3.4"
+    assert admissao.endereco_cliente("10.0.0.1", "9.9.9.9, 1.2.3.4, 10.0.0.2", proxies=2) == "1.2.3.4"
+    assert admissao.endereco_cliente("10.0.0.1", "1.2.3.4", proxies=2) == "10.0.0.1"
+    assert admissao.endereco_cliente("10.0.0.1", None, proxies=1) == "10.0.0.1"
+
+
+def test_clientes_atras_do_proxy_tem_baldes_separados(controle, cliente, monkeypatch):
+    monkeypatch.setattr(admissao, "PROXIES", 1)
+    controle(taxa=0.001, rajada=1)
+    assert cliente.get("/categorias", headers={"X-Forwarded-For": "1.1.1.1"}).status_code == 200
+    assert cliente.get("/categorias", headers={"X-Forwarded-For": "1.1.1.1"}).status_code == 429
+    assert cliente.get("/categorias", headers={"X-Forwarded-For": "2.2.2.2"}).status_code == 200
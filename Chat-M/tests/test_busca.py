@@ -0,0 +1,53 @@
+import pytest
+
+import bot_logica
+import respostas
+from busca import IndiceBusca
+
+NOMES = ("tubo pvc 100mm", "tubo pvc 50mm", "areia lavada")
+
+
+@pytest.fixture
+def busca():
+    return IndiceBusca(NOMES)
+
+
+@pytest.mark.parametrize("texto, esperado", [
+    ("1", ("tubo pvc 100mm", [])),
+    ("3", ("areia lavada", [])),
+    ("0", (None, [])),
+    ("4", (None, [])),
+    ("99", (None, [])),
+    ("-1", (None, [])),   # não pode virar o trecho "1"
+    ("#1", (None, [])),
+    ("areia", ("areia lavada", [])),
+    ("tubo pvc 5", ("tubo pvc 50mm", [])),
+    ("tubo pvc", (None, ["tubo pvc 50mm", "tubo pvc 100mm"])),
+])
+def test_por_numero_ou_nome(busca, texto, esperado):
+    assert bot_logica._por_numero_ou_nome(texto, busca) == esperado
+
+
+def test_aproximado_tolera_erro_de_digitacao(busca):
+    assert busca.escolher("areia lavda") == ("areia lavada", [])
+
+
+def _no_menu():
+    _, estado = bot_logica.processar_mensagem_chatbot("oi", {})
+    return estado
+
+
+@pytest.mark.parametrize("mensagem", ["0", "6", "-1", "#1", "xyz"])
+def test_chat_numero_fora_da_lista(mensagem):
+    resposta, estado = bot_logica.processar_mensagem_chatbot(mensagem, _no_menu())
+    assert resposta == respostas.NAO_ENTENDI_CATEGORIA
+    assert estado["stage"] == "aguardando_escolha_categoria"
+
+
+def test_chat_pergunta_quando_ambiguo():
+    resposta, estado = bot_logica.processar_mensagem_chatbot("t", _no_menu())
+    assert resposta == respostas.resposta_ambigua("t", ["tinta", "tubo pvc"], "da categoria")
+    assert estado["stage"] == "aguardando_escolha_categoria"
+    _, estado = bot_logica.processar_mensagem_chatbot("tubo", estado)
+    assert estado["stage"] == "aguardando_escolha_material"
+    assert estado["selected_category"] == "tubo pvc"
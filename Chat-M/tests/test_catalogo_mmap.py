@@ -0,0 +1,76 @@
+import os
+import shutil
+
+import pytest
+
+import catalogo_mmap
+import indice_precos
+from db_pool import obter_pool
+
+BASE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "base_chatbot2.db")
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    caminho = str(tmp_path / "catalogo.mmap")
+    catalogo_mmap.construir(BASE, caminho)
+    return caminho
+
+
+def _indice_da_base():
+    indice = indice_precos.IndicePrecos()
+    conn = obter_pool().obter()
+    try:
+        indice.sincronizar(conn.cursor())
+    finally:
+        conn.close()
+    return indice
+
+
+def test_construir_e_ler_top(snapshot):
+    mapeado = catalogo_mmap.SnapshotMmap(snapshot)
+    indice = _indice_da_base()
+    assert len(mapeado) == len(indice)
+    chaves = list(indice._por_chave)
+    assert chaves
+    for material, estado in chaves:
+        for limite in (1, 3, None):
+            assert mapeado.top(material, estado, limite) == indice.top(material, estado, limite)
+    material, estado = chaves[0]
+    assert mapeado.top(material.upper(), estado.upper()) == indice.top(material, estado)
+    assert mapeado.top("nao existe", estado) == []
+
+
+@pytest.mark.parametrize("estragar", ["truncar", "corromper"])
+def test_troca_por_arquivo_invalido_mantem_o_anterior(snapshot, tmp_path, estragar):
+    fonte = catalogo_mmap.FonteMmap(snapshot)
+    anterior = fonte.atual()
+    material, estado = next(iter(_indice_da_base()._por_chave))
+    esperado = anterior.top(material, estado)
+
+    novo = str(tmp_path / "novo.mmap")
+    shutil.copy(snapshot, novo)
+    with open(novo, "r+b") as arquivo:
+        if estragar == "truncar":
+            arquivo.truncate(os.path.getsize(novo) // 2)
+        else:
+            arquivo.seek(-16, os.SEEK_END)
+            arquivo.write(b"\xff" * 16)
+    os.replace(novo, snapshot)
+
+    with pytest.raises(catalogo_mmap.ErroSnapshot):
+        catalogo_mmap.SnapshotMmap(snapshot)
+    assert fonte.atual() is anterior
+    assert fonte.atual().top(material, estado) == esperado
+
+    catalogo_mmap.construir(BASE, novo)
+    os.replace(novo, snapshot)
+    assert fonte.atual() is not anterior
+    assert fonte.atual().top(material, estado) == esperado
+
+
+def test_arquivo_invalido_na_inicializacao_falha(tmp_path):
+    caminho = tmp_path / "vazio.mmap"
+    caminho.write_bytes(b"nada")
+    with pytest.raises(catalogo_mmap.ErroSnapshot):
+        catalogo_mmap.FonteMmap(str(caminho)).atual()
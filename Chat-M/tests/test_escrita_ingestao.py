@@ -0,0 +1,85 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+import db_pool
+import escrita_precos
+import ingestao
+
+BASE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "base_chatbot2.db")
+ITEM = {"codigo_fornecedor": "79854", "estado": "São Paulo", "codigo_material": "44464"}
+
+
+def _valor(caminho):
+    conn = sqlite3.connect(caminho)
+    try:
+        return conn.execute(
+            "SELECT p.valor FROM precos p JOIN fornecedores f ON f.id = p.fornecedor_id "
+            "JOIN materiais m ON m.id = p.material_id WHERE f.codigo = ? AND f.estado = ? AND m.codigo = ?",
+            (ITEM["codigo_fornecedor"], ITEM["estado"], ITEM["codigo_material"]),
+        ).fetchone()[0]
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def base(tmp_path, monkeypatch):
+    caminho = str(tmp_path / "base.db")
+    shutil.copy(BASE, caminho)
+    monkeypatch.setenv("INDICE_PRECOS", "0")
+    db_pool.configurar_pool(caminho=caminho, readonly=True)
+    yield caminho
+    db_pool.configurar_pool()
+
+
+def test_gravar_carga_gravar(base, tmp_path):
+    escrita_precos.gravar([dict(ITEM, valor=111.0)])
+    assert not os.path.exists(base + "-wal") or os.path.getsize(base + "-wal") == 0
+
+    planilha = tmp_path / "precos.csv"
+    planilha.write_text("codigo_fornecedor,estado,codigo_material,valor\n"
+                        "94664,São Paulo,44464,97.5\n", encoding="utf-8")
+    assert ingestao.main(["--precos", str(planilha), "--destino", base]) == 0
+    assert _valor(base) == 111.0  # a gravação anterior à carga entrou na base nova
+
+    escrita_precos.gravar([dict(ITEM, valor=222.0)])
+    assert _valor(base) == 222.0
+
+
+def test_gravacao_recusada_durante_a_carga(base):
+    with db_pool.trava_base(base, exclusiva=True):
+        with pytest.raises(escrita_precos.ErroEscrita) as erro:
+            escrita_precos.gravar([dict(ITEM, valor=333.0)])
+    assert erro.value.status == 503
+    escrita_precos.gravar([dict(ITEM, valor=333.0)])
+    assert _valor(base) == 333.0
+
+
+def test_carga_em_caminho_com_caracteres_de_uri(tmp_path):
+    pasta = tmp_path / "lote?1#a%20b"
+    pasta.mkdir()
+    destino = str(pasta / "base.db")
+    shutil.copy(BASE, destino)
+    planilha = tmp_path / "precos.csv"
+    planilha.write_text("codigo_fornecedor,estado,codigo_material,valor\n"
+                        "79854,São Paulo,44464,12.5\n", encoding="utf-8")
+    assert ingestao.main(["--precos", str(planilha), "--destino", destino]) == 0
+    assert _valor(destino) == 12.5
+
+
+@pytest.mark.parametrize("linha, mensagem", [
+    ('{"codigo": "1", "nome": ', "JSON inválido"),
+    ('["1", "Cimento"]', "não é um objeto"),
+])
+def test_jsonl_invalido_indica_a_linha(tmp_path, linha, mensagem):
+    destino = str(tmp_path / "base.db")
+    shutil.copy(BASE, destino)
+    planilha = tmp_path / "materiais.jsonl"
+    planilha.write_text('{"codigo": "X1", "nome": "Areia", "categoria": "Básico"}\n' + linha + "\n",
+                        encoding="utf-8")
+    with pytest.raises(ingestao.ErroIngestao) as erro:
+        ingestao.ingerir(destino, materiais=str(planilha))
+    assert "materiais.jsonl:2: " in str(erro.value) and mensagem in str(erro.value)
+    assert [n for n in os.listdir(tmp_path) if ".novo-" in n] == []
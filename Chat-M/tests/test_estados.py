@@ -0,0 +1,60 @@
+import pytest
+
+import bot_logica
+import respostas
+from estados import MG_BETIM, MG_EXTREMA, ResolvedorEstados
+
+ESTADOS_DB = ("são paulo", "rio de janeiro", "bahia", "minas gerais", "rio grande do sul")
+
+
+@pytest.fixture
+def resolvedor():
+    return ResolvedorEstados(ESTADOS_DB)
+
+
+@pytest.mark.parametrize("mensagem, estado", [
+    ("sp", "são paulo"),
+    ("SÃO PAULO", "são paulo"),
+    ("sao paulo", "são paulo"),
+    ("BA", "bahia"),
+    ("curitiba", "paraná"),            # antes "ba" casava dentro de "curitiba"
+    ("moro em Curitiba", "paraná"),
+    ("MG", "minas gerais"),
+    ("minas", "minas gerais"),
+    ("Minas Gerais", "minas gerais"),
+    ("mg extrema", MG_EXTREMA),        # a cidade vence o apelido genérico
+    ("Betim", MG_BETIM),
+    ("rio grande do sul", "rio grande do sul"),  # o apelido mais longo vence
+    ("rio de janeiro ou sp", "rio de janeiro"),  # no empate, o primeiro citado
+    ("cabana", None),
+    ("obrigado", None),
+])
+def test_resolver(resolvedor, mensagem, estado):
+    assert resolvedor.resolver(mensagem) == estado
+
+
+def test_grafia_da_base_vence_o_mapeamento():
+    assert ResolvedorEstados(("ceara",)).resolver("Ceará") == "ceara"
+
+
+@pytest.mark.parametrize("estados_db, esperado", [
+    ((MG_BETIM, MG_EXTREMA), ("minas gerais", True)),
+    ((MG_BETIM,), (MG_BETIM, False)),
+    ((MG_EXTREMA,), (MG_EXTREMA, False)),
+    (("minas gerais",), ("minas gerais", False)),
+])
+def test_resolver_mg(estados_db, esperado):
+    assert ResolvedorEstados(estados_db).resolver_mg("minas gerais") == esperado
+
+
+def test_chat_pergunta_betim_ou_extrema(monkeypatch):
+    resolvedor = ResolvedorEstados((MG_BETIM, MG_EXTREMA))
+    monkeypatch.setattr(bot_logica, "obter_resolvedor", lambda catalogo: resolvedor)
+    estado = {"stage": "aguardando_estado", "selected_material": "cimento cp-ii 50kg",
+              "initial_greeting_sent": True}
+    resposta, estado = bot_logica.processar_mensagem_chatbot("minas", estado)
+    assert resposta == respostas.PERGUNTA_MG
+    assert estado["stage"] == "aguardando_especificacao_mg"
+    resposta, estado = bot_logica.processar_mensagem_chatbot("nenhuma", estado)
+    assert resposta == respostas.NAO_ENTENDI_MG
+    assert estado["stage"] == "aguardando_especificacao_mg"
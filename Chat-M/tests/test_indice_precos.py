@@ -0,0 +1,102 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+import bot_logica
+import db_pool
+import escrita_precos
+import indice_precos
+
+BASE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "base_chatbot2.db")
+ITEM = {"codigo_fornecedor": "79854", "estado": "São Paulo", "codigo_material": "44464"}
+
+
+def _chaves():
+    conn = sqlite3.connect(BASE)
+    try:
+        return conn.execute(
+            "SELECT DISTINCT m.nome, f.estado FROM precos p JOIN fornecedores f ON f.id = p.fornecedor_id "
+            "JOIN materiais m ON m.id = p.material_id ORDER BY 1, 2").fetchall()
+    finally:
+        conn.close()
+
+
+def _sincronizado(por_chave=None):
+    indice = indice_precos.IndicePrecos(por_chave)
+    with db_pool.obter_pool().obter() as conn:
+        indice.sincronizar(conn.cursor())
+    return indice
+
+
+@pytest.fixture
+def base(tmp_path, monkeypatch):
+    caminho = str(tmp_path / "base.db")
+    shutil.copy(BASE, caminho)
+    monkeypatch.setenv("INDICE_PRECOS", "1")
+    monkeypatch.setattr(indice_precos, "_indice", indice_precos.IndicePrecos(por_chave=2))
+    db_pool.configurar_pool(caminho=caminho, readonly=True)
+    yield caminho
+    db_pool.configurar_pool()
+
+
+@pytest.mark.parametrize("grafia", [str, str.upper, str.title])
+def test_indice_e_sql_normalizam_igual(monkeypatch, grafia):
+    # LOWER() do SQLite deixaria 'SÃO PAULO' como 'sÃo paulo' e não acharia nada.
+    monkeypatch.setenv("INDICE_PRECOS", "1")
+    com_indice = {chave: bot_logica.consultar_fornecedores(None, grafia(chave[0]), grafia(chave[1]), None)
+                  for chave in _chaves()}
+    monkeypatch.setenv("INDICE_PRECOS", "0")
+    for (material, estado), esperado in com_indice.items():
+        assert esperado
+        assert bot_logica.consultar_fornecedores(None, grafia(material), grafia(estado), None) == esperado
+    assert com_indice[("Cimento CP-II 50kg", "São Paulo")] == bot_logica.consultar_fornecedores(
+        None, "CIMENTO CP-II 50KG", "SÃO PAULO", None)
+
+
+def test_memoria_limitada_por_chave():
+    completo, limitado = _sincronizado(), _sincronizado(por_chave=2)
+    assert len(limitado) < len(completo)
+    assert all(len(lista) <= 2 for lista in limitado._por_chave.values())
+    for material, estado in _chaves():
+        for limite in (1, 2, 3, None):
+            assert limitado.top(material, estado, limite) == completo.top(material, estado, limite)
+
+
+def test_gravacao_aplicada_pelo_feed_sem_releitura(base, monkeypatch):
+    escrita_precos.gravar([dict(ITEM, valor=1.0)])  # instala o feed
+    indice = indice_precos.obter_indice()
+    geracao = indice.geracao
+    material, estado = "Cimento CP-II 50kg", "São Paulo"
+    versao = indice.versao_chave(material, estado)
+    outra = indice.versao_chave("Areia Lavada m³", estado)
+
+    def sem_releitura(*args, **kwargs):
+        raise AssertionError("releitura completa sem mudança de estrutura")
+
+    monkeypatch.setattr(indice, "sincronizar", sem_releitura)
+    escrita_precos.gravar([dict(ITEM, valor=0.5)])
+    assert indice_precos.obter_indice() is indice
+    assert indice.geracao == geracao
+    assert indice.versao_chave(material, estado) != versao
+    assert indice.versao_chave("Areia Lavada m³", estado) == outra
+    assert indice.top(material, estado, 1)[0][5] == 0.5
+    assert indice.top(material, estado, None) == indice_precos.ler_fornecedores(None, material, estado, None)
+
+    escrita_precos.gravar([dict(ITEM, remover=True)])
+    assert all(linha[2] != ITEM["codigo_fornecedor"] for linha in indice.top(material, estado, None))
+    assert indice.geracao == geracao
+
+
+def test_mudanca_de_estrutura_rele_tudo(base):
+    indice = indice_precos.obter_indice()
+    escrita_precos.gravar([dict(ITEM, valor=0.5)])  # instala o feed
+    geracao = indice_precos.obter_indice().geracao
+    conn = sqlite3.connect(base)
+    with conn:
+        conn.execute("UPDATE materiais SET nome = 'Cimento Novo' WHERE nome = 'Cimento CP-II 50kg'")
+    conn.close()
+    assert indice_precos.obter_indice().geracao == geracao + 1
+    assert indice.top("Cimento CP-II 50kg", "São Paulo") == []
+    assert indice.top("cimento novo", "são paulo", 1)[0][5] == 0.5
@@ -0,0 +1,57 @@
+import pytest
+
+import indice_precos
+import servicos
+from bot_logica import consultar_fornecedores
+
+ITENS = [
+    {"material": "Cimento CP-II 50kg", "estado": "São Paulo", "n": 2, "quantidade": 3},
+    {"material": "CIMENTO CP-II 50KG", "estado": "SÃO PAULO", "n": 5},  # mesmo par, outro n
+    {"material": "Areia Lavada m³", "estado": "Bahia", "n": 1, "quantidade": 2.5},
+    {"material": "Brita nº1 m³", "estado": "minas gerais"},
+    {"material": "Tinta Acrílica 18L", "estado": "Rio Grande do Sul", "n": 50},
+    {"material": "não existe", "estado": "Bahia"},
+]
+
+
+def _esperado(itens):
+    """Lote montado item a item com a lista completa de preços de cada par."""
+    resultados, totais = [], {}
+    for item in itens:
+        linhas = consultar_fornecedores(None, item["material"], item["estado"], None)
+        quantidade = item.get("quantidade", 1)
+        menores = {}
+        for r in linhas:
+            if r[5] is not None:
+                menores.setdefault((r[2], r[0], r[1]), float(r[5]))
+        for (codigo, nome, estado), preco in menores.items():
+            total = totais.setdefault((codigo, nome, estado), {
+                "fornecedor": nome, "estado": estado, "codigo_fornecedor": codigo,
+                "itens_atendidos": 0, "custo_total": 0.0})
+            total["itens_atendidos"] += 1
+            total["custo_total"] += preco * quantidade
+        resultados.append({
+            "material": item["material"], "estado": item["estado"], "quantidade": quantidade,
+            "resultados": [servicos.linha_para_resultado(r) for r in linhas[:item.get("n", 3)]],
+        })
+    ordenados = sorted(totais.values(), key=lambda t: (-t["itens_atendidos"], t["custo_total"]))
+    for total in ordenados:
+        total["custo_total"] = round(total["custo_total"], 4)
+    return {"resultados": resultados, "totais_por_fornecedor": ordenados}
+
+
+@pytest.mark.parametrize("chaves_por_consulta", [1000, 2])
+def test_lote_igual_a_consulta_item_a_item(monkeypatch, chaves_por_consulta):
+    monkeypatch.setattr(indice_precos, "CHAVES_POR_CONSULTA", chaves_por_consulta)
+    payload, status = servicos.fornecedores_lote({"itens": ITENS})
+    assert status == 200
+    assert payload == _esperado(ITENS)
+    assert payload["resultados"][1]["resultados"]
+    assert payload["resultados"][-1]["resultados"] == []
+
+
+def test_lote_em_ndjson_tem_os_mesmos_objetos():
+    linhas, status = servicos.fornecedores_lote({"itens": ITENS}, streaming=True)
+    assert status == 200
+    *resultados, totais = list(linhas)
+    assert {"resultados": resultados, **totais} == _esperado(ITENS)
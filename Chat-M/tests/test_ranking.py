@@ -0,0 +1,55 @@
+import pytest
+
+import bot_logica
+import cache_consultas
+import ranking
+import respostas
+
+MATERIAL, ESTADO = "cimento cp-ii 50kg", "são paulo"
+
+
+def test_dica_de_regiao_so_com_vizinhos():
+    assert ranking.tem_vizinhos(MATERIAL, ESTADO, ranking.RAIO_CHAT_KM)
+    assert not ranking.tem_vizinhos(MATERIAL, ESTADO, 0)
+    assert not ranking.tem_vizinhos("nao existe", ESTADO, ranking.RAIO_CHAT_KM)
+
+
+@pytest.mark.parametrize("raio_km, com_dica", [(ranking.RAIO_CHAT_KM, True), (0, False)])
+def test_resposta_do_chat_com_e_sem_dica(monkeypatch, raio_km, com_dica):
+    monkeypatch.setattr(ranking, "RAIO_CHAT_KM", raio_km)
+    cache_consultas.consultas.limpar()
+    etapa, texto = bot_logica._responder_fornecedores(MATERIAL, ESTADO)
+    cache_consultas.consultas.limpar()
+    assert etapa == "resultados"
+    assert (respostas.DICA_REGIAO in texto) is com_dica
+    assert texto.endswith(respostas.RODAPE_RESULTADOS)
+
+
+def _consultas(catalogo):
+    materiais = [m for c in catalogo.categorias for m in catalogo.materiais(c)]
+    estados = catalogo.estados + ("paraná", "goiás")
+    saida = []
+    for i, (material, estado) in enumerate((m, e) for m in materiais for e in estados):
+        criterio = sorted(ranking.CRITERIOS)[i % len(ranking.CRITERIOS)]
+        raio = (0, 300, 800, 2000, 5000)[i % 5]
+        saida.append(ranking.melhores(material, estado, (1, 3, 10)[i % 3], raio, criterio))
+    for i, estado in enumerate(catalogo.estados):
+        itens = [(m, (1, 2.5, 10)[j % 3]) for j, m in enumerate(materiais[i % 2:])]
+        criterio = sorted(ranking.CRITERIOS)[i % len(ranking.CRITERIOS)]
+        saida.append(ranking.melhores_cesta(itens, estado, 5, (0, 800, 5000)[i % 3], criterio))
+    return saida
+
+
+def test_numpy_e_python_puro_dao_o_mesmo_ranking(monkeypatch):
+    pytest.importorskip("numpy")
+    from catalogo import obter_catalogo
+
+    catalogo = obter_catalogo()
+    resultados = {}
+    for usar_numpy in (True, False):
+        monkeypatch.setattr(ranking, "USAR_NUMPY", usar_numpy)
+        ranking._tabelas.limpar()  # as colunas são montadas no formato do modo
+        resultados[usar_numpy] = _consultas(catalogo)
+    ranking._tabelas.limpar()
+    assert any(resultados[True])
+    assert resultados[True] == resultados[False]
@@ -0,0 +1,46 @@
+"""
+Replay das conversas gravadas com o bot_logica.py original (commit "baseline",
+antes da tabela de transições e das respostas pré-renderizadas). Cada turno
+tem que sair igual, byte a byte, com uma única diferença deliberada: a
+resposta com fornecedores ganha respostas.DICA_REGIAO antes do rodapé quando
+o insumo tem preço em estado vizinho (ranking.tem_vizinhos).
+"""
+import json
+import os
+
+import pytest
+
+import cache_consultas
+import ranking
+import respostas
+from bot_logica import processar_mensagem_chatbot
+
+ARQUIVO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "transcricoes_baseline.json")
+
+with open(ARQUIVO, encoding="utf-8") as _arquivo:
+    CONVERSAS = json.load(_arquivo)
+
+
+def _esperada(original, estado):
+    if not original.startswith(respostas.CABECALHO_RESULTADOS):
+        return original
+    if not ranking.tem_vizinhos(estado["selected_material"], estado["selected_state"], ranking.RAIO_CHAT_KM):
+        return original
+    corpo = original[:-len(respostas.RODAPE_RESULTADOS)]
+    return corpo + respostas.DICA_REGIAO + respostas.RODAPE_RESULTADOS
+
+
+@pytest.mark.parametrize("indice", ["1", "0"])
+def test_conversas_iguais_as_da_baseline(monkeypatch, indice):
+    monkeypatch.setenv("INDICE_PRECOS", indice)
+    cache_consultas.consultas.limpar()
+    com_dica = 0
+    for turnos in CONVERSAS:
+        estado = {}
+        for mensagem, original in turnos:
+            resposta, estado = processar_mensagem_chatbot(mensagem, estado)
+            esperada = _esperada(original, estado)
+            assert resposta == esperada, (mensagem, turnos)
+            com_dica += esperada != original
+    cache_consultas.consultas.limpar()
+    assert com_dica  # a diferença existe nessa base e está fixada aqui